@@ -40,6 +40,8 @@ def initialize():
                 self.window = None
                 try:
                     self.config = AICardCreatorConfig()
+                    # Write any debounced config changes before the profile goes away
+                    gui_hooks.profile_will_close.append(self.config.flush)
                     self.setup_menu()
                 except Exception as e:
                     print(f"AI Card Creator: Init error: {str(e)}")
@@ -0,0 +1,17 @@
+"""
+Command-line entry point: `python <addon folder> words.txt --jsonl cards.jsonl`.
+
+Anki never runs this file. The addon's __init__.py needs aqt, so the folder is
+loaded as a package under a neutral name without executing __init__.py, and
+batch.main() runs with the aqt-free modules only.
+"""
+import importlib
+import os
+import sys
+import types
+
+if __name__ == "__main__":
+    package = types.ModuleType("ai_card_creator")
+    package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules["ai_card_creator"] = package
+    sys.exit(importlib.import_module("ai_card_creator.batch").main())
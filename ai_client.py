@@ -1,188 +1,918 @@
 import json
 import requests
-import re
-from typing import Dict, Any, Optional, List, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, List, Tuple, Callable
+from .streaming import iter_sse_data, IncrementalJSONParser
+from .http_session import ConnectionStats, create_session
+from .retry import RetryPolicy, RetryBudgetExhausted, TransientAPIError, RETRYABLE_STATUS_CODES, parse_retry_after
+from .instrumentation import RunMetrics, logger
+from .tokenizer import iter_words
+from .hedging import HedgePolicy, LatencyTracker, run_hedged
+from .concurrency import AdaptiveLimiter
+from .card_schema import CardSchema, JSON_OK, JSON_TRUNCATED, repair_json
+from .prompting import TokenBudget, WORD_MESSAGE, build_messages
+from .kanji_memo import DEFAULT_KANJI_FIELD, KanjiMemo, card_text
+from .dictionary import DEFAULT_DICTIONARY_FIELDS
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_STREAM_IDLE_TIMEOUT = 15
+DEFAULT_BATCH_MAX_TOKENS = 8000
+DEFAULT_CARD_MAX_TOKENS = 2000
+DEFAULT_TOKENS_PER_CARD = 800
+
+FAILED_MESSAGE = "Failed to generate content"
+CANCELLED_MESSAGE = "취소됨"
+
+BATCH_INSTRUCTION = """
+
+📦 여러 단어 처리
+이번 요청에서는 다음 단어들을 각각 처리한다: {words}
+위 규칙에 따라 단어마다 하나의 카드 JSON 객체를 만들고,
+입력 단어를 그대로 키로, 해당 카드 객체를 값으로 하는 하나의 JSON 객체로만 응답한다.
+모든 단어를 빠짐없이 포함해야 한다."""
+
+MISSING_FIELDS_INSTRUCTION = """
+
+🧩 누락된 필드만 작성
+이전 응답에서 다음 필드가 빠졌다: {fields}
+위 규칙에 따라 이 필드들만 채운 하나의 JSON 객체로 응답한다. 다른 필드는 포함하지 않는다."""
+
+KNOWN_FIELDS_INSTRUCTION = """
+
+✅ 미리 채워진 필드
+다음 필드는 이미 준비되어 있으므로 작성하지 않는다: {fields}"""
+
+KNOWN_FIELDS_BATCH_INSTRUCTION = """
+
+✅ 미리 채워진 필드
+단어별로 다음 필드는 이미 준비되어 있으므로 작성하지 않는다: {fields}"""
 
 class AIClient:
-    def __init__(self, config):
+    def __init__(self, config, cache=None, kanji_memo=None, dictionary=None):
         self.config = config
+        self.cache = cache
+        # Per-kanji readings for assembling the 한자 field locally, see kanji_memo.py
+        self.kanji_memo = kanji_memo
+        # Offline dictionary for readings, English glosses and parts of speech, see dictionary.py
+        self.dictionary = dictionary
+        self.connection_stats = ConnectionStats()
+        # Number of API attempts per word in the current run (retries included), see start_run()
+        self.attempt_counts: Dict[str, int] = {}
+        self._attempt_lock = threading.Lock()
+        # Stage timings and token usage of the current run, see start_run()
+        self.metrics = RunMetrics.from_config(config)
+        # Words currently being generated by worker threads
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        # Per worker thread: cancel event of the run the thread is working for
+        self._local = threading.local()
+        self._session = None
+        self._session_size = 0
+        self._session_lock = threading.Lock()
+        # Recent request latencies per number of cards requested, used to time hedged requests
+        self.latency = LatencyTracker()
+        self._hedge_pool = None
+        self._hedge_pool_size = 0
+        # Requests in flight are gated by the limiter; it is rebuilt when its settings change
+        self._limiter = None
+        self._limiter_settings = None
+        self._token_budget = None
+        self._token_budget_settings = None
+        
+    @property
+    def limiter(self) -> AdaptiveLimiter:
+        """Concurrency limiter, kept across runs so the learned limit carries over"""
+        settings = (self.get_max_concurrent_requests(), self.config.get("concurrency_max"),
+                    self.config.get("adaptive_concurrency", True), self.config.get("model"))
+        with self._session_lock:
+            if self._limiter is None or self._limiter_settings != settings:
+                self._limiter = AdaptiveLimiter.from_config(self.config)
+                self._limiter.on_change = self._on_limit_change
+                self._limiter_settings = settings
+            return self._limiter
+    
+    @property
+    def token_budget(self) -> TokenBudget:
+        """Completion sizes seen for the current model and prompt, used to set max_tokens"""
+        settings = (self.config.get("model"), self.config.get("prompt_template"))
+        with self._session_lock:
+            if self._token_budget is None or self._token_budget_settings != settings:
+                self._token_budget = TokenBudget(DEFAULT_CARD_MAX_TOKENS)
+                self._token_budget_settings = settings
+            return self._token_budget
+    
+    def _on_limit_change(self, limit: int, reason: str):
+        logger.debug(f"Concurrency limit {limit} ({reason})")
+        self.metrics.record_concurrency(limit, reason)
+    
+    @property
+    def session(self) -> requests.Session:
+        """Long-lived keep-alive session, resized when the concurrency ceiling changes"""
+        size = self.limiter.ceiling
+        with self._session_lock:
+            if self._session is None or self._session_size != size:
+                if self._session is not None:
+                    self._session.close()
+                self._session = create_session(size, self.connection_stats)
+                self._session_size = size
+            return self._session
+    
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._hedge_pool is not None:
+                self._hedge_pool.shutdown(wait=False, cancel_futures=True)
+                self._hedge_pool = None
+    
+    @property
+    def hedge_pool(self) -> ThreadPoolExecutor:
+        """Threads for hedged requests: a primary and a hedge per concurrent request"""
+        size = 2 * self.limiter.ceiling
+        with self._session_lock:
+            if self._hedge_pool is None or self._hedge_pool_size != size:
+                if self._hedge_pool is not None:
+                    self._hedge_pool.shutdown(wait=False)
+                self._hedge_pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ai-card-creator-hedge")
+                self._hedge_pool_size = size
+            return self._hedge_pool
+    
+    def warm_up(self):
+        """Open a connection to the API host ahead of the first generation request"""
+        try:
+            self.session.head(self.get_api_base_url(), timeout=5)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Connection warm-up failed: {str(e)}")
+    
+    def start_run(self) -> RunMetrics:
+        """Begin collecting timings, token usage and attempt counts for a new run"""
+        with self._attempt_lock:
+            self.attempt_counts = {}
+        self.metrics = RunMetrics.from_config(self.config)
+        self.metrics.record_concurrency(self.limiter.limit, "start")
+        return self.metrics
+    
+    def is_cancelled(self) -> bool:
+        """
+        True if the run the current worker thread belongs to has been cancelled,
+        or if the thread's request lost a hedging race
+        """
+        cancel_event = getattr(self._local, "cancel_event", None)
+        if cancel_event is not None and cancel_event.is_set():
+            return True
+        lost = getattr(self._local, "lost", None)
+        return lost is not None and lost.is_set()
+    
+    def get_api_base_url(self) -> str:
+        return self.config.get("api_base_url", "https://openrouter.ai/api/v1").rstrip("/")
         
     def parse_words(self, input_text: str) -> List[str]:
         """
         Parse input text to extract individual words based on delimiters:
         - Newline (\n)
-        - Comma (,)
-        - Space ( ) - but not spaces within words
-        - Middle dot (・)
-        """
-        # First split by newlines
-        lines = input_text.strip().split('\n')
-        
-        words = []
-        for line in lines:
-            # Split by comma and middle dot
-            parts = re.split(r'[,、・]', line)
-            for part in parts:
-                # For space splitting, we need to be careful about compound words
-                # Simple approach: if a part contains only Japanese characters and spaces,
-                # treat spaces as delimiters. Otherwise, keep as is.
-                part = part.strip()
-                if part:
-                    # Check if it's likely multiple words separated by spaces
-                    if ' ' in part and all(ord(c) > 127 or c == ' ' for c in part):
-                        # Split by spaces for Japanese-only text
-                        subparts = part.split()
-                        words.extend(subparts)
-                    else:
-                        words.append(part)
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_words = []
-        for word in words:
-            if word and word not in seen:
-                seen.add(word)
-                unique_words.append(word)
-                
-        return unique_words
+        - Comma (, ，), ideographic comma (、) and semicolon (; ；)
+        - Middle dot (・ ･)
+        - Space (half-width or U+3000) - but not between English words, so phrases stay intact
+        Duplicates are dropped, input order is kept. See tokenizer.iter_words.
+        """
+        with self.metrics.span("parse"):
+            return list(iter_words(input_text))
         
-    def generate_card_fields(self, word: str) -> Optional[Dict[str, Any]]:
+    def generate_card_fields(self, word: str,
+                             on_field: Optional[Callable[[str, Any], None]] = None,
+                             use_cache: bool = True) -> Optional[Dict[str, Any]]:
         """
         Generate card fields for a given word using OpenRouter API
+        The response cache is consulted first unless use_cache is False.
+        In streaming mode on_field(key, value) is called as soon as each field is complete.
+        The response is repaired and coerced to the note type's schema locally
+        (see card_schema.py); fields it still lacks are requested on their own.
         Returns a dictionary with field names as keys and content as values
         """
-        print(f"AI Card Creator: Generating fields for word: {word}")
+        logger.debug(f"Generating fields for word: {word}")
+        
+        prompt_template = self.config.get("prompt_template", "")
+        model = self.config.get("model", "google/gemini-2.5-flash")
+        # Read once - the window may close and unset the cache while this runs
+        cache = self.cache
+        
+        if cache and use_cache:
+            cached = cache.get(word, model, prompt_template)
+            if cached is not None:
+                logger.debug(f"Cache hit for word: {word}")
+                return cached
+        
+        if self.is_cancelled():
+            return None
         
         api_key = self.config.get("api_key", "")
         if not api_key:
-            print("AI Card Creator: No API key configured")
+            logger.warning("No API key configured")
             return None
             
         try:
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://ankiweb.net",
-                "X-Title": "Anki AI Card Creator"
-            }
+            schema = CardSchema.from_config(self.config)
+            known = self._known_fields(word, schema)
+            prompt = WORD_MESSAGE.format(word=word)
+            if known:
+                prompt += KNOWN_FIELDS_INSTRUCTION.format(fields=json.dumps(list(known), ensure_ascii=False))
+            content = self._request_with_retry(word, lambda: self._hedged_completion(prompt, 1, on_field))
+            if content is None:
+                return None
+            logger.debug(f"Content received (first 200 chars): {content[:200]}...")
             
-            prompt = self.config.get("prompt_template", "").format(word=word)
-            model = self.config.get("model", "google/gemini-2.5-flash")
-            api_url = f"{self.config.get('api_base_url', 'https://openrouter.ai/api/v1')}/chat/completions"
-            
-            print(f"AI Card Creator: Using model: {model}")
-            print(f"AI Card Creator: API URL: {api_url}")
-            
-            data = {
-                "model": model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant that generates Anki card content. Always respond with valid JSON only, no additional text."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.7,
-                "max_tokens": 2000
-            }
+            with self.metrics.span("json"):
+                fields_data, status = self._parse_card(content, schema)
+            if fields_data is None:
+                logger.warning(f"Invalid response format for {word} - no JSON object found")
+                logger.debug(f"Response content: {content[:200]}...")
+                return None
+            self._apply_known_fields(fields_data, known)
+            
+            missing = schema.missing(fields_data)
+            if status == JSON_TRUNCATED and not schema.field_types:
+                # Without a schema there is no telling what the cut-off part held
+                logger.warning(f"Response for {word} was cut off")
+                return None
+            if missing:
+                logger.info(f"Response for {word} {'was cut off' if status == JSON_TRUNCATED else 'is incomplete'}, "
+                            f"requesting only {missing}")
+                fields_data.update(self._request_missing_fields(word, prompt, missing, schema))
+                missing = schema.missing(fields_data)
+                if missing:
+                    logger.warning(f"Still missing fields for {word}: {missing}")
+                    return None
             
-            print(f"AI Card Creator: Making API request...")
-            response = requests.post(api_url, headers=headers, json=data, timeout=30)
+            self._learn_kanji(word, fields_data, known, schema)
+            if cache:
+                cache.put(word, model, prompt_template, fields_data)
+            return fields_data
+                
+        except RetryBudgetExhausted as e:
+            logger.warning(f"{str(e)}")
+            return None
+        except Exception as e:
+            logger.exception(f"Unexpected error: {str(e)}")
+            return None
+    
+    def generate_word(self, word: str, use_cache: bool = True,
+                      cancel_event: Optional[threading.Event] = None) -> Optional[Dict[str, Any]]:
+        """Generate one word outside a run (e.g. speculatively); setting cancel_event abandons it"""
+        return self._generate_batch_or_single([word], [None], use_cache, cancel_event)[0]
+    
+    def is_cached(self, word: str) -> bool:
+        """Whether the response cache already holds the word for the current model and prompt"""
+        cache = self.cache
+        if not cache:
+            return False
+        return cache.contains(word, self.config.get("model", "google/gemini-2.5-flash"),
+                                   self.config.get("prompt_template", ""))
+    
+    def generate_batch_fields(self, words: List[str], use_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        Generate card fields for several words with a single request.
+        Cached words are not sent. Returns a dictionary of word -> fields_data that
+        only contains the words the model answered correctly; callers should fall
+        back to generate_card_fields for anything missing.
+        """
+        prompt_template = self.config.get("prompt_template", "")
+        model = self.config.get("model", "google/gemini-2.5-flash")
+        
+        cache = self.cache
+        found: Dict[str, Dict[str, Any]] = {}
+        pending = []
+        for word in words:
+            cached = cache.get(word, model, prompt_template) if cache and use_cache else None
+            if cached is not None:
+                found[word] = cached
+            else:
+                pending.append(word)
+        
+        if not pending or not self.config.get("api_key", "") or self.is_cancelled():
+            return found
+        
+        logger.debug(f"Generating fields for batch of {len(pending)} words")
+        
+        try:
+            schema = CardSchema.from_config(self.config)
+            known = {word: self._known_fields(word, schema) for word in pending}
+            prompt = WORD_MESSAGE.format(word=", ".join(pending))
+            prompt += BATCH_INSTRUCTION.format(words=json.dumps(pending, ensure_ascii=False))
+            known_by_word = {word: list(fields) for word, fields in known.items() if fields}
+            if known_by_word:
+                prompt += KNOWN_FIELDS_BATCH_INSTRUCTION.format(
+                    fields=json.dumps(known_by_word, ensure_ascii=False))
+            content = self._request_with_retry(
+                ", ".join(pending), lambda: self._hedged_completion(prompt, len(pending)),
+                count_for=pending
+            )
+            if content is None:
+                return found
+            
+            with self.metrics.span("json"):
+                parsed, status = repair_json(content)
+                if status != JSON_OK:
+                    self.metrics.record_json_repair()
+                matched = self._match_batch_response(pending, parsed)
+            if status == JSON_TRUNCATED:
+                logger.info(f"Batch response was cut off after {len(matched)} of {len(pending)} words")
+            
+            for word, fields_data in matched.items():
+                fields_data = schema.normalize(fields_data)
+                self._apply_known_fields(fields_data, known[word])
+                missing = schema.missing(fields_data)
+                if missing:
+                    logger.info(f"Batch card for {word} lacks {missing}, requesting only those")
+                    fields_data.update(self._request_missing_fields(
+                        word, WORD_MESSAGE.format(word=word), missing, schema))
+                    if schema.missing(fields_data):
+                        continue
+                self._learn_kanji(word, fields_data, known[word], schema)
+                found[word] = fields_data
+                if cache:
+                    cache.put(word, model, prompt_template, fields_data)
+                    
+        except RetryBudgetExhausted as e:
+            logger.warning(f"Batch failed - {str(e)}")
+        except Exception as e:
+            logger.exception(f"Unexpected batch error: {str(e)}")
+            
+        missing = [word for word in pending if word not in found]
+        if missing:
+            logger.info(f"Batch response missing {len(missing)} words: {missing}")
+        return found
+    
+    def _parse_card(self, content: str, schema: CardSchema) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        Repair and normalize one card response. Returns (fields_data, status) with
+        a card_schema JSON_* status; fields_data is None if the response holds no object.
+        """
+        parsed, status = repair_json(content)
+        fields_data = schema.unwrap(parsed)
+        if fields_data is None:
+            return None, status
+        if status != JSON_OK or fields_data is not parsed:
+            self.metrics.record_json_repair()
+        return schema.normalize(fields_data), status
+    
+    def _known_fields(self, word: str, schema: CardSchema) -> Dict[str, str]:
+        """
+        Schema fields filled locally instead of generated: reading, English and
+        part of speech from the dictionary, 한자 from the kanji memo
+        """
+        known = {}
+        # Read once - the window may swap the dictionary while this runs
+        dictionary = self.dictionary
+        if dictionary is not None:
+            fields = self.config.get("dictionary_fields", DEFAULT_DICTIONARY_FIELDS)
+            known.update(dictionary.prefill(
+                word, {field: kind for field, kind in fields.items() if field in schema.field_types}))
+        kanji_memo = self.kanji_memo
+        kanji_field = self._kanji_field(schema, kanji_memo)
+        if kanji_field:
+            kanji = kanji_memo.compose(word)
+            if kanji is not None:
+                known[kanji_field] = kanji
+        return known
+    
+    def _apply_known_fields(self, fields_data: Dict[str, Any], known: Dict[str, str]):
+        """Put the locally filled fields into a parsed response (replacing whatever the model wrote)"""
+        if not known:
+            return
+        fields_data.update(known)
+        kanji_field = self.config.get("kanji_memo_field", DEFAULT_KANJI_FIELD)
+        if kanji_field in known:
+            self.metrics.record_kanji_composed()
+        if set(known) - {kanji_field}:
+            self.metrics.record_dictionary_prefill()
+    
+    def _learn_kanji(self, word: str, fields_data: Dict[str, Any], known: Dict[str, str], schema: CardSchema):
+        """Feed a generated 한자 field to the kanji memo"""
+        kanji_memo = self.kanji_memo
+        kanji_field = self._kanji_field(schema, kanji_memo)
+        if kanji_field and kanji_field not in known:
+            kanji_memo.learn(card_text(word, fields_data), fields_data.get(kanji_field))
+    
+    def _kanji_field(self, schema: CardSchema, kanji_memo: Optional[KanjiMemo]) -> Optional[str]:
+        """The schema's 한자 field if kanji_memo can fill it, else None"""
+        field = self.config.get("kanji_memo_field", DEFAULT_KANJI_FIELD)
+        if kanji_memo is None or field not in schema.field_types:
+            return None
+        return field
+    
+    def _request_missing_fields(self, word: str, prompt: str, missing: List[str],
+                                schema: CardSchema) -> Dict[str, Any]:
+        """Ask for just the given fields of a card; returns those the model delivered"""
+        if self.is_cancelled():
+            return {}
+        self.metrics.record_field_request()
+        prompt += MISSING_FIELDS_INSTRUCTION.format(fields=json.dumps(missing, ensure_ascii=False))
+        try:
+            content = self._request_with_retry(word, lambda: self._hedged_completion(prompt, 0))
+        except RetryBudgetExhausted as e:
+            logger.warning(f"{str(e)}")
+            return {}
+        if content is None:
+            return {}
+        with self.metrics.span("json"):
+            fields_data, _ = self._parse_card(content, schema)
+        if not fields_data:
+            return {}
+        return {field: fields_data[field] for field in missing if field in fields_data}
+    
+    def _match_batch_response(self, words: List[str], parsed: Any) -> Dict[str, Dict[str, Any]]:
+        """
+        Map a batch response back to the requested words.
+        Accepts an object keyed by word, an array of card objects, or either of
+        those wrapped in a single top-level key (e.g. {"cards": [...]}).
+        """
+        if isinstance(parsed, dict) and len(parsed) == 1:
+            inner = next(iter(parsed.values()))
+            if isinstance(inner, list) or (isinstance(inner, dict) and not set(inner) & set(words)
+                                           and all(isinstance(v, dict) for v in inner.values())):
+                parsed = inner
+        
+        matched: Dict[str, Dict[str, Any]] = {}
+        if isinstance(parsed, dict):
+            for word in words:
+                fields_data = parsed.get(word)
+                if isinstance(fields_data, dict):
+                    matched[word] = fields_data
+        elif isinstance(parsed, list):
+            cards = [card for card in parsed if isinstance(card, dict)]
+            by_word = {str(card.get("단어", card.get("word", ""))).strip(): card for card in cards}
+            for word in words:
+                if word in by_word:
+                    matched[word] = by_word[word]
+            # Without a usable word field, trust positions only if the counts line up
+            if not matched and len(cards) == len(words):
+                matched = dict(zip(words, cards))
+        return matched
+    
+    def _request_with_retry(self, label: str, request: Callable[[], Optional[str]],
+                            count_for: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Run a request under the configured retry policy, counting attempts for
+        each word in count_for (defaults to the label itself).
+        """
+        words = count_for if count_for is not None else [label]
+        
+        def on_attempt(attempt):
+            # Worker, hedge and speculative threads count concurrently
+            with self._attempt_lock:
+                for word in words:
+                    self.attempt_counts[word] = self.attempt_counts.get(word, 0) + 1
+        
+        return RetryPolicy.from_config(self.config).run(request, label=label, on_attempt=on_attempt,
+                                                        cancelled=self.is_cancelled)
+    
+    def _hedged_completion(self, prompt: str, cards: int,
+                           on_field: Optional[Callable[[str, Any], None]] = None) -> Optional[str]:
+        """
+        _request_completion with hedging: if no answer arrives within the configured
+        percentile of recent latency, a duplicate is sent (to fallback_model if set)
+        and the first answer wins. Hedges are capped by hedge_max_extra_ratio per run.
+        """
+        policy = HedgePolicy.from_config(self.config)
+        metrics = self.metrics
+        metrics.record_request()
+        if not policy.enabled or policy.max_extra_ratio <= 0:
+            return self._timed_completion(prompt, cards, on_field)
+        
+        cancel_event = getattr(self._local, "cancel_event", None)
+        # One limiter for the primary and its hedge, even if settings change meanwhile.
+        # Hold the primary's slot before the hedge delay starts, so waiting for
+        # the concurrency limiter doesn't count as a slow answer
+        limiter = self.limiter
+        if not self._acquire_slot(limiter):
+            return None
+        
+        def attempt(lost, model=None, slot_held=False):
+            # Runs on a hedge pool thread - carry over the worker's cancel event
+            self._local.cancel_event = cancel_event
+            self._local.lost = lost
+            try:
+                return self._timed_completion(prompt, cards, on_field, model, slot_held, limiter)
+            finally:
+                self._local.cancel_event = None
+                self._local.lost = None
+        
+        def may_hedge():
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            if not metrics.reserve_hedge(policy.max_extra_ratio):
+                return False
+            logger.info(f"No answer after {delay:.1f} s, sending a hedged request"
+                        + (f" to {policy.fallback_model}" if policy.fallback_model else ""))
+            return True
+        
+        delay = policy.delay(self.latency, cards)
+        content, hedge_won = run_hedged(lambda lost: attempt(lost, slot_held=True),
+                                        lambda lost: attempt(lost, policy.fallback_model or None),
+                                        delay, self.hedge_pool, may_hedge)
+        if hedge_won:
+            metrics.record_hedge_win()
+            logger.info("Hedged request answered first")
+        return content
+    
+    def _timed_completion(self, prompt: str, cards: int,
+                          on_field: Optional[Callable[[str, Any], None]] = None,
+                          model: Optional[str] = None, slot_held: bool = False,
+                          limiter: Optional[AdaptiveLimiter] = None) -> Optional[str]:
+        """
+        _request_completion under the concurrency limiter (slot_held: the caller
+        already acquired the slot from limiter; it is released here either way).
+        Latencies of answered requests feed the hedging tracker and the limiter;
+        rate limits, server errors and timeouts make the limiter back off.
+        The same limiter object is used throughout, so a limiter rebuilt after a
+        settings change never sees a release for a slot it didn't grant.
+        """
+        if limiter is None:
+            limiter = self.limiter
+        if not slot_held and not self._acquire_slot(limiter):
+            return None
+        start = time.perf_counter()
+        try:
+            content = self._request_completion(prompt, cards, on_field, model)
+        except TransientAPIError as e:
+            limiter.on_overload(str(e.status_code or "error"))
+            raise
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError):
+            # A stalled stream surfaces as ConnectionError: requests re-raises the read timeout
+            limiter.on_overload("timeout")
+            raise
+        finally:
+            limiter.release()
+        if content is not None:
+            latency = time.perf_counter() - start
+            self.latency.record(cards, latency)
+            limiter.on_success(latency)
+        return content
+    
+    def _acquire_slot(self, limiter: AdaptiveLimiter) -> bool:
+        """Wait for a slot of limiter; False if the run was cancelled meanwhile"""
+        waiting = time.perf_counter()
+        acquired = limiter.acquire(self.is_cancelled)
+        self.metrics.add_time("queue", time.perf_counter() - waiting)
+        return acquired
+    
+    def _request_completion(self, prompt: str, cards: int,
+                            on_field: Optional[Callable[[str, Any], None]] = None,
+                            model: Optional[str] = None) -> Optional[str]:
+        """
+        Send one chat completion request and return the message content.
+        prompt is the word-specific user message, sent after the shared prompt
+        template (see prompting.build_messages). cards is the number of cards
+        requested, which sets max_tokens (0 for a follow-up for missing fields).
+        model overrides the configured model (used for fallback hedges).
+        Returns None for API-level failures. Rate limits, server errors and network
+        errors are raised (TransientAPIError / requests exceptions) so they can be retried.
+        """
+        api_key = self.config.get("api_key", "")
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://ankiweb.net",
+            "X-Title": "Anki AI Card Creator"
+        }
+        
+        model = model or self.config.get("model", "google/gemini-2.5-flash")
+        api_url = f"{self.get_api_base_url()}/chat/completions"
+        
+        logger.debug(f"Using model: {model}")
+        logger.debug(f"API URL: {api_url}")
+        
+        data = {
+            "model": model,
+            "messages": build_messages(self.config.get("prompt_template", ""), prompt, model,
+                                       cache_control=self.config.get("prompt_caching", True)),
+            "response_format": {"type": "json_object"},
+            "temperature": 0.7,
+            "max_tokens": self.get_max_tokens(cards),
+            # Ask OpenRouter to report token counts and cost with the response
+            "usage": {"include": True}
+        }
+        
+        if self.config.get("stream_responses", True):
+            return self._stream_completion(api_url, headers, data, cards, on_field)
+        
+        logger.debug("Making API request...")
+        self.connection_stats.begin_request()
+        with self.metrics.span("network"):
+            response = self.session.post(api_url, headers=headers, json=data, timeout=30)
+        self._log_connection_setup()
+        
+        logger.debug(f"API response status: {response.status_code}")
+        
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise TransientAPIError(f"API Error {response.status_code}", response.status_code,
+                                    parse_retry_after(response.headers))
+        if response.status_code != 200:
+            error_msg = f"API Error {response.status_code}: {response.text}"
+            logger.error(f"{error_msg}")
+            return None
             
-            print(f"AI Card Creator: API response status: {response.status_code}")
+        result = response.json()
+        logger.debug("API response received, parsing...")
+        self.metrics.record_usage(result.get("usage"))
+        
+        if "choices" not in result or len(result["choices"]) == 0:
+            logger.warning(f"No choices in response: {result}")
+            return None
+        
+        choice = result["choices"][0]
+        self._record_completion_size(result.get("usage"), choice.get("finish_reason"), cards)
+        return choice["message"]["content"]
+    
+    def _record_completion_size(self, usage: Optional[Dict[str, Any]], finish_reason: Optional[str], cards: int):
+        """Feed the completion size of an answered card request to the token budget"""
+        if cards <= 0 or not isinstance(usage, dict) or not usage.get("completion_tokens"):
+            return
+        self.token_budget.record(usage["completion_tokens"] / cards, truncated=finish_reason == "length")
+        if finish_reason == "length":
+            logger.info(f"Response hit max_tokens, raising the budget (now {self.get_max_tokens(1)} per card)")
+    
+    def _stream_completion(self, api_url: str, headers: Dict[str, str], data: Dict[str, Any], cards: int,
+                           on_field: Optional[Callable[[str, Any], None]] = None) -> Optional[str]:
+        """
+        Request a streamed completion and return the full message content.
+        The read timeout applies between chunks, so a stalled stream is aborted after
+        `stream_idle_timeout` seconds of silence instead of a fixed wall-clock limit.
+        """
+        idle_timeout = float(self.config.get("stream_idle_timeout", DEFAULT_STREAM_IDLE_TIMEOUT))
+        stream_data = dict(data, stream=True)
+        
+        logger.debug("Making streaming API request...")
+        self.connection_stats.begin_request()
+        with self.metrics.span("network"), \
+                self.session.post(api_url, headers=headers, json=stream_data, stream=True,
+                                  timeout=(10, idle_timeout)) as response:
+            self._log_connection_setup()
+            logger.debug(f"API response status: {response.status_code}")
             
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                raise TransientAPIError(f"API Error {response.status_code}", response.status_code,
+                                        parse_retry_after(response.headers))
             if response.status_code != 200:
-                error_msg = f"API Error {response.status_code}: {response.text}"
-                print(f"AI Card Creator: {error_msg}")
+                logger.error(f"API Error {response.status_code}: {response.text}")
                 return None
-                
-            result = response.json()
-            print(f"AI Card Creator: API response received, parsing...")
             
-            if "choices" not in result or len(result["choices"]) == 0:
-                print(f"AI Card Creator: No choices in response: {result}")
-                return None
+            parser = IncrementalJSONParser()
+            parts = []
+            usage = None
+            finish_reason = None
+            for payload in iter_sse_data(response):
+                if payload == "[DONE]":
+                    break
+                if self.is_cancelled():
+                    logger.debug("Stream cancelled")
+                    return None
+                try:
+                    event = json.loads(payload)
+                except json.JSONDecodeError:
+                    logger.debug(f"Skipping malformed stream event: {payload[:200]}")
+                    continue
                 
-            content = result["choices"][0]["message"]["content"]
-            print(f"AI Card Creator: Content received (first 200 chars): {content[:200]}...")
-            
-            try:
-                fields_data = json.loads(content)
-                # Validate that it's a dictionary
-                if not isinstance(fields_data, dict):
-                    print(f"AI Card Creator: Invalid response format - expected dict, got {type(fields_data).__name__}")
-                    print(f"AI Card Creator: Response content: {content[:200]}...")
+                if "error" in event:
+                    logger.error(f"Stream error: {event['error']}")
                     return None
-                return fields_data
-            except json.JSONDecodeError as e:
-                print(f"AI Card Creator: JSON decode error: {str(e)}")
-                print(f"AI Card Creator: Content: {content[:200]}...")
-                return None
+                # The usage block arrives with the last chunk
+                if event.get("usage"):
+                    usage = event["usage"]
+                    self.metrics.record_usage(usage)
                 
-        except requests.exceptions.Timeout:
-            print("AI Card Creator: Request timeout")
-            return None
-        except requests.exceptions.ConnectionError:
-            print("AI Card Creator: Connection error")
-            return None
-        except Exception as e:
-            print(f"AI Card Creator: Unexpected error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+                choices = event.get("choices") or []
+                if not choices:
+                    continue
+                finish_reason = choices[0].get("finish_reason") or finish_reason
+                delta = choices[0].get("delta") or {}
+                text = delta.get("content")
+                if not text:
+                    continue
+                
+                parts.append(text)
+                for key, value in parser.feed(text):
+                    if on_field:
+                        on_field(key, value)
+        
+        content = "".join(parts)
+        if not content:
+            logger.warning("Stream ended without content")
             return None
+        self._record_completion_size(usage, finish_reason, cards)
+        return content
     
-    def generate_cards_for_words(self, words: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    def _log_connection_setup(self):
+        setup = self.connection_stats.last_request()
+        if setup["connect"] or setup["tls"]:
+            logger.debug(f"New connection - connect {setup['connect'] * 1000:.0f} ms, "
+                         f"TLS {setup['tls'] * 1000:.0f} ms")
+        else:
+            logger.debug("Reused pooled connection")
+    
+    def generate_cards_for_words(self, words: List[str],
+                                 on_result: Optional[Callable[[int, str, Optional[Dict[str, Any]], Optional[str]], None]] = None,
+                                 on_field: Optional[Callable[[int, str, str, Any], None]] = None,
+                                 use_cache: bool = True,
+                                 cancel_event: Optional[threading.Event] = None
+                                 ) -> List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
         """
         Generate card fields for multiple words
-        Returns a list of tuples: (word, fields_data or None, error_message or None)
+        Requests in flight are limited by the adaptive limiter, starting at
+        `max_concurrent_requests`; with batch_size > 1 each request covers several words.
+        If on_result is given, it is called as on_result(index, word, fields_data, error)
+        from the calling thread as soon as each word completes.
+        use_cache=False bypasses the response cache for this run.
+        If on_field is given and streaming is enabled, it is called as
+        on_field(index, word, key, value) from a worker thread as each field completes.
+        Setting cancel_event stops the run: queued words are dropped, in-flight requests
+        are abandoned and reported with CANCELLED_MESSAGE, finished words are kept.
+        Returns a list of tuples in input order: (word, fields_data or None, error_message or None)
         """
-        results = []
-        
         api_key = self.config.get("api_key", "")
         if not api_key:
             # Return error for all words if no API key
-            return [(word, None, "API key not configured") for word in words]
+            results = [(word, None, "API key not configured") for word in words]
+            if on_result:
+                for index, (word, fields_data, error) in enumerate(results):
+                    on_result(index, word, fields_data, error)
+            return results
         
-        for word in words:
-            fields_data = self.generate_card_fields(word)
-            if fields_data:
-                results.append((word, fields_data, None))
-            else:
-                results.append((word, None, "Failed to generate content"))
+        results: List[Optional[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]] = [None] * len(words)
+        if not words:
+            return []
+        
+        batches = self.plan_batches(len(words))
+        max_workers = min(self.limiter.ceiling, len(batches))
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-card-creator")
+        
+        def collect(future, batch):
+            try:
+                batch_fields = future.result()
+            except Exception as e:
+                logger.error(f"Worker error for {[words[index] for index in batch]}: {str(e)}")
+                batch_fields = [None] * len(batch)
+            
+            for index, fields_data in zip(batch, batch_fields):
+                word = words[index]
+                if fields_data:
+                    results[index] = (word, fields_data, None)
+                elif cancel_event is not None and cancel_event.is_set():
+                    results[index] = (word, None, CANCELLED_MESSAGE)
+                else:
+                    results[index] = (word, None, FAILED_MESSAGE)
+                
+                if on_result:
+                    on_result(index, *results[index])
+        
+        cancelled = False
+        try:
+            futures = {}
+            for batch in batches:
+                field_callbacks = []
+                for index in batch:
+                    field_callback = None
+                    if on_field:
+                        field_callback = (lambda key, value, index=index, word=words[index]:
+                                          on_field(index, word, key, value))
+                    field_callbacks.append(field_callback)
+                batch_words = [words[index] for index in batch]
+                futures[executor.submit(self._generate_batch_or_single, batch_words, field_callbacks,
+                                        use_cache, cancel_event, time.perf_counter())] = batch
+            
+            # Poll only when the run can be cancelled, otherwise just block until something completes
+            poll_interval = 0.2 if cancel_event is not None else None
+            pending = set(futures)
+            while pending:
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                    break
+                done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future, futures[future])
+            
+            if cancelled:
+                logger.info(f"Run cancelled with {len(pending)} requests outstanding")
+                for future in pending:
+                    if future.done() and not future.cancelled():
+                        # Finished while we were noticing the cancel - keep it
+                        collect(future, futures[future])
+                        continue
+                    for index in futures[future]:
+                        results[index] = (words[index], None, CANCELLED_MESSAGE)
+                        if on_result:
+                            on_result(index, *results[index])
+        except BaseException:
+            # E.g. Ctrl-C in batch mode: stop the workers instead of waiting for their retries
+            if cancel_event is not None:
+                cancel_event.set()
+                cancelled = True
+            raise
+        finally:
+            # After a cancel, don't wait for in-flight requests - their results are discarded
+            executor.shutdown(wait=not cancelled, cancel_futures=True)
                 
         return results
     
+    def _generate_batch_or_single(self, words: List[str], field_callbacks: List[Optional[Callable[[str, Any], None]]],
+                                  use_cache: bool, cancel_event: Optional[threading.Event] = None,
+                                  submitted: Optional[float] = None) -> List[Optional[Dict[str, Any]]]:
+        """Worker: generate one batch, falling back to per-word requests for words the batch missed"""
+        if submitted is not None:
+            self.metrics.add_time("queue", time.perf_counter() - submitted)
+        self._local.cancel_event = cancel_event
+        with self._in_flight_lock:
+            self.in_flight += len(words)
+        try:
+            return self._generate_words(words, field_callbacks, use_cache)
+        finally:
+            with self._in_flight_lock:
+                self.in_flight -= len(words)
+            self._local.cancel_event = None
+    
+    def _generate_words(self, words: List[str], field_callbacks: List[Optional[Callable[[str, Any], None]]],
+                        use_cache: bool) -> List[Optional[Dict[str, Any]]]:
+        if len(words) == 1:
+            return [self.generate_card_fields(words[0], field_callbacks[0], use_cache)]
+        
+        found = self.generate_batch_fields(words, use_cache)
+        results = []
+        for word, field_callback in zip(words, field_callbacks):
+            fields_data = found.get(word)
+            if fields_data is None:
+                # Cache was already checked by the batch, only the network is left
+                fields_data = self.generate_card_fields(word, field_callback, use_cache=False)
+            results.append(fields_data)
+        return results
+    
+    def plan_batches(self, word_count: int) -> List[List[int]]:
+        """Split word indices into request batches of get_batch_size() words"""
+        size = self.get_batch_size()
+        return [list(range(start, min(start + size, word_count)))
+                for start in range(0, word_count, size)]
+    
+    def get_batch_size(self) -> int:
+        """
+        Words per request. `batch_size` is capped so the expected output
+        (`tokens_per_card` per word) fits in `batch_max_tokens`; 1 disables batching.
+        """
+        try:
+            batch_size = int(self.config.get("batch_size", 1))
+            tokens_per_card = int(self.config.get("tokens_per_card", DEFAULT_TOKENS_PER_CARD))
+        except (TypeError, ValueError):
+            return 1
+        if batch_size <= 1 or tokens_per_card <= 0:
+            return 1
+        return max(1, min(batch_size, self.get_batch_max_tokens() // tokens_per_card))
+    
+    def get_max_tokens(self, cards: int) -> int:
+        """
+        max_tokens for a request of `cards` cards (0 for missing fields), from the
+        completion sizes seen so far unless adaptive_max_tokens is off
+        """
+        if not self.config.get("adaptive_max_tokens", True):
+            return DEFAULT_CARD_MAX_TOKENS if cards <= 1 else self.get_batch_max_tokens()
+        per_card = self.token_budget.per_card()
+        if cards <= 1:
+            return per_card
+        return min(self.get_batch_max_tokens(), per_card * cards)
+    
+    def get_batch_max_tokens(self) -> int:
+        try:
+            return max(1, int(self.config.get("batch_max_tokens", DEFAULT_BATCH_MAX_TOKENS)))
+        except (TypeError, ValueError):
+            return DEFAULT_BATCH_MAX_TOKENS
+    
+    def get_max_concurrent_requests(self) -> int:
+        """Requests allowed in flight at the start of a run (at least 1); fixed when adaptive_concurrency is off"""
+        try:
+            value = int(self.config.get("max_concurrent_requests", DEFAULT_MAX_CONCURRENT_REQUESTS))
+        except (TypeError, ValueError):
+            value = DEFAULT_MAX_CONCURRENT_REQUESTS
+        return max(1, value)
+    
     def validate_api_key(self) -> bool:
-        """Test if the API key is valid by making a minimal request"""
+        """Check the API key against the key metadata endpoint (no completion is billed)"""
         api_key = self.config.get("api_key", "")
         if not api_key:
             return False
             
         try:
             headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
+                "Authorization": f"Bearer {api_key}"
             }
             
-            # Make a minimal request to check if the key works
-            data = {
-                "model": self.config.get("model", "google/gemini-2.5-flash"),
-                "messages": [{"role": "user", "content": "Hi"}],
-                "max_tokens": 5
-            }
-            
-            response = requests.post(
-                f"{self.config.get('api_base_url', 'https://openrouter.ai/api/v1')}/chat/completions",
+            response = self.session.get(
+                f"{self.get_api_base_url()}/key",
                 headers=headers,
-                json=data,
                 timeout=10
             )
             
             return response.status_code == 200
             
         except:
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,304 @@
+"""
+Headless batch mode: generate cards for a word list without the Anki GUI.
+
+Words are read from text, CSV/TSV or Kindle vocab.db files (or stdin) and
+generated with the settings from config.json, one chunk at a time. Results
+are written to a JSONL file as they arrive and/or added to a .apkg package
+built with Anki's `anki` library (pip install anki), which can be imported
+in one step. Run it through the addon folder:
+
+    python ai-card-creator words.txt --jsonl cards.jsonl
+    python ai-card-creator vocab.db --language ja --apkg 단어.apkg --deck 단어
+    python ai-card-creator words.csv --column 2 --skip-header --jsonl cards.jsonl --resume
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from .ai_client import AIClient
+from .field_mapping import FieldMappingPlan
+from .instrumentation import configure_logging, logger
+from .response_cache import open_response_cache
+from .kanji_memo import open_kanji_memo
+from .dictionary import open_dictionary
+from .word_import import (FORMAT_CSV, FORMAT_TSV, DEFAULT_IMPORT_CHUNK_SIZE,
+                          detect_format, iter_file_words, iter_chunks)
+from .tokenizer import iter_words
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_PACKAGE = os.path.join(ADDON_DIR, "Test.apkg")
+
+# Used when the note type can't be taken from Test.apkg
+DEFAULT_FIELDS = ["단어", "요미가나", "의미", "영어", "예문", "한자", "메모", "품사"]
+
+
+class JsonlWriter:
+    """Appends one {"word", "fields", "error"} object per line, flushed as results arrive"""
+
+    def __init__(self, path: str, append: bool):
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+
+    @staticmethod
+    def completed_results(path: str) -> Dict[str, Dict[str, Any]]:
+        """word -> fields for words that already have fields in an existing output file (for --resume)"""
+        results = {}
+        if not os.path.exists(path):
+            return results
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(record, dict) and record.get("fields"):
+                    results[record.get("word")] = record["fields"]
+        return results
+
+    def write(self, word: str, fields_data: Optional[Dict[str, Any]], error: Optional[str]):
+        record = {"word": word, "fields": fields_data, "error": error}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ApkgWriter:
+    """
+    Builds a .apkg in a temporary collection using the `anki` library (no aqt).
+
+    The note type is copied from the bundled Test.apkg so the cards get its
+    templates and styling; notes are added chunk by chunk, so the collection
+    on disk holds the results instead of memory.
+    """
+
+    def __init__(self, path: str, deck_name: str, note_type_name: str, config: Dict[str, Any]):
+        try:
+            from anki.collection import Collection
+        except ImportError:
+            raise SystemExit("--apkg needs Anki's Python library: pip install anki")
+
+        self.path = os.path.abspath(path)
+        self.config = config
+        self.tempdir = tempfile.TemporaryDirectory(prefix="ai-card-creator-")
+        self.col = Collection(os.path.join(self.tempdir.name, "collection.anki2"))
+        self.model = self._note_type(note_type_name)
+        self.deck_id = self.col.decks.id(deck_name, create=True)
+        self.plan = FieldMappingPlan.build(self.model, config)
+        self.first_fields: Set[str] = set()
+        self.added = 0
+
+    def _note_type(self, name: str) -> Dict[str, Any]:
+        if os.path.exists(SAMPLE_PACKAGE):
+            try:
+                self._import_sample_note_types()
+            except Exception as e:
+                logger.warning(f"Could not read note types from Test.apkg: {str(e)}")
+        model = self.col.models.by_name(name)
+        if model:
+            return model
+
+        logger.info(f"Note type '{name}' not found in Test.apkg, creating a basic one")
+        models = self.col.models
+        model = models.new(name)
+        for field_name in DEFAULT_FIELDS:
+            models.add_field(model, models.new_field(field_name))
+        template = models.new_template("Card 1")
+        template["qfmt"] = "{{" + DEFAULT_FIELDS[0] + "}}"
+        template["afmt"] = "{{FrontSide}}<hr id=answer>" + "<br>".join(
+            "{{" + field_name + "}}" for field_name in DEFAULT_FIELDS[1:])
+        models.add_template(model, template)
+        models.add(model)
+        return models.by_name(name)
+
+    def _import_sample_note_types(self):
+        """Import Test.apkg, keep its note types and drop its sample notes and decks"""
+        from anki.collection import ImportAnkiPackageOptions, ImportAnkiPackageRequest
+
+        self.col.import_anki_package(ImportAnkiPackageRequest(
+            package_path=SAMPLE_PACKAGE,
+            options=ImportAnkiPackageOptions(with_scheduling=False),
+        ))
+        note_ids = self.col.find_notes("")
+        if note_ids:
+            self.col.remove_notes(note_ids)
+        for deck in self.col.decks.all_names_and_ids():
+            if deck.id != 1:
+                self.col.decks.remove([deck.id])
+
+    def add(self, items: List[tuple]) -> Dict[str, str]:
+        """Add (word, fields_data) pairs; returns word -> error for notes that were skipped"""
+        from anki.collection import AddNoteRequest
+
+        skipped = {}
+        requests = []
+        for word, fields_data in items:
+            note = self.col.new_note(self.model)
+            if not self.plan.apply(note, fields_data):
+                skipped[word] = "No matching fields found"
+                continue
+            first_field = " ".join(note.fields[0].split())
+            if first_field in self.first_fields:
+                skipped[word] = "이미 존재"
+                continue
+            self.first_fields.add(first_field)
+            requests.append(AddNoteRequest(note=note, deck_id=self.deck_id))
+        if requests:
+            self.col.add_notes(requests)
+            self.added += len(requests)
+        return skipped
+
+    def close(self):
+        from anki.collection import DeckIdLimit, ExportAnkiPackageOptions
+
+        try:
+            if self.added:
+                self.col.export_anki_package(
+                    out_path=self.path,
+                    options=ExportAnkiPackageOptions(with_scheduling=False, with_deck_configs=False,
+                                                     with_media=False, legacy=True),
+                    limit=DeckIdLimit(self.deck_id),
+                )
+                logger.info(f"Wrote {self.added} notes to {self.path}")
+            else:
+                logger.warning("No notes were generated, .apkg not written")
+        finally:
+            self.col.close(downgrade=False)
+            self.tempdir.cleanup()
+
+
+def load_config(path: str, args) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if args.api_key or os.environ.get("OPENROUTER_API_KEY"):
+        config["api_key"] = args.api_key or os.environ["OPENROUTER_API_KEY"]
+    overrides = {
+        "model": args.model,
+        "max_concurrent_requests": args.concurrency,
+        "batch_size": args.batch_size,
+        "log_level": args.log_level,
+        # The prompt, schema and prefilled fields follow the note type, not just the .apkg
+        "default_deck": args.deck,
+        "default_note_type": args.note_type,
+    }
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    if args.no_cache:
+        config["cache_enabled"] = False
+    return config
+
+
+def iter_input_words(args):
+    if args.input == "-":
+        return iter_words(sys.stdin)
+    file_format = args.format or detect_format(args.input)
+    delimiter = args.delimiter or ("\t" if file_format == FORMAT_TSV else ",")
+    if file_format not in (FORMAT_CSV, FORMAT_TSV):
+        return iter_file_words(args.input, file_format, language=args.language)
+    return iter_file_words(args.input, file_format, column=args.column - 1, delimiter=delimiter,
+                           skip_header=args.skip_header)
+
+
+def run(args) -> int:
+    config = load_config(args.config, args)
+    configure_logging(config.get("log_level", "INFO"))
+    if not config.get("api_key"):
+        logger.error("No API key: set it in config.json, pass --api-key or set OPENROUTER_API_KEY")
+        return 2
+    if not args.jsonl and not args.apkg:
+        logger.error("Nothing to write: pass --jsonl and/or --apkg")
+        return 2
+
+    cache = open_response_cache(config, ADDON_DIR)
+    client = AIClient(config, cache=cache, kanji_memo=open_kanji_memo(config, ADDON_DIR, cache),
+                      dictionary=open_dictionary(config, ADDON_DIR))
+    metrics = client.start_run()
+    completed = JsonlWriter.completed_results(args.jsonl) if args.jsonl and args.resume else {}
+    skip = set(completed)
+    if skip:
+        logger.info(f"Resuming: {len(skip)} words already in {args.jsonl}")
+    jsonl = JsonlWriter(args.jsonl, append=args.resume) if args.jsonl else None
+    apkg = None
+    if args.apkg:
+        apkg = ApkgWriter(args.apkg, config.get("default_deck", "단어"),
+                          config.get("default_note_type", "일본어"), config)
+
+    # Set on Ctrl-C so requests in flight and their retries stop spending tokens
+    cancel_event = threading.Event()
+    chunk_size = max(1, args.chunk_size or int(config.get("import_chunk_size", DEFAULT_IMPORT_CHUNK_SIZE)))
+    totals = {"words": 0, "generated": 0, "failed": 0}
+    started = time.monotonic()
+    
+    def on_result(index, word, fields_data, error):
+        if jsonl:
+            jsonl.write(word, fields_data, error)
+    
+    try:
+        # The .apkg is written anew, so it also needs the cards generated before the resume
+        if apkg and completed:
+            with metrics.span("insert"):
+                for word, error in apkg.add(list(completed.items())).items():
+                    logger.info(f"Not added to .apkg: {word} - {error}")
+        words = (word for word in iter_input_words(args) if word not in skip)
+        for number, chunk in enumerate(iter_chunks(words, chunk_size), 1):
+            results = client.generate_cards_for_words(chunk, on_result=on_result, cancel_event=cancel_event)
+            generated = [(word, fields_data) for word, fields_data, error in results if fields_data and not error]
+            if apkg and generated:
+                with metrics.span("insert"):
+                    for word, error in apkg.add(generated).items():
+                        logger.info(f"Not added to .apkg: {word} - {error}")
+            totals["words"] += len(chunk)
+            totals["generated"] += len(generated)
+            totals["failed"] += len(chunk) - len(generated)
+            elapsed = time.monotonic() - started
+            print(f"chunk {number}: {totals['generated']}/{totals['words']} generated, "
+                  f"{totals['failed']} failed, {totals['words'] / elapsed:.2f} words/s", file=sys.stderr)
+    except KeyboardInterrupt:
+        cancel_event.set()
+        print("Interrupted - finished chunks were kept", file=sys.stderr)
+    finally:
+        if jsonl:
+            jsonl.close()
+        if apkg:
+            apkg.close()
+        client.close()
+        if client.cache:
+            client.cache.close()
+        if client.kanji_memo:
+            client.kanji_memo.close()
+        if client.dictionary:
+            client.dictionary.close()
+
+    metrics.finish()
+    print(metrics.format_summary(), file=sys.stderr)
+    return 0 if totals["failed"] == 0 else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="ai-card-creator", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="word list: .txt, .csv, .tsv, Kindle vocab.db, or - for stdin")
+    parser.add_argument("--jsonl", help="write results to this JSONL file")
+    parser.add_argument("--apkg", help="build an Anki package with the generated notes (needs `pip install anki`)")
+    parser.add_argument("--resume", action="store_true",
+                        help="append to --jsonl and skip words that already have fields in it")
+    parser.add_argument("--config", default=os.path.join(ADDON_DIR, "config.json"))
+    parser.add_argument("--api-key", help="defaults to config.json or $OPENROUTER_API_KEY")
+    parser.add_argument("--model")
+    parser.add_argument("--deck", help="overrides default_deck (the deck in the .apkg)")
+    parser.add_argument("--note-type", help="overrides default_note_type (fields to generate, note type in the .apkg)")
+    parser.add_argument("--concurrency", type=int, help="overrides max_concurrent_requests")
+    parser.add_argument("--batch-size", type=int, help="overrides batch_size")
+    parser.add_argument("--chunk-size", type=int, help="words per chunk (default: import_chunk_size)")
+    parser.add_argument("--format", choices=["text", "csv", "tsv", "kindle"], help="default: from the extension")
+    parser.add_argument("--column", type=int, default=1, help="CSV/TSV column with the words (1-based)")
+    parser.add_argument("--delimiter", help="CSV/TSV delimiter")
+    parser.add_argument("--skip-header", action="store_true", help="CSV/TSV: ignore the first row")
+    parser.add_argument("--language", help="Kindle vocab.db: only words of this language (e.g. ja)")
+    parser.add_argument("--no-cache", action="store_true", help="don't use the response cache")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return run(parser.parse_args(argv))
@@ -0,0 +1,23 @@
+"""
+Import the addon's modules outside Anki.
+
+The addon's __init__.py registers Anki hooks and needs aqt, so the benchmarks
+load the package under a neutral name with its __path__ pointing at the addon
+folder, without running __init__.py. Only modules that don't import aqt
+(ai_client, field_mapping, streaming, ...) can be used this way.
+"""
+import importlib
+import os
+import sys
+import types
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "ai_card_creator"
+
+
+def load_module(name: str):
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [ADDON_DIR]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
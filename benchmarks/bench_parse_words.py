@@ -0,0 +1,101 @@
+"""
+Micro-benchmark of the word tokenizer on multi-megabyte inputs.
+
+Compares tokenizer.iter_words on the whole text and on the text streamed in
+lines with the previous split/re.split/ord() implementation of parse_words,
+and reports MB/s, words/s and peak memory.
+
+    python benchmarks/bench_parse_words.py
+    python benchmarks/bench_parse_words.py --words 500000 --repeat 5
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _addon import load_module  # noqa: E402
+
+tokenizer = load_module("tokenizer")
+
+KANJI = "日本語学校先生時間電車会社大学天気料理映画音楽仕事旅行写真友達家族"
+KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+SEPARATORS = ["\n", ", ", "、", "・", "　", " ", "，", "；"]
+
+
+def legacy_parse_words(input_text):
+    """parse_words before the single-pass tokenizer, kept for comparison"""
+    lines = input_text.strip().split('\n')
+    words = []
+    for line in lines:
+        parts = re.split(r'[,、・]', line)
+        for part in parts:
+            part = part.strip()
+            if part:
+                if ' ' in part and all(ord(c) > 127 or c == ' ' for c in part):
+                    words.extend(part.split())
+                else:
+                    words.append(part)
+    seen = set()
+    unique_words = []
+    for word in words:
+        if word and word not in seen:
+            seen.add(word)
+            unique_words.append(word)
+    return unique_words
+
+
+def make_text(word_count: int, seed: int = 0) -> str:
+    """A vocab-export-like paste: mostly Japanese words, some English phrases, mixed separators"""
+    rng = random.Random(seed)
+    pieces = []
+    for i in range(word_count):
+        if i % 20 == 0:
+            word = f"take off {i}"
+        else:
+            word = "".join(rng.choice(KANJI) for _ in range(rng.randint(1, 3)))
+            word += "".join(rng.choice(KANA) for _ in range(rng.randint(0, 3)))
+        pieces.append(word)
+        pieces.append(rng.choice(SEPARATORS))
+    return "".join(pieces)
+
+
+def measure(label, func, size_bytes, repeat):
+    best = float("inf")
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28}{best * 1000:>10.1f}{size_bytes / best / 1e6:>10.1f}"
+          f"{count / best:>14,.0f}{count:>10,}{peak / 1e6:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for word_count in args.words:
+        text = make_text(word_count)
+        size = len(text.encode("utf-8"))
+        print(f"\n{word_count:,} words, {size / 1e6:.1f} MB")
+        print(f"{'implementation':<28}{'best ms':>10}{'MB/s':>10}{'words/s':>14}{'unique':>10}{'peak MB':>10}")
+        measure("legacy parse_words", lambda: len(legacy_parse_words(text)), size, args.repeat)
+        measure("iter_words (whole text)", lambda: sum(1 for _ in tokenizer.iter_words(text)), size, args.repeat)
+        lines = text.splitlines(keepends=True)
+        measure("iter_words (streamed lines)", lambda: sum(1 for _ in tokenizer.iter_words(iter(lines))),
+                size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+End-to-end benchmark of the generation pipeline against the local mock server.
+
+For each input size it measures:
+  parse    - AIClient.parse_words on a comma/newline separated word list
+  generate - AIClient.generate_cards_for_words through HTTP (mock server)
+  mapping  - FieldMappingPlan.apply, the CardCreator step that fills note fields
+
+and reports words/sec, p50/p95/p99 latency (per request for generate, per
+call for parse and mapping) and peak Python memory (tracemalloc).
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --sizes 100 --latency-ms 300 --burst-every 20 --burst-length 3
+    python benchmarks/bench_pipeline.py --json > results.json
+
+No API key or Anki installation is needed; only `requests` must be importable.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _addon import load_module  # noqa: E402
+from mock_server import PROMPT_TEMPLATE, MockOpenRouterServer, MockSettings, make_card  # noqa: E402
+
+ai_client = load_module("ai_client")
+field_mapping = load_module("field_mapping")
+
+# Field layout of the 일본어 note type shipped in Test.apkg
+NOTE_TYPE = {
+    "id": 1,
+    "mod": 1,
+    "name": "일본어",
+    "flds": [{"name": name} for name in ("단어", "요미가나", "의미", "영어", "예문", "한자", "메모", "품사")],
+}
+
+
+class FakeNote:
+    def __init__(self, field_count: int):
+        self.fields = [""] * field_count
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(stage: str, size: int, elapsed: float, latencies: List[float], peak_bytes: int,
+              extra: Dict = None) -> Dict:
+    row = {
+        "stage": stage,
+        "words": size,
+        "seconds": elapsed,
+        "words_per_sec": size / elapsed if elapsed > 0 else float("inf"),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_mb": peak_bytes / (1024 * 1024),
+    }
+    row.update(extra or {})
+    return row
+
+
+def measure(func: Callable[[], None]):
+    """Run func with stdout silenced (the addon logs every request); return (seconds, peak bytes)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def make_words(size: int) -> List[str]:
+    return [f"単語{i}" for i in range(size)]
+
+
+def bench_parse(size: int, repeat: int) -> Dict:
+    client = ai_client.AIClient({})
+    words = make_words(size)
+    text = "\n".join(", ".join(words[i:i + 10]) for i in range(0, size, 10))
+    latencies = []
+
+    def run():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parsed = client.parse_words(text)
+            latencies.append(time.perf_counter() - start)
+            assert len(parsed) == size, f"parse_words returned {len(parsed)} of {size} words"
+
+    elapsed, peak = measure(run)
+    return summarize("parse", size * repeat, elapsed, latencies, peak)
+
+
+def bench_generate(size: int, args) -> Dict:
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.error_rate,
+                            args.burst_every, args.burst_length, args.retry_after,
+                            slow_rate=args.slow_rate, slow_ms=args.slow_ms, capacity=args.capacity,
+                            malformed_rate=args.malformed_rate)
+    with MockOpenRouterServer(settings) as server:
+        client = ai_client.AIClient({
+            "api_key": "mock",
+            "api_base_url": server.base_url,
+            "model": "mock/model",
+            "prompt_template": PROMPT_TEMPLATE,
+            "default_note_type": NOTE_TYPE["name"],
+            "max_concurrent_requests": args.concurrency,
+            "batch_size": args.batch_size,
+            "stream_responses": args.stream,
+            "cache_enabled": False,
+            "retry_base_delay": 0.05,
+            "retry_max_delay": 1.0,
+            "hedge_enabled": args.hedge,
+            "adaptive_concurrency": args.adaptive,
+            "concurrency_max": args.concurrency_max,
+        })
+
+        # Time each answered request, i.e. a request raced against its hedge counts once
+        latencies = []
+        lock = threading.Lock()
+        hedged_completion = client._hedged_completion
+
+        def timed_hedged_completion(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return hedged_completion(*a, **kw)
+            finally:
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        client._hedged_completion = timed_hedged_completion
+        client.start_run()
+        results = []
+
+        def run():
+            results.extend(client.generate_cards_for_words(make_words(size), use_cache=False))
+
+        try:
+            elapsed, peak = measure(run)
+        finally:
+            client.close()
+
+        failed = sum(1 for _, fields_data, _ in results if not fields_data)
+        return summarize("generate", size, elapsed, latencies, peak, {
+            "requests": server.request_count,
+            "rate_limited": server.rate_limited,
+            "server_errors": server.errors,
+            "failed_words": failed,
+            "hedges": client.metrics.hedges,
+            "hedge_wins": client.metrics.hedge_wins,
+            "malformed": server.malformed,
+            "json_repairs": client.metrics.json_repairs,
+            "field_requests": client.metrics.field_requests,
+            "prompt_tokens": client.metrics.prompt_tokens,
+            "cached_prompt_tokens": client.metrics.cached_prompt_tokens,
+            "max_tokens": client.get_max_tokens(1),
+            "peak_in_flight": server.peak_active,
+            "final_limit": client.limiter.limit,
+        })
+
+
+def bench_mapping(size: int, repeat: int) -> Dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = field_mapping.FieldMappingPlan.build(NOTE_TYPE, {})
+    cards = [make_card(word) for word in make_words(size)]
+    cards = [dict(card, 의미=card["의미"].split("\n")) for card in cards]
+    latencies = []
+
+    def run():
+        for _ in range(repeat):
+            for card in cards:
+                note = FakeNote(len(NOTE_TYPE["flds"]))
+                start = time.perf_counter()
+                plan.apply(note, card)
+                latencies.append(time.perf_counter() - start)
+
+    elapsed, peak = measure(run)
+    return summarize("mapping", size * repeat, elapsed, latencies, peak)
+
+
+def print_table(rows: List[Dict]):
+    header = f"{'stage':<10}{'words':>8}{'seconds':>10}{'words/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        line = (f"{row['stage']:<10}{row['words']:>8}{row['seconds']:>10.3f}{row['words_per_sec']:>12.1f}"
+                f"{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['peak_mb']:>10.2f}")
+        if row["stage"] == "generate":
+            line += (f"  requests={row['requests']} 429s={row['rate_limited']} "
+                     f"500s={row['server_errors']} failed={row['failed_words']} "
+                     f"hedges={row['hedges']} won={row['hedge_wins']} "
+                     f"peak={row['peak_in_flight']} limit={row['final_limit']} "
+                     f"malformed={row['malformed']} repaired={row['json_repairs']} "
+                     f"field_requests={row['field_requests']} "
+                     f"cached={row['cached_prompt_tokens']}/{row['prompt_tokens']} max_tokens={row['max_tokens']}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--stages", nargs="+", default=["parse", "generate", "mapping"],
+                        choices=["parse", "generate", "mapping"])
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--burst-every", type=int, default=0, help="every N requests ...")
+    parser.add_argument("--burst-length", type=int, default=0, help="... the last M get a 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of answers that take --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=5000)
+    parser.add_argument("--hedge", action=argparse.BooleanOptionalAction, default=True,
+                        help="send hedged requests for slow answers")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="fraction of answers with code fences, truncation or a list for 의미")
+    parser.add_argument("--capacity", type=int, default=0, help="server rate limits above this many concurrent requests")
+    parser.add_argument("--adaptive", action=argparse.BooleanOptionalAction, default=True,
+                        help="adapt the concurrency limit to 429s and latency")
+    parser.add_argument("--concurrency-max", type=int, default=16, help="ceiling for adaptive concurrency")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After sent with 429s")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions for the parse/mapping stages")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        if "parse" in args.stages:
+            rows.append(bench_parse(size, args.repeat))
+        if "generate" in args.stages:
+            rows.append(bench_generate(size, args))
+        if "mapping" in args.stages:
+            rows.append(bench_mapping(size, args.repeat))
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Local stand-in for the OpenRouter chat completions API.
+
+Answers POST /chat/completions with a generated 일본어 card for the word in
+the prompt (or for every word of a batch prompt), with configurable latency,
+random server errors, occasional very slow answers, periodic 429 bursts, a
+concurrency capacity above which requests are rate limited, malformed answers
+(code fences, truncation, a list for 의미) and SSE streaming. Follow-up
+requests for missing fields get just those fields. Answers are cut off at
+max_tokens (finish_reason "length"), and a system prompt seen before is
+reported as cached prompt tokens, like a provider's prompt cache. GET /key and
+HEAD / succeed so key validation and connection warm-up work too.
+
+Run standalone to point the addon at it:
+    python benchmarks/mock_server.py --port 8765 --latency-ms 300
+and set api_base_url to http://127.0.0.1:8765 in config.json.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Benchmarks use this template; the server finds the word in the last message ("입력: ...")
+PROMPT_TEMPLATE = "BENCHMARK CARD\n📝 입력: {word}\nJSON 형식으로만 응답하고, 다른 텍스트는 포함하지 마라."
+WORD_PATTERN = re.compile(r"입력: (.*)")
+BATCH_PATTERN = re.compile(r"처리한다: (\[.*?\])", re.S)
+MISSING_PATTERN = re.compile(r"필드가 빠졌다: (\[.*?\])", re.S)
+MALFORMATIONS = ("fence", "truncate", "list")
+
+
+def make_card(word: str) -> dict:
+    """A card roughly the size of a real VocabMate response"""
+    return {
+        "단어": word,
+        "요미가나": "よみがな",
+        "의미": "• 벤치마크용 의미 1\n• 벤치마크용 의미 2",
+        "영어": "benchmark meaning",
+        "예문": "<br>".join(f"{word}を使った例文 {i}です。<br>→ 예문 {i}에 대한 설명입니다." for i in range(3)),
+        "한자": "",
+        "메모": "이 카드는 로컬 모의 서버가 생성한 벤치마크용 카드입니다. " * 6,
+        "품사": "명사",
+    }
+
+
+def _message_text(message: dict) -> str:
+    """Text of a chat message whose content is a string or a list of text parts"""
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+class MockSettings:
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 0, error_rate: float = 0.0,
+                 burst_every: int = 0, burst_length: int = 0, retry_after: float = 0.1,
+                 chunk_chars: int = 40, seed: int = 0, slow_rate: float = 0.0, slow_ms: float = 5000,
+                 capacity: int = 0, malformed_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.chunk_chars = chunk_chars
+        # Fraction of answers that take slow_ms instead (tail latency)
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        # Requests arriving while this many are being answered get a 429 (0 = unlimited)
+        self.capacity = capacity
+        # Fraction of answers damaged in one of the MALFORMATIONS ways
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping kept-alive connections at shutdown are expected
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class MockOpenRouterServer:
+    """ThreadingHTTPServer wrapper; use as a context manager or call start()/stop()"""
+
+    def __init__(self, settings: MockSettings = None, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings or MockSettings()
+        self.request_count = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.active = 0
+        self.peak_active = 0
+        self.malformed = 0
+        self.cached_prefixes = set()
+        self._lock = threading.Lock()
+        self.httpd = _QuietHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _next_outcome(self):
+        """
+        Decide whether this request succeeds ("ok", delay, damage or None),
+        is rate limited ("429") or fails ("500")
+        """
+        settings = self.settings
+        with self._lock:
+            self.request_count += 1
+            n = self.request_count
+            if settings.burst_every and settings.burst_length:
+                if (n - 1) % settings.burst_every >= settings.burst_every - settings.burst_length:
+                    self.rate_limited += 1
+                    return "429", 0.0, None
+            if settings.capacity and self.active >= settings.capacity:
+                self.rate_limited += 1
+                return "429", 0.0, None
+            if settings.error_rate and settings.random.random() < settings.error_rate:
+                self.errors += 1
+                return "500", 0.0, None
+            delay = settings.latency_ms + settings.random.uniform(-settings.jitter_ms, settings.jitter_ms)
+            if settings.slow_rate and settings.random.random() < settings.slow_rate:
+                delay = settings.slow_ms
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            damage = None
+            if settings.malformed_rate and settings.random.random() < settings.malformed_rate:
+                self.malformed += 1
+                damage = MALFORMATIONS[self.malformed % len(MALFORMATIONS)]
+        return "ok", max(0.0, delay) / 1000, damage
+
+    def _cached_tokens(self, messages: list) -> int:
+        """Tokens of the system prompt if the same one was sent before"""
+        system = messages[0] if messages and messages[0].get("role") == "system" else None
+        if system is None:
+            return 0
+        text = _message_text(system)
+        with self._lock:
+            if text in self.cached_prefixes:
+                return len(text) // 2
+            self.cached_prefixes.add(text)
+        return 0
+
+    def _answered(self):
+        with self._lock:
+            self.active -= 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                if self.path.endswith("/key"):
+                    self._send_json(200, {"data": {"label": "mock", "usage": 0}})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                outcome, delay, damage = server._next_outcome()
+                if outcome == "429":
+                    self._send_json(429, {"error": {"message": "rate limited"}},
+                                    {"Retry-After": str(server.settings.retry_after)})
+                    return
+                if outcome == "500":
+                    self._send_json(500, {"error": {"message": "mock server error"}})
+                    return
+
+                try:
+                    self._answer(request, delay, damage)
+                finally:
+                    server._answered()
+
+            def _answer(self, request: dict, delay: float, damage: str = None):
+                messages = request["messages"]
+                prompt = _message_text(messages[-1])
+                content = self._damage(self._cards_for(prompt), damage)
+                finish_reason = "length" if damage == "truncate" else "stop"
+                # Two characters per token, as everywhere in the mock
+                max_chars = 2 * int(request.get("max_tokens") or 0)
+                if max_chars and len(content) > max_chars:
+                    content, finish_reason = content[:max_chars], "length"
+                usage = {
+                    "prompt_tokens": sum(len(_message_text(message)) for message in messages) // 2,
+                    "prompt_tokens_details": {"cached_tokens": server._cached_tokens(messages)},
+                    "completion_tokens": len(content) // 2,
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+                if request.get("stream"):
+                    self._stream(content, usage, delay, finish_reason)
+                else:
+                    time.sleep(delay)
+                    self._send_json(200, {
+                        "id": "mock",
+                        "model": request.get("model", "mock"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": finish_reason}],
+                        "usage": usage,
+                    })
+
+            def _cards_for(self, prompt: str):
+                batch = BATCH_PATTERN.search(prompt)
+                if batch:
+                    return {word: make_card(word) for word in json.loads(batch.group(1))}
+                match = WORD_PATTERN.search(prompt)
+                card = make_card(match.group(1).strip() if match else "?")
+                missing = MISSING_PATTERN.search(prompt)
+                if missing:
+                    return {field: card[field] for field in json.loads(missing.group(1)) if field in card}
+                return card
+
+            @staticmethod
+            def _damage(payload: dict, damage: str = None) -> str:
+                if damage == "list":
+                    for card in ([payload] if "의미" in payload else payload.values()):
+                        if isinstance(card, dict) and "의미" in card:
+                            card["의미"] = [line.lstrip("• ") for line in card["의미"].split("\n")]
+                content = json.dumps(payload, ensure_ascii=False)
+                if damage == "fence":
+                    return f"```json\n{content}\n```"
+                if damage == "truncate":
+                    # Cut off like a response that ran into max_tokens
+                    return content[:int(len(content) * 0.6)]
+                return content
+
+            def _stream(self, content: str, usage: dict, delay: float, finish_reason: str = "stop"):
+                size = max(1, server.settings.chunk_chars)
+                pieces = [content[i:i + size] for i in range(0, len(content), size)]
+                per_chunk = delay / max(1, len(pieces))
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self._write_chunk(": MOCK PROCESSING\n\n")
+                for piece in pieces:
+                    time.sleep(per_chunk)
+                    event = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                    self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+                final = {"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}], "usage": usage}
+                self._write_chunk(f"data: {json.dumps(final)}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def _write_chunk(self, text: str):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, status: int, payload: dict, headers: dict = None):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--burst-every", type=int, default=0, help="every N requests ...")
+    parser.add_argument("--burst-length", type=int, default=0, help="... the last M get a 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of very slow answers")
+    parser.add_argument("--slow-ms", type=float, default=5000)
+    parser.add_argument("--capacity", type=int, default=0, help="429 above this many concurrent requests")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of fenced/truncated/list answers")
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.error_rate,
+                            args.burst_every, args.burst_length,
+                            slow_rate=args.slow_rate, slow_ms=args.slow_ms, capacity=args.capacity,
+                            malformed_rate=args.malformed_rate)
+    server = MockOpenRouterServer(settings, port=args.port)
+    print(f"Mock OpenRouter listening on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,126 +1,166 @@
+import time
+import unicodedata
 from aqt import mw
 from aqt.utils import showInfo, showWarning, tooltip
-from typing import Dict, Any, Optional, Tuple
+from anki.collection import AddNoteRequest, OpChanges
+from anki.utils import strip_html_media
+from .catalog import get_catalog
+from .field_mapping import FieldMappingPlan
+from .instrumentation import RunMetrics, logger
+from typing import Dict, Any, Optional, Tuple, Set, List
+
+DUPLICATE_MESSAGE = "이미 존재"
+ADDED_MESSAGE = "추가 완료"
+
+
+def normalize_first_field(text: str) -> str:
+    """Normalize a first-field value for duplicate checks (HTML stripped, NFKC, collapsed whitespace)"""
+    text = unicodedata.normalize("NFKC", strip_html_media(text or ""))
+    return " ".join(text.split())
+
+
+class DuplicateIndex:
+    """
+    Normalized first-field values of every note of one note type.
+    Loaded once per job so known words can be skipped before any API call,
+    and kept up to date as new notes are added.
+    """
+    
+    def __init__(self, note_type_name: str, values: Set[str]):
+        self.note_type_name = note_type_name
+        self.values = values
+        
+    @classmethod
+    def load(cls, note_type_name: str) -> "DuplicateIndex":
+        model = mw.col.models.by_name(note_type_name)
+        if not model:
+            return cls(note_type_name, set())
+        # Only the first field is read; fields are separated by \x1f (char 31)
+        rows = mw.col.db.list(
+            "select substr(flds, 1, instr(flds || char(31), char(31)) - 1) from notes where mid = ?",
+            model["id"]
+        )
+        values = set()
+        for first_field in rows:
+            value = normalize_first_field(first_field)
+            if value:
+                values.add(value)
+        return cls(note_type_name, values)
+    
+    def contains(self, text: str) -> bool:
+        return normalize_first_field(text) in self.values
+    
+    def add(self, text: str):
+        value = normalize_first_field(text)
+        if value:
+            self.values.add(value)
+    
+    def __len__(self):
+        return len(self.values)
+
 
 class CardCreator:
     def __init__(self, config):
         self.config = config
+        self.catalog = get_catalog()
+        self.duplicate_index: Optional[DuplicateIndex] = None
+        # (note type id, mod) -> FieldMappingPlan
+        self._plans: Dict[Tuple[int, int], FieldMappingPlan] = {}
+        
+    def load_duplicate_index(self, note_type_name: str) -> DuplicateIndex:
+        """Build the duplicate index for a job targeting the given note type"""
+        self.duplicate_index = DuplicateIndex.load(note_type_name)
+        logger.debug(f"Loaded {len(self.duplicate_index)} existing entries for '{note_type_name}'")
+        return self.duplicate_index
         
-    def create_card(self, fields_data: Dict[str, Any], word: str) -> Tuple[bool, str]:
+    def add_notes_bulk(self, col, items: List[Tuple[str, Dict[str, Any]]],
+                       metrics: Optional[RunMetrics] = None
+                       ) -> Tuple[OpChanges, Dict[str, Tuple[bool, str]]]:
         """
-        Create an Anki card from the AI-generated fields data
-        Returns tuple: (success: bool, message: str)
+        Create notes for many (word, fields_data) pairs in one collection operation.
+        Deck and note type are resolved once and every note is added with a single
+        add_notes call, so the whole batch is one undo step and one UI refresh.
+        Meant to run inside a CollectionOp (background thread).
+        Mapping and insert time are added to metrics, if given.
+        Returns the OpChanges and a dict of word -> (success, message).
         """
-        try:
-            # Validate fields_data type
+        outcome: Dict[str, Tuple[bool, str]] = {}
+        
+        deck_name = self.config.get("default_deck", "단어")
+        note_type_name = self.config.get("default_note_type", "일본어")
+        
+        deck_id = col.decks.id_for_name(deck_name)
+        model = col.models.by_name(note_type_name)
+        if not deck_id or not model:
+            message = f"Deck '{deck_name}' not found" if not deck_id else f"Note type '{note_type_name}' not found"
+            for word, _ in items:
+                outcome[word] = (False, message)
+            return OpChanges(), outcome
+        
+        index = self.duplicate_index
+        if index and index.note_type_name != note_type_name:
+            index = None
+        
+        mapping_started = time.perf_counter()
+        plan = self.get_mapping_plan(model)
+        add_requests = []
+        pending = []
+        batch_first_fields = set()
+        for word, fields_data in items:
             if not isinstance(fields_data, dict):
-                return False, f"Invalid AI response format: expected dict, got {type(fields_data).__name__}"
-            
-            # Get the configured deck and note type
-            deck_name = self.config.get("default_deck", "단어")
-            note_type_name = self.config.get("default_note_type", "일본어")
-            
-            # Get deck ID
-            deck = mw.col.decks.by_name(deck_name)
-            if not deck:
-                return False, f"Deck '{deck_name}' not found"
-            deck_id = deck["id"]
-            
-            # Get note type (model)
-            model = mw.col.models.by_name(note_type_name)
-            if not model:
-                return False, f"Note type '{note_type_name}' not found"
-                
-            # Create new note
-            note = mw.col.new_note(model)
-            
-            # Get field mappings for this note type
-            field_mappings = self.config.get("field_mappings", {}).get(note_type_name, {})
-            
-            # Map AI fields to note fields
-            fields_filled = False
-            
-            # Debug: Print available fields
-            print(f"AI Card Creator: Note type '{note_type_name}' has fields: {list(note.keys())}")
-            print(f"AI Card Creator: AI generated fields: {list(fields_data.keys())}")
-            
-            # For Japanese note type, use specific field mapping
-            if note_type_name == "일본어":
-                mapping = {
-                    "단어": "단어",
-                    "요미가나": "요미가나", 
-                    "의미": "의미",
-                    "영어": "영어",
-                    "예문": "예문",
-                    "한자": "한자",
-                    "메모": "메모",
-                    "품사": "품사"
-                }
-                
-                for ai_field, note_field in mapping.items():
-                    if ai_field in fields_data and note_field in note:
-                        # Format the field value properly
-                        field_value = fields_data[ai_field]
-                        
-                        # Handle list values (like 의미 field)
-                        if isinstance(field_value, list):
-                            # Join list items with line breaks or bullet points
-                            if ai_field == "의미":
-                                # Format meanings with bullet points
-                                formatted_value = "\n".join([f"• {item}" for item in field_value])
-                            else:
-                                # For other lists, join with line breaks
-                                formatted_value = "\n".join(field_value)
-                        else:
-                            formatted_value = str(field_value)
-                        
-                        note[note_field] = formatted_value
-                        fields_filled = True
-                        print(f"AI Card Creator: Mapped {ai_field} -> {note_field}")
-                    elif ai_field in fields_data:
-                        print(f"AI Card Creator: Field '{note_field}' not found in note type")
-                    else:
-                        print(f"AI Card Creator: Field '{ai_field}' not in AI response")
-            else:
-                # For other note types, try direct mapping first
-                for field_name, field_value in fields_data.items():
-                    if field_name in note:
-                        # Handle list values
-                        if isinstance(field_value, list):
-                            formatted_value = "\n".join([str(item) for item in field_value])
-                        else:
-                            formatted_value = str(field_value)
-                        note[field_name] = formatted_value
-                        fields_filled = True
-                    else:
-                        # Try field mappings
-                        for mapped_field in field_mappings.values():
-                            if mapped_field == field_name and mapped_field in note:
-                                note[mapped_field] = str(field_value)
-                                fields_filled = True
-                                break
-            
-            if not fields_filled:
-                return False, "No matching fields found"
-            
-            # Set the deck for the note
-            note.note_type()["did"] = deck_id
-            
-            # Try to add the note
+                outcome[word] = (False, f"Invalid AI response format: expected dict, got {type(fields_data).__name__}")
+                continue
             try:
-                mw.col.add_note(note, deck_id)
-                # Update the UI
-                mw.reset()
-                return True, "추가 완료"
+                note = col.new_note(model)
+                if not plan.apply(note, fields_data):
+                    outcome[word] = (False, "No matching fields found")
+                    continue
             except Exception as e:
-                # Check if it's a duplicate error by examining the exception message
-                if "duplicate" in str(e).lower():
-                    return False, "이미 존재"
-                else:
-                    raise
-                
-        except Exception as e:
-            return False, str(e)
+                outcome[word] = (False, str(e))
+                continue
+            
+            first_field = normalize_first_field(note.fields[0] if note.fields else "")
+            if (index and index.contains(first_field)) or first_field in batch_first_fields:
+                outcome[word] = (False, DUPLICATE_MESSAGE)
+                continue
+            batch_first_fields.add(first_field)
+            
+            add_requests.append(AddNoteRequest(note=note, deck_id=deck_id))
+            pending.append((word, first_field))
+        
+        if metrics:
+            metrics.add_time("mapping", time.perf_counter() - mapping_started)
+        if not add_requests:
+            return OpChanges(), outcome
+        
+        insert_started = time.perf_counter()
+        changes = col.add_notes(add_requests)
+        if metrics:
+            metrics.add_time("insert", time.perf_counter() - insert_started)
+        for word, first_field in pending:
+            outcome[word] = (True, ADDED_MESSAGE)
+            if index:
+                index.add(first_field)
+        logger.info(f"Added {len(add_requests)} notes in one operation")
+        return changes, outcome
+    
+    def get_mapping_plan(self, model: Dict[str, Any]) -> "FieldMappingPlan":
+        """
+        Mapping plan for a note type, built once per (note type id, schema version).
+        Editing the note type bumps its "mod" and therefore builds a fresh plan.
+        """
+        key = (model["id"], model.get("mod", 0))
+        plan = self._plans.get(key)
+        if plan is None:
+            # Drop plans for older versions of this note type
+            self._plans = {k: v for k, v in self._plans.items() if k[0] != model["id"]}
+            plan = FieldMappingPlan.build(model, self.config)
+            self._plans[key] = plan
+        return plan
+    
+    def clear_mapping_plans(self):
+        """Forget cached plans, e.g. after list_formatting was changed in config.json"""
+        self._plans = {}
     
     def get_available_fields(self, note_type_name: str) -> list:
         """Get list of fields for a given note type"""
@@ -131,12 +171,12 @@ class CardCreator:
     
     def validate_note_type(self, note_type_name: str) -> bool:
         """Check if a note type exists"""
-        return mw.col.models.by_name(note_type_name) is not None
+        return self.catalog.note_type_id(note_type_name) is not None
     
     def get_all_note_types(self) -> list:
         """Get list of all available note types"""
-        return [model["name"] for model in mw.col.models.all()]
+        return self.catalog.note_type_names()
     
     def get_all_decks(self) -> list:
         """Get list of all available decks"""
-        return [deck["name"] for deck in mw.col.decks.all()]
\ No newline at end of file
+        return self.catalog.deck_names()
\ No newline at end of file
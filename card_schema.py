@@ -0,0 +1,155 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .field_mapping import DEFAULT_LIST_FORMATTING
+from .streaming import IncrementalJSONParser
+
+# Field types: "text" is a single string, "list" a list of strings
+FIELD_TYPES = ("text", "list")
+
+# Used when config.json predates the field_schemas setting
+DEFAULT_FIELD_SCHEMAS = {
+    "일본어": {
+        "단어": "text",
+        "요미가나": "text",
+        "의미": "text",
+        "영어": "text",
+        "예문": "text",
+        "한자": "text",
+        "메모": "text",
+        "품사": "text",
+    },
+}
+
+# Outcomes of repair_json
+JSON_OK = "ok"
+JSON_REPAIRED = "repaired"
+JSON_TRUNCATED = "truncated"
+JSON_INVALID = "invalid"
+
+FENCE_PATTERN = re.compile(r"^```[\w-]*[ \t]*\n?|\n?```\s*$")
+
+
+def strip_code_fences(content: str) -> str:
+    """Remove a ```json ... ``` wrapper (also an unterminated one from a cut-off answer)"""
+    text = content.strip().lstrip("\ufeff")
+    if text.startswith("```"):
+        text = FENCE_PATTERN.sub("", text).strip()
+    return text
+
+
+def repair_json(content: str) -> Tuple[Any, str]:
+    """
+    Parse model output leniently: code fences and text around the JSON are
+    ignored, and an object cut off mid-way (e.g. at max_tokens) keeps its
+    finished top-level members. Returns (value, status) with status JSON_OK,
+    JSON_REPAIRED, JSON_TRUNCATED (only finished members were kept) or
+    JSON_INVALID (value is None).
+    """
+    try:
+        return json.loads(content), JSON_OK
+    except json.JSONDecodeError:
+        pass
+    text = strip_code_fences(content)
+    try:
+        return json.loads(text), JSON_REPAIRED
+    except json.JSONDecodeError:
+        pass
+
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return None, JSON_INVALID
+    start = min(starts)
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text, start)
+        return value, JSON_REPAIRED
+    except json.JSONDecodeError:
+        pass
+
+    parser = IncrementalJSONParser()
+    parser.feed(text[start:])
+    if parser.fields:
+        return dict(parser.fields), JSON_TRUNCATED
+    return None, JSON_INVALID
+
+
+class CardSchema:
+    """
+    Expected AI fields and their types for one note type, from `field_schemas`
+    in config.json. Responses are coerced to it (lists joined for text fields
+    with the note type's list formatting, numbers and nulls turned into text)
+    and checked for missing fields. Note types without a schema accept any object.
+    """
+
+    def __init__(self, note_type_name: str, field_types: Dict[str, str],
+                 list_rules: Dict[str, Tuple[str, str]]):
+        self.note_type_name = note_type_name
+        self.field_types = field_types
+        self.list_rules = list_rules
+
+    @classmethod
+    def from_config(cls, config, note_type_name: Optional[str] = None) -> "CardSchema":
+        note_type_name = note_type_name or config.get("default_note_type", "")
+        schemas = config.get("field_schemas", DEFAULT_FIELD_SCHEMAS)
+        field_types = {field: kind if kind in FIELD_TYPES else "text"
+                       for field, kind in schemas.get(note_type_name, {}).items()}
+        list_formatting = config.get("list_formatting", DEFAULT_LIST_FORMATTING)
+        list_rules = {field: (rule.get("separator", "\n"), rule.get("prefix", ""))
+                      for field, rule in list_formatting.get(note_type_name, {}).items()}
+        return cls(note_type_name, field_types, list_rules)
+
+    def unwrap(self, value: Any) -> Optional[Dict[str, Any]]:
+        """
+        The card object in a response: the object itself, the only card of a
+        one-element list, a card nested under a single key ({"card": {...}}),
+        or a JSON string holding any of those. None if there is no object.
+        """
+        if isinstance(value, str):
+            value, _ = repair_json(value)
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0]
+        if not isinstance(value, dict):
+            return None
+        if len(value) == 1 and self.field_types and not set(value) & set(self.field_types):
+            inner = next(iter(value.values()))
+            if isinstance(inner, dict):
+                return inner
+        return value
+
+    def normalize(self, fields_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Coerce the schema's fields to their types; other keys are kept as they are"""
+        normalized = dict(fields_data)
+        for field, kind in self.field_types.items():
+            if field in normalized:
+                normalized[field] = self._coerce(field, kind, normalized[field])
+        return normalized
+
+    def missing(self, fields_data: Dict[str, Any]) -> List[str]:
+        """Schema fields the response didn't include (empty values are fine, e.g. 한자 for kana words)"""
+        return [field for field in self.field_types if field not in fields_data]
+
+    def _coerce(self, field: str, kind: str, value: Any) -> Any:
+        if kind == "list":
+            if value is None:
+                return []
+            if isinstance(value, list):
+                return [self._text(item) for item in value]
+            return [self._text(value)]
+
+        if isinstance(value, list):
+            separator, prefix = self.list_rules.get(field, ("\n", ""))
+            items = [self._text(item).strip() for item in value]
+            return separator.join(item if item.startswith(prefix) else prefix + item
+                                  for item in items if item)
+        return self._text(value)
+
+    @staticmethod
+    def _text(value: Any) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return str(value)
@@ -0,0 +1,69 @@
+from aqt import mw, gui_hooks
+from typing import Dict, List, Optional
+
+
+class CollectionCatalog:
+    """
+    Cached deck and note type names/ids for the open collection.
+
+    Uses the lightweight name-and-id listings instead of loading full deck and
+    note type dicts, and is only reloaded after Anki reports a deck or note
+    type change (or a different collection is loaded). `version` increases on
+    every invalidation so views can tell whether their lists are stale.
+    """
+
+    def __init__(self):
+        self._decks: Optional[Dict[str, int]] = None
+        self._note_types: Optional[Dict[str, int]] = None
+        self.version = 0
+        gui_hooks.operation_did_execute.append(self._on_operation_did_execute)
+        gui_hooks.collection_did_load.append(self._on_collection_did_load)
+        gui_hooks.state_did_reset.append(self.invalidate)
+
+    def deck_names(self) -> List[str]:
+        return list(self._load_decks())
+
+    def note_type_names(self) -> List[str]:
+        return list(self._load_note_types())
+
+    def deck_id(self, name: str) -> Optional[int]:
+        return self._load_decks().get(name)
+
+    def note_type_id(self, name: str) -> Optional[int]:
+        return self._load_note_types().get(name)
+
+    def invalidate(self, decks: bool = True, note_types: bool = True):
+        if decks:
+            self._decks = None
+        if note_types:
+            self._note_types = None
+        if decks or note_types:
+            self.version += 1
+
+    def _load_decks(self) -> Dict[str, int]:
+        if self._decks is None:
+            self._decks = {d.name: d.id for d in mw.col.decks.all_names_and_ids()}
+        return self._decks
+
+    def _load_note_types(self) -> Dict[str, int]:
+        if self._note_types is None:
+            self._note_types = {m.name: m.id for m in mw.col.models.all_names_and_ids()}
+        return self._note_types
+
+    def _on_operation_did_execute(self, changes, handler):
+        self.invalidate(decks=bool(getattr(changes, "deck", False)),
+                        note_types=bool(getattr(changes, "notetype", False)))
+
+    def _on_collection_did_load(self, col):
+        self.invalidate()
+
+
+_catalog: Optional[CollectionCatalog] = None
+
+
+def get_catalog() -> CollectionCatalog:
+    """The catalog shared by CardCreator, AICardCreatorWindow and SettingsDialog"""
+    global _catalog
+    if _catalog is None:
+        _catalog = CollectionCatalog()
+    return _catalog
@@ -0,0 +1,129 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Optional
+
+# Latency samples needed before a latency rise can lower the limit
+MIN_LATENCY_SAMPLES = 10
+
+# Smoothing of the recent and the long-term latency average
+SHORT_SMOOTHING = 0.2
+LONG_SMOOTHING = 0.02
+
+
+class AdaptiveLimiter:
+    """
+    Limit on API requests in flight, adjusted by additive increase / multiplicative decrease.
+
+    Every answered request whose recent average latency stays within
+    latency_tolerance times the long-term average raises the limit by 1/limit,
+    so a full window of successes adds one slot. A rate limit,
+    server error or timeout (`on_overload`), or a recent latency above the
+    tolerance, multiplies the limit by backoff. Decreases are applied at most
+    once per recent latency, so a burst of 429s from one window of requests
+    halves the limit once instead of collapsing it to the minimum.
+
+    With adaptive off the limit stays at `initial`. on_change(limit, reason) is
+    called whenever the whole-number limit changes.
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 16, adaptive: bool = True,
+                 backoff: float = 0.5, latency_tolerance: float = 2.0):
+        self.adaptive = adaptive
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.backoff = min(0.95, max(0.1, backoff))
+        self.latency_tolerance = max(1.1, latency_tolerance)
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.in_flight = 0
+        self.on_change: Optional[Callable[[int, str], None]] = None
+        self._samples = 0
+        self._recent: Optional[float] = None
+        self._long_term: Optional[float] = None
+        self._last_decrease = float("-inf")
+        # Threads waiting for a slot, served first come first served
+        self._waiters: Deque[object] = deque()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config) -> "AdaptiveLimiter":
+        try:
+            initial = int(config.get("max_concurrent_requests", 4))
+            max_limit = int(config.get("concurrency_max", 16))
+        except (TypeError, ValueError):
+            initial, max_limit = 4, 16
+        return cls(initial=initial, max_limit=max(initial, max_limit),
+                   adaptive=bool(config.get("adaptive_concurrency", True)))
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def ceiling(self) -> int:
+        """The most requests that can ever be in flight, for sizing thread and connection pools"""
+        return self.max_limit if self.adaptive else self.limit
+
+    def acquire(self, cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """Wait for a free slot; False if cancelled() turned true while waiting"""
+        with self._cond:
+            if not self._waiters and self.in_flight < self.limit:
+                self.in_flight += 1
+                return True
+            waiter = object()
+            self._waiters.append(waiter)
+            try:
+                while self._waiters[0] is not waiter or self.in_flight >= self.limit:
+                    if cancelled and cancelled():
+                        return False
+                    self._cond.wait(0.2)
+                self.in_flight += 1
+                return True
+            finally:
+                self._waiters.remove(waiter)
+                self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float):
+        """Record an answered request and grow the limit unless latency is rising"""
+        if not self.adaptive:
+            return
+        with self._cond:
+            self._samples += 1
+            if self._recent is None:
+                self._recent = self._long_term = latency
+            else:
+                self._recent += SHORT_SMOOTHING * (latency - self._recent)
+                self._long_term += LONG_SMOOTHING * (latency - self._long_term)
+            if (self._samples >= MIN_LATENCY_SAMPLES
+                    and self._recent > self.latency_tolerance * self._long_term):
+                self._decrease("latency")
+            else:
+                self._set(min(float(self.max_limit), self._limit + 1 / self._limit), "increase")
+
+    def on_overload(self, reason: str):
+        """Back off after a rate limit, server error or timeout"""
+        if not self.adaptive:
+            return
+        with self._cond:
+            self._decrease(reason)
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self._last_decrease < (self._recent or 1.0):
+            return
+        self._last_decrease = now
+        self._set(max(float(self.min_limit), math.floor(self._limit * self.backoff)), reason)
+
+    def _set(self, limit: float, reason: str):
+        before = self.limit
+        self._limit = limit
+        if self.limit != before:
+            self._cond.notify_all()
+            if self.on_change:
+                self.on_change(self.limit, reason)
@@ -1,16 +1,27 @@
 import json
 import os
+import tempfile
 from aqt import mw
 from aqt.qt import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QGroupBox,
                      QLabel, QLineEdit, QComboBox, QTextEdit, QPushButton,
-                     QCheckBox, QFrame)
+                     QCheckBox, QFrame, QSpinBox, QDoubleSpinBox, QTimer)
 from aqt.utils import showInfo
+from .catalog import get_catalog
+from .instrumentation import LOG_LEVELS, DEFAULT_LOG_LEVEL, configure_logging, logger
+
+# Delay before pending changes are written, so bursts of set() calls cost one write
+FLUSH_DELAY_MS = 1000
 
 class AICardCreatorConfig:
     def __init__(self):
         self.addon_path = os.path.dirname(__file__)
         self.config_path = os.path.join(self.addon_path, "config.json")
         self.config = self.load_config()
+        configure_logging(self.config.get("log_level", DEFAULT_LOG_LEVEL))
+        self.dirty = False
+        self._flush_timer = QTimer()
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.timeout.connect(self.flush)
         
     def load_config(self):
         try:
@@ -18,25 +29,79 @@ class AICardCreatorConfig:
                 return json.load(f)
         except Exception as e:
             # Don't show dialog during initialization, just use defaults
-            print(f"AI Card Creator: Failed to load config: {str(e)}")
+            logger.warning(f"Failed to load config: {str(e)}")
             return self.get_default_config()
     
     def save_config(self):
+        """Write the config now (atomically: temp file, fsync, rename)"""
+        self._flush_timer.stop()
+        tmp_path = None
         try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
+            fd, tmp_path = tempfile.mkstemp(prefix=".config.", suffix=".tmp", dir=self.addon_path)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
                 json.dump(self.config, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_path)
+            tmp_path = None
+            self.dirty = False
         except Exception as e:
             showInfo(f"Failed to save config: {str(e)}")
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def flush(self):
+        """Write pending changes, if any"""
+        if self.dirty:
+            self.save_config()
     
     def get_default_config(self):
         return {
             "api_key": "",
             "api_base_url": "https://openrouter.ai/api/v1",
             "model": "google/gemini-2.5-flash",
+            "max_concurrent_requests": 4,
+            "adaptive_concurrency": True,
+            "concurrency_max": 16,
+            "batch_size": 1,
+            "batch_max_tokens": 8000,
+            "tokens_per_card": 800,
+            "adaptive_max_tokens": True,
+            "prompt_caching": True,
+            "stream_responses": True,
+            "stream_idle_timeout": 15,
+            "cache_enabled": True,
+            "cache_max_entries": 5000,
+            "cache_max_age_days": 30,
+            "kanji_memo_enabled": True,
+            "kanji_memo_field": "한자",
+            "dictionary_path": "",
+            "dictionary_fields": {"요미가나": "reading", "영어": "english", "품사": "pos"},
+            "retry_max_attempts": 4,
+            "retry_base_delay": 1.0,
+            "retry_max_delay": 30,
+            "retry_deadline": 120,
+            "import_chunk_size": 200,
+            "speculative_generation": False,
+            "speculative_delay_ms": 800,
+            "speculative_max_words": 10,
+            "hedge_enabled": True,
+            "hedge_percentile": 95,
+            "hedge_min_delay": 1.0,
+            "hedge_max_delay": 10.0,
+            "hedge_max_extra_ratio": 0.1,
+            "fallback_model": "",
+            "log_level": "INFO",
+            "prompt_price_per_million": 0.0,
+            "completion_price_per_million": 0.0,
             "default_deck": "Default",
             "default_note_type": "Basic",
             "prompt_template": "Generate Anki card for: {word}",
             "field_mappings": {},
+            "list_formatting": {"일본어": {"의미": {"separator": "\n", "prefix": "• "}}},
+            "field_schemas": {"일본어": {"단어": "text", "요미가나": "text", "의미": "text", "영어": "text",
+                                      "예문": "text", "한자": "text", "메모": "text", "품사": "text"}},
             "window_position": {"x": 100, "y": 100}
         }
     
@@ -44,8 +109,19 @@ class AICardCreatorConfig:
         return self.config.get(key, default)
     
     def set(self, key, value):
-        self.config[key] = value
-        self.save_config()
+        """Change a value in memory; the write to disk is debounced"""
+        self.update({key: value})
+    
+    def update(self, values, flush=False):
+        """Change several values at once; flush=True writes immediately instead of debouncing"""
+        for key, value in values.items():
+            if self.config.get(key) != value or key not in self.config:
+                self.config[key] = value
+                self.dirty = True
+        if flush:
+            self.flush()
+        elif self.dirty:
+            self._flush_timer.start(FLUSH_DELAY_MS)
     
     def show_settings_dialog(self):
         dialog = SettingsDialog(mw, self)
@@ -76,15 +152,165 @@ class SettingsDialog(QDialog):
         self.model_edit = QLineEdit(self.config.get("model", ""))
         api_layout.addRow("Model:", self.model_edit)
         
+        self.max_concurrent_spin = QSpinBox()
+        self.max_concurrent_spin.setRange(1, 32)
+        self.max_concurrent_spin.setValue(int(self.config.get("max_concurrent_requests", 4)))
+        self.max_concurrent_spin.setToolTip("Number of requests sent to the API at the same time "
+                                            "(the starting point when adaptive concurrency is on)")
+        api_layout.addRow("Max Concurrent Requests:", self.max_concurrent_spin)
+        
+        self.adaptive_concurrency_check = QCheckBox("Adjust to rate limits and latency")
+        self.adaptive_concurrency_check.setChecked(bool(self.config.get("adaptive_concurrency", True)))
+        self.adaptive_concurrency_check.setToolTip("Raise the number of concurrent requests while answers stay fast, "
+                                                   "back off on rate limits, server errors and slowdowns")
+        api_layout.addRow("Adaptive Concurrency:", self.adaptive_concurrency_check)
+        
+        self.concurrency_max_spin = QSpinBox()
+        self.concurrency_max_spin.setRange(1, 64)
+        self.concurrency_max_spin.setValue(int(self.config.get("concurrency_max", 16)))
+        self.concurrency_max_spin.setToolTip("Upper bound for adaptive concurrency")
+        api_layout.addRow("Concurrency Ceiling:", self.concurrency_max_spin)
+        
+        self.batch_size_spin = QSpinBox()
+        self.batch_size_spin.setRange(1, 50)
+        self.batch_size_spin.setValue(int(self.config.get("batch_size", 1)))
+        self.batch_size_spin.setToolTip("Words generated per API request (1 = one request per word). "
+                                        "Capped so the expected output fits in batch_max_tokens.")
+        api_layout.addRow("Words per Request:", self.batch_size_spin)
+        
+        self.stream_check = QCheckBox("Stream responses (show fields as soon as they arrive)")
+        self.stream_check.setChecked(bool(self.config.get("stream_responses", True)))
+        api_layout.addRow("Streaming:", self.stream_check)
+        
+        self.prompt_caching_check = QCheckBox("Mark the shared prompt as cacheable (Anthropic, Gemini)")
+        self.prompt_caching_check.setChecked(bool(self.config.get("prompt_caching", True)))
+        self.prompt_caching_check.setToolTip("Repeated prompt instructions are billed at the cached-token price")
+        api_layout.addRow("Prompt Caching:", self.prompt_caching_check)
+        
+        self.stream_idle_spin = QSpinBox()
+        self.stream_idle_spin.setRange(5, 120)
+        self.stream_idle_spin.setSuffix(" s")
+        self.stream_idle_spin.setValue(int(self.config.get("stream_idle_timeout", 15)))
+        self.stream_idle_spin.setToolTip("Abort a streamed response after this many seconds without new data")
+        api_layout.addRow("Stream Idle Timeout:", self.stream_idle_spin)
+        
         api_group.setLayout(api_layout)
         layout.addWidget(api_group)
         
+        # Retry Settings
+        retry_group = QGroupBox("Retries")
+        retry_layout = QFormLayout()
+        
+        self.retry_attempts_spin = QSpinBox()
+        self.retry_attempts_spin.setRange(1, 10)
+        self.retry_attempts_spin.setValue(int(self.config.get("retry_max_attempts", 4)))
+        self.retry_attempts_spin.setToolTip("Attempts per word for rate limits (429), server errors and timeouts")
+        retry_layout.addRow("Max Attempts:", self.retry_attempts_spin)
+        
+        self.retry_deadline_spin = QSpinBox()
+        self.retry_deadline_spin.setRange(10, 600)
+        self.retry_deadline_spin.setSuffix(" s")
+        self.retry_deadline_spin.setValue(int(self.config.get("retry_deadline", 120)))
+        self.retry_deadline_spin.setToolTip("Stop retrying a word once this much time has passed")
+        retry_layout.addRow("Deadline per Word:", self.retry_deadline_spin)
+        
+        self.hedge_check = QCheckBox("Send a duplicate request when an answer is unusually slow")
+        self.hedge_check.setChecked(bool(self.config.get("hedge_enabled", True)))
+        retry_layout.addRow("Hedging:", self.hedge_check)
+        
+        self.hedge_percentile_spin = QSpinBox()
+        self.hedge_percentile_spin.setRange(50, 99)
+        self.hedge_percentile_spin.setSuffix(" %")
+        self.hedge_percentile_spin.setValue(int(self.config.get("hedge_percentile", 95)))
+        self.hedge_percentile_spin.setToolTip("Hedge once a request is slower than this percentile of recent requests")
+        retry_layout.addRow("Hedge After Percentile:", self.hedge_percentile_spin)
+        
+        self.hedge_ratio_spin = QSpinBox()
+        self.hedge_ratio_spin.setRange(1, 100)
+        self.hedge_ratio_spin.setSuffix(" %")
+        self.hedge_ratio_spin.setValue(int(round(float(self.config.get("hedge_max_extra_ratio", 0.1)) * 100)))
+        self.hedge_ratio_spin.setToolTip("At most this share of a run's requests may be duplicated (extra cost cap)")
+        retry_layout.addRow("Max Extra Requests:", self.hedge_ratio_spin)
+        
+        self.fallback_model_edit = QLineEdit(self.config.get("fallback_model", ""))
+        self.fallback_model_edit.setPlaceholderText("Same as Model")
+        self.fallback_model_edit.setToolTip("Model used for hedged requests, e.g. openai/gpt-4o-mini")
+        retry_layout.addRow("Fallback Model:", self.fallback_model_edit)
+        
+        retry_group.setLayout(retry_layout)
+        layout.addWidget(retry_group)
+        
+        # Cache Settings
+        cache_group = QGroupBox("Response Cache")
+        cache_layout = QFormLayout()
+        
+        self.cache_enabled_check = QCheckBox("Reuse previously generated cards (same word, model and prompt)")
+        self.cache_enabled_check.setChecked(bool(self.config.get("cache_enabled", True)))
+        cache_layout.addRow("Cache:", self.cache_enabled_check)
+        
+        self.cache_max_entries_spin = QSpinBox()
+        self.cache_max_entries_spin.setRange(100, 1000000)
+        self.cache_max_entries_spin.setSingleStep(1000)
+        self.cache_max_entries_spin.setValue(int(self.config.get("cache_max_entries", 5000)))
+        cache_layout.addRow("Max Entries:", self.cache_max_entries_spin)
+        
+        self.cache_max_age_spin = QSpinBox()
+        self.cache_max_age_spin.setRange(1, 3650)
+        self.cache_max_age_spin.setSuffix(" days")
+        self.cache_max_age_spin.setValue(int(self.config.get("cache_max_age_days", 30)))
+        cache_layout.addRow("Max Age:", self.cache_max_age_spin)
+        
+        self.kanji_memo_check = QCheckBox("Fill the 한자 field from kanji seen before instead of generating it")
+        self.kanji_memo_check.setChecked(bool(self.config.get("kanji_memo_enabled", True)))
+        self.kanji_memo_check.setToolTip("Korean readings are learned per kanji from generated cards; "
+                                         "words whose kanji are all known skip the field in the request")
+        cache_layout.addRow("Kanji Memo:", self.kanji_memo_check)
+        
+        self.dictionary_path_edit = QLineEdit(self.config.get("dictionary_path", ""))
+        self.dictionary_path_edit.setPlaceholderText("JMdict_e(.gz) or jmdict-eng-*.json - empty to disable")
+        self.dictionary_path_edit.setToolTip("요미가나, 영어 and 품사 of unambiguous words are taken from this "
+                                             "dictionary instead of generated. It is indexed once on the next run.")
+        cache_layout.addRow("Dictionary File:", self.dictionary_path_edit)
+        
+        cache_group.setLayout(cache_layout)
+        layout.addWidget(cache_group)
+        
+        # Logging & Usage Settings
+        usage_group = QGroupBox("Logging && Usage")
+        usage_layout = QFormLayout()
+        
+        self.log_level_combo = QComboBox()
+        self.log_level_combo.addItems(LOG_LEVELS)
+        log_level = str(self.config.get("log_level", DEFAULT_LOG_LEVEL)).upper()
+        self.log_level_combo.setCurrentText(log_level if log_level in LOG_LEVELS else DEFAULT_LOG_LEVEL)
+        self.log_level_combo.setToolTip("Detail of the messages written to Anki's debug console")
+        usage_layout.addRow("Log Level:", self.log_level_combo)
+        
+        self.prompt_price_spin = QDoubleSpinBox()
+        self.prompt_price_spin.setRange(0, 1000)
+        self.prompt_price_spin.setDecimals(3)
+        self.prompt_price_spin.setPrefix("$")
+        self.prompt_price_spin.setValue(float(self.config.get("prompt_price_per_million", 0.0)))
+        self.prompt_price_spin.setToolTip("Used to estimate the cost of a run when the API doesn't report it "
+                                          "(0 = don't estimate)")
+        usage_layout.addRow("Input Price / 1M Tokens:", self.prompt_price_spin)
+        
+        self.completion_price_spin = QDoubleSpinBox()
+        self.completion_price_spin.setRange(0, 1000)
+        self.completion_price_spin.setDecimals(3)
+        self.completion_price_spin.setPrefix("$")
+        self.completion_price_spin.setValue(float(self.config.get("completion_price_per_million", 0.0)))
+        usage_layout.addRow("Output Price / 1M Tokens:", self.completion_price_spin)
+        
+        usage_group.setLayout(usage_layout)
+        layout.addWidget(usage_group)
+        
         # Card Settings
         card_group = QGroupBox("Card Settings")
         card_layout = QFormLayout()
         
         self.deck_combo = QComboBox()
-        decks = [d["name"] for d in mw.col.decks.all()]
+        decks = get_catalog().deck_names()
         self.deck_combo.addItems(decks)
         current_deck = self.config.get("default_deck", "Default")
         if current_deck in decks:
@@ -92,7 +318,7 @@ class SettingsDialog(QDialog):
         card_layout.addRow("Default Deck:", self.deck_combo)
         
         self.note_type_combo = QComboBox()
-        note_types = [m["name"] for m in mw.col.models.all()]
+        note_types = get_catalog().note_type_names()
         self.note_type_combo.addItems(note_types)
         current_note_type = self.config.get("default_note_type", "Basic")
         if current_note_type in note_types:
@@ -135,12 +361,36 @@ class SettingsDialog(QDialog):
         self.setLayout(layout)
     
     def save_settings(self):
-        self.config.set("api_key", self.api_key_edit.text())
-        self.config.set("api_base_url", self.api_base_url_edit.text())
-        self.config.set("model", self.model_edit.text())
-        self.config.set("default_deck", self.deck_combo.currentText())
-        self.config.set("default_note_type", self.note_type_combo.currentText())
-        self.config.set("prompt_template", self.prompt_edit.toPlainText())
+        self.config.update({
+            "api_key": self.api_key_edit.text(),
+            "api_base_url": self.api_base_url_edit.text(),
+            "model": self.model_edit.text(),
+            "max_concurrent_requests": self.max_concurrent_spin.value(),
+            "adaptive_concurrency": self.adaptive_concurrency_check.isChecked(),
+            "concurrency_max": self.concurrency_max_spin.value(),
+            "batch_size": self.batch_size_spin.value(),
+            "stream_responses": self.stream_check.isChecked(),
+            "prompt_caching": self.prompt_caching_check.isChecked(),
+            "stream_idle_timeout": self.stream_idle_spin.value(),
+            "retry_max_attempts": self.retry_attempts_spin.value(),
+            "retry_deadline": self.retry_deadline_spin.value(),
+            "hedge_enabled": self.hedge_check.isChecked(),
+            "hedge_percentile": self.hedge_percentile_spin.value(),
+            "hedge_max_extra_ratio": self.hedge_ratio_spin.value() / 100,
+            "fallback_model": self.fallback_model_edit.text().strip(),
+            "cache_enabled": self.cache_enabled_check.isChecked(),
+            "cache_max_entries": self.cache_max_entries_spin.value(),
+            "cache_max_age_days": self.cache_max_age_spin.value(),
+            "kanji_memo_enabled": self.kanji_memo_check.isChecked(),
+            "dictionary_path": self.dictionary_path_edit.text().strip(),
+            "log_level": self.log_level_combo.currentText(),
+            "prompt_price_per_million": self.prompt_price_spin.value(),
+            "completion_price_per_million": self.completion_price_spin.value(),
+            "default_deck": self.deck_combo.currentText(),
+            "default_note_type": self.note_type_combo.currentText(),
+            "prompt_template": self.prompt_edit.toPlainText(),
+        }, flush=True)
+        configure_logging(self.log_level_combo.currentText())
         
         showInfo("Settings saved successfully!")
         self.accept()
\ No newline at end of file
@@ -0,0 +1,329 @@
+import gzip
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .instrumentation import logger
+from .kanji_memo import kanji_of
+
+INDEX_FILENAME = "dictionary.idx"
+
+# Index layout: header, a table of key offsets sorted by key, then keys and entries.
+# Header: magic, key count, source mtime and size (to notice a changed source file)
+INDEX_MAGIC = b"JMDXIDX1"
+HEADER = struct.Struct("<8sIdQ")
+KEY_OFFSET = struct.Struct("<I")
+KEY_LENGTH = struct.Struct("<H")
+ENTRY_COUNT = struct.Struct("<B")
+ENTRY_LENGTH = struct.Struct("<I")
+
+# Priority tags that mark a common word, as in jmdict-simplified
+COMMON_PRIORITIES = {"news1", "ichi1", "spec1", "spec2", "gai1"}
+# Senses and glosses per sense kept in the index
+MAX_SENSES = 3
+MAX_GLOSSES = 4
+
+# Custom entities of the JMdict DTD (&n;, &adj-na;, ...) are kept as their names
+ENTITY_PATTERN = re.compile(r"&(?!(?:amp|lt|gt|quot|apos|#\d+|#x[0-9a-fA-F]+);)([\w-]+);")
+
+# AI field -> what the dictionary fills it with
+DEFAULT_DICTIONARY_FIELDS = {"요미가나": "reading", "영어": "english", "품사": "pos"}
+
+# JMdict part-of-speech codes -> labels for the 품사 field; unlisted codes
+# (vi, vt, unc, ...) don't describe the part of speech on their own
+POS_LABELS = {
+    "n": "명사", "n-adv": "명사", "n-t": "명사", "n-pref": "명사", "n-suf": "명사",
+    "pn": "대명사", "num": "수사", "ctr": "조수사",
+    "adv": "부사", "adv-to": "부사",
+    "adj-i": "い형용사", "adj-ix": "い형용사", "adj-na": "な형용사", "adj-no": "の형용사",
+    "adj-t": "タル형용사", "adj-pn": "연체사", "adj-f": "연체사",
+    "v1": "동사 (1단)", "v1-s": "동사 (1단)", "vk": "동사 (カ행 변격)",
+    "vs": "する동사", "vs-i": "동사 (する)", "vs-s": "동사 (する)", "vz": "동사 (ずる)",
+    "exp": "표현", "int": "감동사", "conj": "접속사", "prt": "조사",
+    "aux": "조동사", "aux-v": "조동사", "cop": "조동사", "aux-adj": "보조형용사",
+    "pref": "접두사", "suf": "접미사",
+}
+
+
+def pos_label(code: str) -> Optional[str]:
+    if code.startswith("v5"):
+        return "동사 (5단)"
+    return POS_LABELS.get(code)
+
+
+def _compact_entry(readings: List[List[Any]], senses: List[Tuple[List[str], List[str]]],
+                   common: bool) -> Dict[str, Any]:
+    """Entry as stored in the index: readings with their kanji restriction, glosses, POS codes"""
+    pos: List[str] = []
+    for codes, _ in senses[:MAX_SENSES]:
+        pos.extend(code for code in codes if code not in pos)
+    return {
+        "r": readings,
+        "g": [glosses[:MAX_GLOSSES] for _, glosses in senses[:MAX_SENSES] if glosses],
+        "p": pos,
+        "c": 1 if common else 0,
+    }
+
+
+def iter_jmdict_xml(path: str) -> Iterator[Tuple[List[str], Dict[str, Any]]]:
+    """(surface forms, entry) for each entry of a JMdict XML file (optionally .gz)"""
+    opener = gzip.open if path.endswith(".gz") else open
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    in_doctype = False
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            # The internal DTD only declares entities, which are kept as names below
+            if in_doctype:
+                in_doctype = not line.lstrip().startswith("]>")
+                continue
+            if line.startswith("<!DOCTYPE"):
+                in_doctype = "[" in line and "]>" not in line
+                continue
+            parser.feed(ENTITY_PATTERN.sub(r"\1", line))
+            for event, elem in parser.read_events():
+                if event == "start":
+                    if root is None:
+                        root = elem
+                    continue
+                if elem.tag != "entry":
+                    continue
+                yield _xml_entry(elem)
+                root.clear()
+
+
+def _xml_entry(elem: ET.Element) -> Tuple[List[str], Dict[str, Any]]:
+    kanji = [k_ele.findtext("keb", "") for k_ele in elem.iter("k_ele")]
+    common = any(pri.text in COMMON_PRIORITIES for pri in elem.iter("ke_pri"))
+    readings = []
+    for r_ele in elem.iter("r_ele"):
+        common = common or any(pri.text in COMMON_PRIORITIES for pri in r_ele.iter("re_pri"))
+        if r_ele.find("re_nokanji") is not None:
+            restriction = []
+        else:
+            restriction = [restr.text for restr in r_ele.iter("re_restr")] or None
+        readings.append([r_ele.findtext("reb", ""), restriction])
+
+    senses = []
+    pos: List[str] = []
+    for sense in elem.iter("sense"):
+        # A sense without <pos> has the part of speech of the one before
+        pos = [p.text.strip() for p in sense.iter("pos") if p.text] or pos
+        glosses = [gloss.text for gloss in sense.iter("gloss")
+                   if gloss.text and gloss.get("{http://www.w3.org/XML/1998/namespace}lang", "eng") == "eng"]
+        senses.append((pos, glosses))
+    forms = kanji + [reading for reading, _ in readings]
+    return forms, _compact_entry(readings, senses, common)
+
+
+def iter_jmdict_json(path: str) -> Iterator[Tuple[List[str], Dict[str, Any]]]:
+    """(surface forms, entry) for each word of a jmdict-simplified JSON file"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    for word in data.get("words", []):
+        kanji = [k["text"] for k in word.get("kanji", [])]
+        common = any(form.get("common") for form in word.get("kanji", []) + word.get("kana", []))
+        readings = []
+        for kana in word.get("kana", []):
+            applies = kana.get("appliesToKanji", ["*"])
+            readings.append([kana["text"], None if "*" in applies else applies])
+        senses = [(sense.get("partOfSpeech", []),
+                   [gloss["text"] for gloss in sense.get("gloss", []) if gloss.get("lang", "eng") == "eng"])
+                  for sense in word.get("sense", [])]
+        forms = kanji + [reading for reading, _ in readings]
+        yield forms, _compact_entry(readings, senses, common)
+
+
+def compile_dictionary(source_path: str, index_path: str) -> int:
+    """
+    Compile a JMdict XML or jmdict-simplified JSON file (.gz allowed) into the
+    index format read by DictionaryIndex. Returns the number of surface forms.
+    """
+    is_json = source_path.endswith((".json", ".json.gz"))
+    entries = iter_jmdict_json(source_path) if is_json else iter_jmdict_xml(source_path)
+
+    # Each entry is stored once; surface forms point at their entries, common ones first
+    blobs: List[bytes] = []
+    keys: Dict[bytes, List[int]] = {}
+    common: List[bool] = []
+    for forms, entry in entries:
+        index = len(blobs)
+        blobs.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        common.append(bool(entry["c"]))
+        for form in dict.fromkeys(forms):
+            if form:
+                keys.setdefault(form.encode("utf-8"), []).append(index)
+
+    stat = os.stat(source_path)
+    sorted_keys = sorted(keys)
+    table_end = HEADER.size + KEY_OFFSET.size * len(sorted_keys)
+    entry_offsets = []
+    offset = table_end + sum(KEY_LENGTH.size + len(key) + ENTRY_COUNT.size
+                             + KEY_OFFSET.size * min(255, len(keys[key])) for key in sorted_keys)
+    for blob in blobs:
+        entry_offsets.append(offset)
+        offset += ENTRY_LENGTH.size + len(blob)
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(INDEX_MAGIC, len(sorted_keys), stat.st_mtime, stat.st_size))
+        key_offset = table_end
+        for key in sorted_keys:
+            f.write(KEY_OFFSET.pack(key_offset))
+            key_offset += (KEY_LENGTH.size + len(key) + ENTRY_COUNT.size
+                           + KEY_OFFSET.size * min(255, len(keys[key])))
+        for key in sorted_keys:
+            indexes = sorted(keys[key], key=lambda i: not common[i])[:255]
+            f.write(KEY_LENGTH.pack(len(key)) + key + ENTRY_COUNT.pack(len(indexes)))
+            f.write(b"".join(KEY_OFFSET.pack(entry_offsets[i]) for i in indexes))
+        for blob in blobs:
+            f.write(ENTRY_LENGTH.pack(len(blob)) + blob)
+    os.replace(tmp_path, index_path)
+    return len(sorted_keys)
+
+
+class DictionaryIndex:
+    """
+    Read-only, memory-mapped dictionary compiled by compile_dictionary().
+
+    A lookup is a binary search over the sorted key table followed by decoding
+    the word's entries, so nothing but the pages touched is read from disk.
+    `prefill()` turns an unambiguous lookup into card fields. Lookups may run
+    on several threads; `close()` waits for the running ones.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        # Lookups in progress, so close() doesn't unmap the index under them
+        self._readers = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._file = open(index_path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._file.close()
+            raise
+        magic, self.count, self.source_mtime, self.source_size = HEADER.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"{index_path} is not a dictionary index")
+
+    def is_current(self, source_path: str) -> bool:
+        """Whether the index was compiled from the source file as it is now"""
+        stat = os.stat(source_path)
+        return stat.st_size == self.source_size and stat.st_mtime == self.source_mtime
+
+    def _key_at(self, position: int) -> Tuple[bytes, int]:
+        (offset,) = KEY_OFFSET.unpack_from(self._map, HEADER.size + KEY_OFFSET.size * position)
+        (length,) = KEY_LENGTH.unpack_from(self._map, offset)
+        start = offset + KEY_LENGTH.size
+        return self._map[start:start + length], start + length
+
+    def lookup(self, word: str) -> List[Dict[str, Any]]:
+        """Entries for a surface form (kanji or kana), common words first; none once closed"""
+        with self._condition:
+            if self._closed:
+                return []
+            self._readers += 1
+        try:
+            return self._lookup(word)
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    def _lookup(self, word: str) -> List[Dict[str, Any]]:
+        key = word.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low >= self.count:
+            return []
+        found, offset = self._key_at(low)
+        if found != key:
+            return []
+        (count,) = ENTRY_COUNT.unpack_from(self._map, offset)
+        offset += ENTRY_COUNT.size
+        entries = []
+        for i in range(count):
+            (entry_offset,) = KEY_OFFSET.unpack_from(self._map, offset + KEY_OFFSET.size * i)
+            (length,) = ENTRY_LENGTH.unpack_from(self._map, entry_offset)
+            start = entry_offset + ENTRY_LENGTH.size
+            entries.append(json.loads(self._map[start:start + length].decode("utf-8")))
+        return entries
+
+    def prefill(self, word: str, fields: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        Card fields the dictionary can fill for the word ({AI field: kind}, see
+        DEFAULT_DICTIONARY_FIELDS). Empty unless the word has a single entry, or
+        a single common one - homographs are left to the model.
+        """
+        entries = self.lookup(word)
+        candidates = [entry for entry in entries if entry["c"]] or entries
+        if len(candidates) != 1:
+            return {}
+        entry = candidates[0]
+
+        values = {}
+        if kanji_of(word):
+            values["reading"] = next((reading for reading, restriction in entry["r"]
+                                      if restriction is None or word in restriction), None)
+        else:
+            values["reading"] = word
+        if entry["g"]:
+            values["english"] = "; ".join(", ".join(glosses) for glosses in entry["g"])
+        labels = [pos_label(code) for code in entry["p"]]
+        labels = list(dict.fromkeys(label for label in labels if label))
+        if labels:
+            values["pos"] = ", ".join(labels)
+
+        fields = fields or DEFAULT_DICTIONARY_FIELDS
+        return {field: values[kind] for field, kind in fields.items() if values.get(kind)}
+
+    def close(self):
+        """Unmap the index once no lookup is using it"""
+        with self._condition:
+            self._closed = True
+            while self._readers:
+                self._condition.wait()
+        self._map.close()
+        self._file.close()
+
+
+def open_dictionary(config, addon_path: str) -> Optional[DictionaryIndex]:
+    """
+    The index for the dictionary_path file, compiled first if it doesn't exist
+    yet or the file changed since. None if no dictionary is configured.
+    """
+    source_path = config.get("dictionary_path", "")
+    if not source_path:
+        return None
+    if not os.path.exists(source_path):
+        logger.warning(f"Dictionary file not found: {source_path}")
+        return None
+    index_path = os.path.join(addon_path, INDEX_FILENAME)
+    try:
+        if os.path.exists(index_path):
+            index = DictionaryIndex(index_path)
+            if index.is_current(source_path):
+                return index
+            index.close()
+        logger.info(f"Compiling dictionary index from {source_path} (only needed once)")
+        count = compile_dictionary(source_path, index_path)
+        logger.info(f"Dictionary index ready: {count:,} words")
+        return DictionaryIndex(index_path)
+    except Exception as e:
+        logger.warning(f"Failed to open dictionary: {str(e)}")
+        return None
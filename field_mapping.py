@@ -0,0 +1,62 @@
+from typing import Any, Dict, Tuple
+
+from .instrumentation import logger
+
+# Used when config.json predates the list_formatting setting
+DEFAULT_LIST_FORMATTING = {"일본어": {"의미": {"separator": "\n", "prefix": "• "}}}
+
+
+class FieldMappingPlan:
+    """
+    Precomputed way of turning AI fields into note fields for one note type.
+
+    Every AI key that names a note field (directly or through `field_mappings`
+    in config.json) is resolved to the field's index once, together with the
+    list formatting rule from `list_formatting`, so filling a note is a dict
+    lookup and an index assignment per field.
+    """
+    
+    def __init__(self, note_type_name: str, field_index: Dict[str, int],
+                 list_rules: Dict[str, Tuple[str, str]]):
+        self.note_type_name = note_type_name
+        self.field_index = field_index
+        self.list_rules = list_rules
+        
+    @classmethod
+    def build(cls, model: Dict[str, Any], config) -> "FieldMappingPlan":
+        note_type_name = model["name"]
+        field_names = [field["name"] for field in model["flds"]]
+        field_index = {name: index for index, name in enumerate(field_names)}
+        
+        # AI keys equal to a note field name map directly; field_mappings can
+        # additionally route another key to a note field (e.g. {"단어": "Front"})
+        field_mappings = config.get("field_mappings", {}).get(note_type_name, {})
+        for ai_field, note_field in field_mappings.items():
+            if note_field in field_index:
+                field_index.setdefault(ai_field, field_index[note_field])
+        
+        list_formatting = config.get("list_formatting", DEFAULT_LIST_FORMATTING)
+        list_rules = {}
+        for ai_field, rule in list_formatting.get(note_type_name, {}).items():
+            list_rules[ai_field] = (rule.get("separator", "\n"), rule.get("prefix", ""))
+        
+        logger.debug(f"Built field mapping for '{note_type_name}': {field_names}")
+        return cls(note_type_name, field_index, list_rules)
+    
+    def format_value(self, ai_field: str, value: Any) -> str:
+        if isinstance(value, list):
+            separator, prefix = self.list_rules.get(ai_field, ("\n", ""))
+            return separator.join(f"{prefix}{item}" for item in value)
+        return str(value)
+    
+    def apply(self, note, fields_data: Dict[str, Any]) -> bool:
+        """Fill the note in place; returns True if at least one field was filled"""
+        fields_filled = False
+        fields = note.fields
+        for ai_field, value in fields_data.items():
+            index = self.field_index.get(ai_field)
+            if index is None:
+                continue
+            fields[index] = self.format_value(ai_field, value)
+            fields_filled = True
+        return fields_filled
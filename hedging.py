@@ -0,0 +1,120 @@
+import threading
+from collections import deque
+from concurrent.futures import Executor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+# Below this many samples the percentile isn't trusted and max_delay is used
+MIN_SAMPLES = 10
+
+
+class LatencyTracker:
+    """Latencies of the most recent answered requests, kept separately per request kind"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[Hashable, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Hashable, seconds: float):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key: Hashable, percentile: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, max(0, round(percentile / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+class HedgePolicy:
+    """
+    When to send a duplicate ("hedge") of a slow request.
+
+    A hedge is fired once a request has been outstanding longer than the given
+    percentile of recent latencies (clamped to [min_delay, max_delay]), and
+    only while hedges stay below max_extra_ratio of all requests in the run.
+    The hedge goes to fallback_model if one is configured.
+    """
+
+    def __init__(self, enabled: bool = True, percentile: float = 95, min_delay: float = 1.0,
+                 max_delay: float = 10.0, max_extra_ratio: float = 0.1, fallback_model: str = ""):
+        self.enabled = enabled
+        self.percentile = min(99.9, max(50.0, percentile))
+        self.min_delay = max(0.0, min_delay)
+        self.max_delay = max(self.min_delay, max_delay)
+        self.max_extra_ratio = max(0.0, max_extra_ratio)
+        self.fallback_model = fallback_model
+
+    @classmethod
+    def from_config(cls, config) -> "HedgePolicy":
+        return cls(
+            enabled=bool(config.get("hedge_enabled", True)),
+            percentile=float(config.get("hedge_percentile", 95)),
+            min_delay=float(config.get("hedge_min_delay", 1.0)),
+            max_delay=float(config.get("hedge_max_delay", 10.0)),
+            max_extra_ratio=float(config.get("hedge_max_extra_ratio", 0.1)),
+            fallback_model=str(config.get("fallback_model", "") or ""),
+        )
+
+    def delay(self, tracker: LatencyTracker, key: Hashable) -> float:
+        observed = tracker.percentile(key, self.percentile)
+        if observed is None:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, observed))
+
+
+def run_hedged(primary: Callable[[threading.Event], Any], hedge: Callable[[threading.Event], Any],
+               delay: float, executor: Executor, may_hedge: Callable[[], bool]) -> Tuple[Any, bool]:
+    """
+    Run primary; if it hasn't finished after delay seconds and may_hedge()
+    allows it, run hedge as well and return whichever answers first.
+
+    Both callables get an Event that is set once the other one has won, so a
+    streaming request can stop reading. A None answer or an exception only
+    counts if the other request doesn't answer either; then None is returned
+    or the first exception is raised. Returns (answer, True if hedge won).
+
+    If the executor was shut down (e.g. replaced after a settings change),
+    primary runs on the calling thread instead and no hedge is sent, so
+    primary always runs and can release whatever it holds.
+    """
+    lost = {"primary": threading.Event(), "hedge": threading.Event()}
+    try:
+        first = executor.submit(primary, lost["primary"])
+    except RuntimeError:
+        return primary(lost["primary"]), False
+    done, _ = wait([first], timeout=delay)
+    if done or not may_hedge():
+        return first.result(), False
+
+    try:
+        second = executor.submit(hedge, lost["hedge"])
+    except RuntimeError:
+        return first.result(), False
+    names = {first: "primary", second: "hedge"}
+    pending = {first, second}
+    error = None
+    answered_none = False
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                answer = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            if answer is None:
+                answered_none = True
+                continue
+            for other in pending:
+                lost[names[other]].set()
+            return answer, future is second
+
+    if answered_none or error is None:
+        return None, False
+    raise error
@@ -0,0 +1,105 @@
+import threading
+import time
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class ConnectionStats:
+    """
+    Connection setup timings collected by the pooled session.
+
+    TCP connect and TLS handshake time are recorded for every new connection.
+    The values for the connection opened by the current thread's last request
+    are kept in thread-local storage, so a caller can read the setup cost of
+    its own request (zero when a kept-alive connection was reused).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self.total_connect_time = 0.0
+        self.total_tls_time = 0.0
+
+    def begin_request(self):
+        self._local.connect_time = 0.0
+        self._local.tls_time = 0.0
+        with self._lock:
+            self.requests_sent += 1
+
+    def record_connection(self, connect_time: float, tls_time: float):
+        self._local.connect_time = getattr(self._local, "connect_time", 0.0) + connect_time
+        self._local.tls_time = getattr(self._local, "tls_time", 0.0) + tls_time
+        with self._lock:
+            self.connections_opened += 1
+            self.total_connect_time += connect_time
+            self.total_tls_time += tls_time
+
+    def last_request(self) -> Dict[str, float]:
+        """Connect/TLS seconds spent by the current thread's last request"""
+        return {
+            "connect": getattr(self._local, "connect_time", 0.0),
+            "tls": getattr(self._local, "tls_time", 0.0),
+        }
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests_sent,
+                "connections": self.connections_opened,
+                "reused": max(0, self.requests_sent - self.connections_opened),
+                "connect_time": self.total_connect_time,
+                "tls_time": self.total_tls_time,
+            }
+
+
+def _timed_connection_class(base, stats: ConnectionStats):
+    class TimedConnection(base):
+        def _new_conn(self):
+            start = time.perf_counter()
+            conn = super()._new_conn()
+            self._tcp_time = time.perf_counter() - start
+            return conn
+
+        def connect(self):
+            self._tcp_time = 0.0
+            start = time.perf_counter()
+            super().connect()
+            total = time.perf_counter() - start
+            # Whatever connect() spent after the TCP handshake is TLS (zero for plain HTTP)
+            stats.record_connection(self._tcp_time, max(0.0, total - self._tcp_time))
+
+    TimedConnection.__name__ = f"Timed{base.__name__}"
+    return TimedConnection
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report their setup time to ConnectionStats"""
+
+    def __init__(self, stats: ConnectionStats, pool_maxsize: int):
+        self.stats = stats
+        self._pool_classes = {
+            "http": type("TimedHTTPConnectionPool", (HTTPConnectionPool,),
+                         {"ConnectionCls": _timed_connection_class(HTTPConnection, stats)}),
+            "https": type("TimedHTTPSConnectionPool", (HTTPSConnectionPool,),
+                          {"ConnectionCls": _timed_connection_class(HTTPSConnection, stats)}),
+        }
+        super().__init__(pool_connections=2, pool_maxsize=pool_maxsize)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(self._pool_classes)
+
+
+def create_session(pool_maxsize: int, stats: ConnectionStats) -> requests.Session:
+    """Create a keep-alive session with room for pool_maxsize concurrent connections per host"""
+    session = requests.Session()
+    adapter = PooledAdapter(stats, max(1, pool_maxsize))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
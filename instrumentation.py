@@ -0,0 +1,254 @@
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+LOGGER_NAME = "ai_card_creator"
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+DEFAULT_LOG_LEVEL = "INFO"
+
+# Concurrency limit changes kept per run; older ones only count towards min/max
+CONCURRENCY_HISTORY_SIZE = 200
+
+# Pipeline stages, in the order they run; labels are shown in the window
+STAGES = ("parse", "queue", "network", "json", "mapping", "insert")
+STAGE_LABELS = {
+    "parse": "파싱",
+    "queue": "대기",
+    "network": "네트워크",
+    "json": "JSON",
+    "mapping": "매핑",
+    "insert": "추가",
+}
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+def configure_logging(level_name: str = DEFAULT_LOG_LEVEL):
+    """Send the addon's log records to stdout (Anki's debug console) at the given level"""
+    level = getattr(logging, str(level_name).upper(), None)
+    if not isinstance(level, int):
+        level = logging.INFO
+    logger.setLevel(level)
+    logger.propagate = False
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("AI Card Creator: %(message)s"))
+        logger.addHandler(handler)
+
+
+class RunMetrics:
+    """
+    Timings and token usage for one generation run.
+
+    Time is accumulated per stage with `span()`; stages run concurrently on
+    worker threads (queue, network, json), so their totals are summed across
+    requests and can exceed the run's wall-clock time. Token counts come from
+    the `usage` block of each API response. The cost is the one reported by
+    OpenRouter when present, otherwise it is estimated from the configured
+    per-million-token prices.
+    """
+
+    def __init__(self, model: str = "", prompt_price: float = 0.0, completion_price: float = 0.0):
+        self.model = model
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.stage_totals: Dict[str, float] = {}
+        self.stage_counts: Dict[str, int] = {}
+        self.prompt_tokens = 0
+        # Prompt tokens the provider served from its prompt cache (part of prompt_tokens)
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self.reported_cost = 0.0
+        self.requests_with_usage = 0
+        # API requests sent, hedged duplicates sent (see hedging.py) and hedges that answered first
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        # Responses fixed locally (fences, truncation, wrapping) and follow-up requests for missing fields
+        self.json_repairs = 0
+        self.field_requests = 0
+        # Cards whose 한자 field was assembled from the kanji memo, and cards with
+        # fields taken from the offline dictionary, instead of generated
+        self.kanji_composed = 0
+        self.dictionary_prefills = 0
+        # Concurrency limit changes as (seconds into the run, limit, reason), see concurrency.py
+        self.concurrency_history = deque(maxlen=CONCURRENCY_HISTORY_SIZE)
+        self.concurrency_min: Optional[int] = None
+        self.concurrency_max: Optional[int] = None
+        self.concurrency_decreases = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "RunMetrics":
+        try:
+            prompt_price = float(config.get("prompt_price_per_million", 0.0) or 0.0)
+            completion_price = float(config.get("completion_price_per_million", 0.0) or 0.0)
+        except (TypeError, ValueError):
+            prompt_price = completion_price = 0.0
+        return cls(config.get("model", ""), prompt_price, completion_price)
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + seconds
+            self.stage_counts[stage] = self.stage_counts.get(stage, 0) + 1
+
+    def record_usage(self, usage: Optional[Dict[str, Any]]):
+        """Add the `usage` block of one API response"""
+        if not isinstance(usage, dict):
+            return
+        with self._lock:
+            self.prompt_tokens += int(usage.get("prompt_tokens") or 0)
+            details = usage.get("prompt_tokens_details")
+            if isinstance(details, dict):
+                self.cached_prompt_tokens += int(details.get("cached_tokens") or 0)
+            self.completion_tokens += int(usage.get("completion_tokens") or 0)
+            cost = usage.get("cost")
+            if isinstance(cost, (int, float)):
+                self.reported_cost += cost
+            self.requests_with_usage += 1
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def reserve_hedge(self, max_extra_ratio: float) -> bool:
+        """Count a hedge if that keeps hedges within max_extra_ratio of the requests"""
+        with self._lock:
+            if self.hedges + 1 > max_extra_ratio * max(1, self.requests):
+                return False
+            self.hedges += 1
+            return True
+
+    def record_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def record_json_repair(self):
+        with self._lock:
+            self.json_repairs += 1
+
+    def record_field_request(self):
+        with self._lock:
+            self.field_requests += 1
+
+    def record_kanji_composed(self):
+        with self._lock:
+            self.kanji_composed += 1
+
+    def record_dictionary_prefill(self):
+        with self._lock:
+            self.dictionary_prefills += 1
+
+    def record_concurrency(self, limit: int, reason: str):
+        with self._lock:
+            self.concurrency_history.append((time.monotonic() - self.started, limit, reason))
+            self.concurrency_min = limit if self.concurrency_min is None else min(self.concurrency_min, limit)
+            self.concurrency_max = limit if self.concurrency_max is None else max(self.concurrency_max, limit)
+            if reason not in ("start", "increase"):
+                self.concurrency_decreases += 1
+
+    @property
+    def concurrency_limit(self) -> Optional[int]:
+        """The current limit on requests in flight, None before the run started"""
+        with self._lock:
+            return self.concurrency_history[-1][1] if self.concurrency_history else None
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.monotonic()
+
+    @property
+    def wall_time(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def estimated_cost(self) -> Optional[float]:
+        """Cost in USD, or None when neither OpenRouter nor the config provides prices"""
+        if self.reported_cost:
+            return self.reported_cost
+        if self.prompt_price or self.completion_price:
+            return (self.prompt_tokens * self.prompt_price
+                    + self.completion_tokens * self.completion_price) / 1_000_000
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "model": self.model,
+                "wall_time": self.wall_time,
+                "stages": {stage: {"seconds": self.stage_totals[stage], "count": self.stage_counts[stage]}
+                           for stage in STAGES if stage in self.stage_totals},
+                "prompt_tokens": self.prompt_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cost": self.estimated_cost,
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "json_repairs": self.json_repairs,
+                "field_requests": self.field_requests,
+                "kanji_composed": self.kanji_composed,
+                "dictionary_prefills": self.dictionary_prefills,
+                "concurrency": {
+                    "min": self.concurrency_min,
+                    "max": self.concurrency_max,
+                    "decreases": self.concurrency_decreases,
+                    "history": [{"time": round(at, 3), "limit": limit, "reason": reason}
+                                for at, limit, reason in self.concurrency_history],
+                },
+            }
+
+    def format_summary(self) -> str:
+        """Compact summary for the results view, one line per topic"""
+        snapshot = self.snapshot()
+        stages = " · ".join(f"{STAGE_LABELS.get(stage, stage)} {values['seconds']:.2f}초"
+                            for stage, values in snapshot["stages"].items())
+        text = f"⏱ 전체 {snapshot['wall_time']:.1f}초"
+        if stages:
+            text += f" ({stages})"
+        if self.requests_with_usage:
+            text += f"\n🪙 토큰: 입력 {snapshot['prompt_tokens']:,}"
+            if snapshot["cached_prompt_tokens"]:
+                cached = snapshot["cached_prompt_tokens"]
+                text += (f" (캐시 {cached:,} · 비캐시 {snapshot['prompt_tokens'] - cached:,}, "
+                         f"{cached / max(1, snapshot['prompt_tokens']):.0%} 캐시됨)")
+            text += f" · 출력 {snapshot['completion_tokens']:,}"
+            if snapshot["cost"] is not None:
+                text += f" · 예상 비용 ${snapshot['cost']:.4f}"
+        concurrency = snapshot["concurrency"]
+        limits = [change["limit"] for change in concurrency["history"]]
+        if len(limits) > 1:
+            # Only the turning points, e.g. 4 → 9 → 4 → 7
+            path = [limit for i, limit in enumerate(limits)
+                    if i in (0, len(limits) - 1) or (limit - limits[i - 1]) * (limits[i + 1] - limit) < 0]
+            text += (f"\n🚦 동시 요청 한도: {' → '.join(map(str, path[-8:]))} "
+                     f"(최소 {concurrency['min']} · 최대 {concurrency['max']} · 감소 {concurrency['decreases']}회)")
+        if snapshot["json_repairs"] or snapshot["field_requests"]:
+            text += (f"\n🔧 JSON 복구 {snapshot['json_repairs']}회 · "
+                     f"누락 필드 재요청 {snapshot['field_requests']}회")
+        if snapshot["kanji_composed"] or snapshot["dictionary_prefills"]:
+            text += (f"\n📖 로컬로 채운 카드: 사전 {snapshot['dictionary_prefills']}개 · "
+                     f"한자 조합 {snapshot['kanji_composed']}개")
+        if snapshot["hedges"]:
+            text += (f"\n🏁 헤지: 요청 {snapshot['requests']}회 중 {snapshot['hedges']}회 "
+                     f"({snapshot['hedges'] / max(1, snapshot['requests']):.0%}), "
+                     f"먼저 응답 {snapshot['hedge_wins']}회 ({snapshot['hedge_wins'] / snapshot['hedges']:.0%})")
+        return text
@@ -0,0 +1,226 @@
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+STATE_PENDING = "pending"
+STATE_GENERATED = "generated"
+STATE_FAILED = "failed"
+STATE_INSERTED = "inserted"
+
+SUMMARY_SUFFIX = ".summary.json"
+
+
+class JobSummary(NamedTuple):
+    """What the resume button needs to know about a journal, without replaying it"""
+    path: str
+    job_id: str
+    created: float
+    remaining: int
+
+
+class JobJournal:
+    """
+    Append-only on-disk record of one generation job.
+
+    The first line holds the job header (input words, deck, note type), every
+    following line is one event: a word's generation result or a set of words
+    that were inserted. Each line is flushed and fsynced, and a torn last line
+    is ignored on load, so a crash loses at most the event being written.
+    The journal is deleted once the job completes; anything left in the jobs
+    directory is an interrupted job that can be resumed.
+
+    Next to each journal a small summary file keeps the number of words not
+    yet inserted, so listing interrupted jobs doesn't read the stored fields.
+    It only changes when words are inserted.
+    """
+
+    def __init__(self, path: str, header: Dict[str, Any]):
+        self.path = path
+        self.header = header
+        self.states: Dict[str, str] = {word: STATE_PENDING for word in header["words"]}
+        self.fields: Dict[str, Dict[str, Any]] = {}
+        self.errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._needs_newline = False
+
+    @property
+    def words(self) -> List[str]:
+        return list(self.header["words"])
+
+    @property
+    def deck(self) -> str:
+        return self.header.get("deck", "")
+
+    @property
+    def note_type(self) -> str:
+        return self.header.get("note_type", "")
+
+    @classmethod
+    def create(cls, jobs_dir: str, words: List[str], deck: str, note_type: str) -> "JobJournal":
+        os.makedirs(jobs_dir, exist_ok=True)
+        job_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+        header = {
+            "type": "job",
+            "id": job_id,
+            "created": time.time(),
+            "deck": deck,
+            "note_type": note_type,
+            "words": list(words),
+        }
+        journal = cls(os.path.join(jobs_dir, f"{job_id}.jsonl"), header)
+        journal._append(header)
+        journal._write_summary()
+        return journal
+
+    @classmethod
+    def load(cls, path: str) -> Optional["JobJournal"]:
+        """Replay a journal file; returns None if the header is unreadable"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().split("\n")
+        except OSError:
+            return None
+
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Torn write from a crash - skip it, the other lines are intact
+                continue
+
+        if not records or records[0].get("type") != "job":
+            return None
+
+        journal = cls(path, records[0])
+        # Make sure the next event starts on its own line after a torn write
+        journal._needs_newline = bool(lines) and lines[-1] != ""
+        for record in records[1:]:
+            journal._apply(record)
+        return journal
+
+    @classmethod
+    def find_interrupted(cls, jobs_dir: str) -> List[JobSummary]:
+        """
+        Unfinished jobs in the jobs directory, newest first. Only the summary
+        files are read; a journal without one is replayed once to create it.
+        """
+        if not os.path.isdir(jobs_dir):
+            return []
+        summaries = []
+        for name in sorted(os.listdir(jobs_dir), reverse=True):
+            if not name.endswith(".jsonl"):
+                continue
+            path = os.path.join(jobs_dir, name)
+            summary = cls.read_summary(path)
+            if summary is None:
+                journal = cls.load(path)
+                if journal is None:
+                    continue
+                try:
+                    journal._write_summary()
+                except OSError:
+                    pass
+                summary = journal.summary()
+            if summary.remaining:
+                summaries.append(summary)
+        return summaries
+
+    @staticmethod
+    def read_summary(path: str) -> Optional[JobSummary]:
+        try:
+            with open(path[:-len(".jsonl")] + SUMMARY_SUFFIX, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return JobSummary(path, str(data["id"]), float(data["created"]), int(data["remaining"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def discard(path: str):
+        """Delete an interrupted job's journal and summary"""
+        for file_path in (path, path[:-len(".jsonl")] + SUMMARY_SUFFIX):
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+    def summary(self) -> JobSummary:
+        return JobSummary(self.path, str(self.header.get("id", "")), float(self.header.get("created", 0)),
+                          self.remaining_count())
+
+    def record_result(self, word: str, fields_data: Optional[Dict[str, Any]], error: Optional[str]):
+        if fields_data and not error:
+            record = {"type": "result", "word": word, "fields_data": fields_data}
+        else:
+            record = {"type": "result", "word": word, "error": error or ""}
+        with self._lock:
+            self._apply(record)
+            self._append(record)
+
+    def record_inserted(self, words: List[str]):
+        if not words:
+            return
+        record = {"type": "inserted", "words": list(words)}
+        with self._lock:
+            self._apply(record)
+            self._append(record)
+            self._write_summary()
+
+    def pending_insertion(self) -> List[Tuple[str, Dict[str, Any], None]]:
+        """Generated but not yet inserted words, as (word, fields_data, None) results"""
+        return [(word, self.fields[word], None) for word in self.header["words"]
+                if self.states.get(word) == STATE_GENERATED]
+
+    def unfinished_words(self) -> List[str]:
+        """Words that still need an API request (never answered, failed or cancelled)"""
+        return [word for word in self.header["words"]
+                if self.states.get(word) in (STATE_PENDING, STATE_FAILED)]
+
+    def remaining_count(self) -> int:
+        return sum(1 for state in self.states.values() if state != STATE_INSERTED)
+
+    def finish(self):
+        """The job is complete - remove the journal"""
+        with self._lock:
+            self.discard(self.path)
+
+    def _apply(self, record: Dict[str, Any]):
+        kind = record.get("type")
+        if kind == "result":
+            word = record.get("word")
+            if word not in self.states:
+                return
+            if isinstance(record.get("fields_data"), dict):
+                self.states[word] = STATE_GENERATED
+                self.fields[word] = record["fields_data"]
+                self.errors.pop(word, None)
+            else:
+                self.states[word] = STATE_FAILED
+                self.errors[word] = record.get("error", "")
+        elif kind == "inserted":
+            for word in record.get("words", []):
+                if word in self.states:
+                    self.states[word] = STATE_INSERTED
+                    self.fields.pop(word, None)
+
+    def _write_summary(self):
+        summary_path = self.path[:-len(".jsonl")] + SUMMARY_SUFFIX
+        tmp_path = summary_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"id": self.header.get("id"), "created": self.header.get("created"),
+                       "remaining": self.remaining_count()}, f)
+        os.replace(tmp_path, summary_path)
+
+    def _append(self, record: Dict[str, Any]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            if self._needs_newline:
+                f.write("\n")
+                self._needs_newline = False
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .instrumentation import logger
+
+DEFAULT_KANJI_FIELD = "한자"
+SEED_FILENAME = "kanji_seed.json"
+
+# CJK unified ideographs (with extension A and compatibility ideographs); 々 is not listed on its own
+KANJI_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+# One "透 (사무칠 투)" entry of the 한자 field, full-width parentheses included
+ENTRY_PATTERN = re.compile(r"([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])\s*[(（]\s*([^()（）]+?)\s*[)）]")
+# Korean meaning and reading, e.g. "사무칠 투" or "다시 갱, 고칠 경"
+READING_PATTERN = re.compile(r"^[가-힣][가-힣\s,·/]{0,30}$")
+
+
+def kanji_of(word: str) -> List[str]:
+    """The distinct kanji of a word in order of appearance"""
+    return list(dict.fromkeys(KANJI_PATTERN.findall(word)))
+
+
+def parse_kanji_field(value: Any) -> List[Tuple[str, str]]:
+    """(kanji, reading) pairs of a 한자 field value such as "透 (사무칠 투), 明 (밝을 명)" """
+    if isinstance(value, list):
+        value = ", ".join(str(item) for item in value)
+    if not isinstance(value, str):
+        return []
+    return [(kanji, " ".join(reading.split())) for kanji, reading in ENTRY_PATTERN.findall(value)
+            if READING_PATTERN.match(reading.strip())]
+
+
+def card_text(word: str, fields_data: Dict[str, Any]) -> str:
+    """The input word and the card's 단어, e.g. for kana input the model wrote in kanji"""
+    return f"{word} {fields_data.get('단어', '')}"
+
+
+def format_kanji_field(entries: List[Tuple[str, str]]) -> str:
+    return ", ".join(f"{kanji} ({reading})" for kanji, reading in entries)
+
+
+class KanjiMemo:
+    """
+    Persistent SQLite store of Korean readings per kanji.
+
+    Every successfully generated 한자 field is split into its per-character
+    entries and counted, so a word whose kanji are all known can have the
+    field assembled locally instead of generated. When the model gave a kanji
+    different readings over time, the most frequent one wins; entries from
+    the optional seed table (kanji_seed.json next to the add-on, mapping
+    kanji to reading) always win.
+
+    After `close()`, which waits for the database operation in progress, the
+    readings already loaded are still composed but nothing new is recorded.
+    """
+
+    def __init__(self, db_path: str, seed_path: Optional[str] = None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._closed = False
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS kanji_readings (
+                   kanji TEXT NOT NULL,
+                   reading TEXT NOT NULL,
+                   count INTEGER NOT NULL,
+                   seeded INTEGER NOT NULL,
+                   updated_at REAL NOT NULL,
+                   PRIMARY KEY (kanji, reading)
+               )"""
+        )
+        self._conn.commit()
+        if seed_path:
+            self.load_seed(seed_path)
+        # Best reading per kanji, kept in memory since every request consults it
+        self._readings: Dict[str, str] = {}
+        self._reload()
+
+    def _reload(self, kanji: Optional[List[str]] = None):
+        """Pick the best reading again for the given kanji (all if None)"""
+        query = "SELECT kanji, reading FROM kanji_readings"
+        params: Tuple = ()
+        if kanji is not None:
+            query += f" WHERE kanji IN ({', '.join('?' * len(kanji))})"
+            params = tuple(kanji)
+        with self._lock:
+            if self._closed:
+                return
+            rows = self._conn.execute(query + " ORDER BY kanji, seeded DESC, count DESC, updated_at DESC",
+                                      params).fetchall()
+        best: Dict[str, str] = {}
+        for k, reading in rows:
+            best.setdefault(k, reading)
+        if kanji is None:
+            self._readings = best
+        else:
+            self._readings = {**self._readings, **best}
+
+    def load_seed(self, seed_path: str):
+        """Import a {kanji: reading} JSON table; missing files are ignored"""
+        if not os.path.exists(seed_path):
+            return
+        try:
+            with open(seed_path, "r", encoding="utf-8") as f:
+                seed = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Failed to read kanji seed table: {str(e)}")
+            return
+        now = time.time()
+        rows = [(kanji, " ".join(reading.split()), now) for kanji, reading in seed.items()
+                if isinstance(reading, str) and KANJI_PATTERN.fullmatch(kanji)
+                and READING_PATTERN.match(reading.strip())]
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute("UPDATE kanji_readings SET seeded = 0 WHERE seeded = 1")
+            self._conn.executemany(
+                """INSERT INTO kanji_readings VALUES (?, ?, 0, 1, ?)
+                   ON CONFLICT (kanji, reading) DO UPDATE SET seeded = 1""",
+                rows
+            )
+            self._conn.commit()
+        logger.debug(f"Loaded {len(rows)} kanji from the seed table")
+
+    def __len__(self) -> int:
+        return len(self._readings)
+
+    def compose(self, word: str) -> Optional[str]:
+        """
+        The 한자 field for the word if all of its kanji are known, else None
+        (also for words without kanji, whose field the model decides on)
+        """
+        kanji = kanji_of(word)
+        if not kanji:
+            return None
+        readings = self._readings
+        if not all(k in readings for k in kanji):
+            return None
+        return format_kanji_field([(k, readings[k]) for k in kanji])
+
+    def learn(self, word: str, value: Any) -> int:
+        """
+        Record the entries of a generated 한자 field; only kanji that occur in
+        word are trusted. Returns how many entries were recorded.
+        """
+        in_word = set(kanji_of(word))
+        entries = [(kanji, reading) for kanji, reading in parse_kanji_field(value) if kanji in in_word]
+        self._record(entries)
+        return len(entries)
+
+    def learn_all(self, cards: Iterable[Tuple[str, Dict[str, Any]]], field: str = DEFAULT_KANJI_FIELD) -> int:
+        """learn() for many (word, fields_data) pairs at once, e.g. the response cache on first use"""
+        entries = []
+        for word, fields_data in cards:
+            if isinstance(fields_data, dict) and field in fields_data:
+                in_word = set(kanji_of(card_text(word, fields_data)))
+                entries.extend((kanji, reading) for kanji, reading in parse_kanji_field(fields_data[field])
+                               if kanji in in_word)
+        self._record(entries)
+        return len(entries)
+
+    def _record(self, entries: List[Tuple[str, str]]):
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.executemany(
+                """INSERT INTO kanji_readings VALUES (?, ?, 1, 0, ?)
+                   ON CONFLICT (kanji, reading) DO UPDATE SET count = count + 1, updated_at = excluded.updated_at""",
+                [(kanji, reading, now) for kanji, reading in entries]
+            )
+            self._conn.commit()
+        kanji = list(dict.fromkeys(kanji for kanji, _ in entries))
+        # Stay below SQLite's limit on query parameters
+        self._reload(kanji if len(kanji) <= 500 else None)
+
+    def clear(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute("DELETE FROM kanji_readings WHERE seeded = 0")
+            self._conn.commit()
+        self._reload()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._conn.close()
+
+
+def open_kanji_memo(config, addon_path: str, cache=None) -> Optional[KanjiMemo]:
+    """
+    Open the kanji store, or None if kanji_memo_enabled is off. A new store is
+    filled from the cards already in the response cache.
+    """
+    if not config.get("kanji_memo_enabled", True):
+        return None
+    db_path = os.path.join(addon_path, "kanji_memo.db")
+    try:
+        is_new = not os.path.exists(db_path)
+        memo = KanjiMemo(db_path, os.path.join(addon_path, SEED_FILENAME))
+        if is_new and cache is not None:
+            learned = memo.learn_all(cache.iter_cards(), config.get("kanji_memo_field", DEFAULT_KANJI_FIELD))
+            logger.info(f"Kanji memo started with {len(memo)} kanji from {learned} cached entries")
+        return memo
+    except Exception as e:
+        logger.warning(f"Failed to open kanji memo: {str(e)}")
+        return None
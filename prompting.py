@@ -0,0 +1,72 @@
+import math
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+SYSTEM_INSTRUCTION = ("You are a helpful assistant that generates Anki card content. "
+                      "Always respond with valid JSON only, no additional text.")
+
+# Stands in for {word} in the shared part of the prompt; the word itself follows in WORD_MESSAGE
+WORD_PLACEHOLDER = "(마지막 사용자 메시지의 단어)"
+WORD_MESSAGE = "📝 입력: {word}"
+
+# Providers that need explicit cache_control breakpoints; others (OpenAI, DeepSeek,
+# Grok, ...) cache a repeated prompt prefix on their own
+CACHE_CONTROL_PREFIXES = ("anthropic/", "google/gemini")
+
+# Completion sizes needed before max_tokens follows them instead of the default
+MIN_BUDGET_SAMPLES = 5
+
+
+def supports_cache_control(model: str) -> bool:
+    return model.startswith(CACHE_CONTROL_PREFIXES)
+
+
+def build_messages(prompt_template: str, user_content: str, model: str,
+                   cache_control: bool = True) -> List[Dict[str, Any]]:
+    """
+    Chat messages for a card request. The prompt template, with {word}
+    replaced by a placeholder, goes into the system message so it is the same
+    for every word and can be served from the provider's prompt cache; the
+    word-specific part is the user message at the end.
+    """
+    instructions = SYSTEM_INSTRUCTION + "\n\n" + prompt_template.format(word=WORD_PLACEHOLDER)
+    if cache_control and supports_cache_control(model):
+        system = {"role": "system", "content": [
+            {"type": "text", "text": instructions, "cache_control": {"type": "ephemeral"}},
+        ]}
+    else:
+        system = {"role": "system", "content": instructions}
+    return [system, {"role": "user", "content": user_content}]
+
+
+class TokenBudget:
+    """
+    max_tokens per card, following the completion sizes seen so far.
+
+    Until MIN_BUDGET_SAMPLES cards were answered the default is used; after
+    that the budget is the largest recent completion times headroom, clamped
+    to [minimum, default * 2]. A response cut off at max_tokens doubles the
+    headroom for the rest of the window, so the budget recovers quickly.
+    """
+
+    def __init__(self, default: int = 2000, headroom: float = 1.5, minimum: int = 256, window: int = 100):
+        self.default = default
+        self.headroom = headroom
+        self.minimum = minimum
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._truncations: Deque[bool] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, completion_tokens_per_card: float, truncated: bool = False):
+        with self._lock:
+            self._samples.append(completion_tokens_per_card)
+            self._truncations.append(truncated)
+
+    def per_card(self) -> int:
+        with self._lock:
+            if len(self._samples) < MIN_BUDGET_SAMPLES:
+                return self.default
+            headroom = self.headroom * (2 if any(self._truncations) else 1)
+            budget = math.ceil(max(self._samples) * headroom)
+        return min(self.default * 2, max(self.minimum, budget))
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .instrumentation import logger
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of generated card fields.
+
+    Entries are keyed by word, model and a hash of the prompt template, so editing
+    the prompt or switching models never serves stale cards. Old entries are
+    evicted by age and the table is trimmed to a maximum number of entries,
+    least recently used first.
+
+    Requests on other threads may still use the cache while the window closes
+    it; after `close()` it behaves like an empty cache that stores nothing.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 5000, max_age_days: float = 30):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   word TEXT NOT NULL,
+                   model TEXT NOT NULL,
+                   prompt_hash TEXT NOT NULL,
+                   fields_json TEXT NOT NULL,
+                   created_at REAL NOT NULL,
+                   last_used REAL NOT NULL
+               )"""
+        )
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def prompt_hash(prompt_template: str) -> str:
+        return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def make_key(cls, word: str, model: str, prompt_template: str) -> str:
+        raw = "\x1f".join([word, model, cls.prompt_hash(prompt_template)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, word: str, model: str, prompt_template: str) -> Optional[Dict[str, Any]]:
+        """Return cached fields for the word, or None on a miss"""
+        key = self.make_key(word, model, prompt_template)
+        now = time.time()
+        with self._lock:
+            if self._closed:
+                return None
+            row = self._conn.execute(
+                "SELECT fields_json, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._is_expired(row[1], now):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        try:
+            return json.loads(row[0])
+        except json.JSONDecodeError:
+            return None
+
+    def contains(self, word: str, model: str, prompt_template: str) -> bool:
+        """Whether a fresh entry exists, without counting a hit or miss"""
+        key = self.make_key(word, model, prompt_template)
+        with self._lock:
+            if self._closed:
+                return False
+            row = self._conn.execute("SELECT created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and not self._is_expired(row[0], time.time())
+
+    def put(self, word: str, model: str, prompt_template: str, fields_data: Dict[str, Any]):
+        """Store generated fields for the word"""
+        key = self.make_key(word, model, prompt_template)
+        now = time.time()
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, word, model, self.prompt_hash(prompt_template),
+                 json.dumps(fields_data, ensure_ascii=False), now, now)
+            )
+            self._conn.commit()
+            self._puts_since_evict += 1
+            evict_now = self._puts_since_evict >= 100
+        if evict_now:
+            self.evict()
+
+    def iter_cards(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(word, fields_data) of every entry, regardless of model and prompt"""
+        with self._lock:
+            rows = [] if self._closed else self._conn.execute("SELECT word, fields_json FROM responses").fetchall()
+        for word, fields_json in rows:
+            try:
+                yield word, json.loads(fields_json)
+            except json.JSONDecodeError:
+                continue
+
+    def evict(self):
+        """Drop expired entries and trim the cache to max_entries (least recently used first)"""
+        with self._lock:
+            if self._closed:
+                return
+            if self.max_age_days and self.max_age_days > 0:
+                cutoff = time.time() - self.max_age_days * 86400
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+            if self.max_entries and self.max_entries > 0:
+                self._conn.execute(
+                    """DELETE FROM responses WHERE key IN (
+                           SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                       )""",
+                    (self.max_entries,)
+                )
+            self._conn.commit()
+            self._puts_since_evict = 0
+
+    def clear(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = 0 if self._closed else self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """Close the database once the operation in progress (if any) is done"""
+        with self._lock:
+            self._closed = True
+            self._conn.close()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        if not self.max_age_days or self.max_age_days <= 0:
+            return False
+        return created_at < now - self.max_age_days * 86400
+
+
+def open_response_cache(config, addon_path: str) -> Optional[ResponseCache]:
+    """Open the cache configured in config.json, or None if caching is disabled"""
+    if not config.get("cache_enabled", True):
+        return None
+    try:
+        return ResponseCache(
+            os.path.join(addon_path, "response_cache.db"),
+            max_entries=int(config.get("cache_max_entries", 5000)),
+            max_age_days=float(config.get("cache_max_age_days", 30)),
+        )
+    except Exception as e:
+        logger.warning(f"Failed to open response cache: {str(e)}")
+        return None
@@ -0,0 +1,124 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, TypeVar
+
+import requests
+
+from .instrumentation import logger
+
+T = TypeVar("T")
+
+# Status codes worth another attempt: timeouts, rate limits and server-side failures
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 520, 522, 524, 529}
+
+
+class TransientAPIError(Exception):
+    """A request failed in a way that may succeed if retried"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RetryBudgetExhausted(Exception):
+    """All attempts failed or the per-word deadline passed"""
+
+    def __init__(self, message: str, attempts: int):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """
+    Seconds to wait according to Retry-After or rate-limit reset headers, if any.
+    X-RateLimit-Reset may be an epoch timestamp in milliseconds or seconds, or a delay.
+    """
+    value = headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    value = headers.get("X-RateLimit-Reset") or headers.get("RateLimit-Reset")
+    if value:
+        try:
+            reset = float(value)
+        except ValueError:
+            return None
+        if reset > 1e12:
+            return max(0.0, reset / 1000 - time.time())
+        if reset > 1e9:
+            return max(0.0, reset - time.time())
+        return max(0.0, reset)
+    return None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, bounded by a maximum number of
+    attempts and an overall deadline per word.
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0,
+                 max_delay: float = 30.0, deadline: float = 120.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max(0.0, max_delay)
+        self.deadline = deadline
+
+    @classmethod
+    def from_config(cls, config) -> "RetryPolicy":
+        return cls(
+            max_attempts=int(config.get("retry_max_attempts", 4)),
+            base_delay=float(config.get("retry_base_delay", 1.0)),
+            max_delay=float(config.get("retry_max_delay", 30.0)),
+            deadline=float(config.get("retry_deadline", 120.0)),
+        )
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before the attempt following `attempt` (1-based)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def run(self, func: Callable[[], T], label: str = "",
+            on_attempt: Optional[Callable[[int], None]] = None,
+            sleep: Callable[[float], None] = time.sleep,
+            cancelled: Optional[Callable[[], bool]] = None) -> T:
+        """
+        Call func until it returns without raising a transient error.
+        on_attempt(n) is called before each attempt. Raises RetryBudgetExhausted
+        when attempts or the deadline run out, or when cancelled() turns true
+        between attempts.
+        """
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            if attempt and cancelled and cancelled():
+                raise RetryBudgetExhausted(f"{label}: cancelled after {attempt} attempts", attempt)
+            attempt += 1
+            if on_attempt:
+                on_attempt(attempt)
+            try:
+                return func()
+            except (TransientAPIError, requests.exceptions.Timeout,
+                    requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                retry_after = getattr(e, "retry_after", None)
+                if attempt >= self.max_attempts:
+                    raise RetryBudgetExhausted(f"{label}: gave up after {attempt} attempts ({e})", attempt)
+
+                delay = self.backoff(attempt, retry_after)
+                elapsed = time.monotonic() - start
+                if self.deadline and elapsed + delay > self.deadline:
+                    raise RetryBudgetExhausted(f"{label}: deadline of {self.deadline:.0f} s reached ({e})", attempt)
+
+                logger.warning(f"{label} attempt {attempt} failed ({e}), retrying in {delay:.1f} s")
+                sleep(delay)
@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .instrumentation import logger
+
+DEFAULT_SPECULATIVE_DELAY_MS = 800
+DEFAULT_SPECULATIVE_MAX_WORDS = 10
+
+
+class SpeculativeGenerator:
+    """
+    Generates cards for words while they are still being typed.
+
+    `update()` starts a request for every newly seen word and cancels the ones
+    for words that were deleted. Requests run one at a time on their own
+    thread, so they never take more than one slot from a real run. `take()`
+    hands finished results and running requests over to a real run.
+
+    Spend is capped: every started word counts against max_words until a
+    run takes it, so words that were typed and deleted again can't cost more
+    than max_words requests per session (see `reset()`).
+    """
+
+    def __init__(self, client, max_words: int = DEFAULT_SPECULATIVE_MAX_WORDS):
+        self.client = client
+        self.max_words = max_words
+        # Started words no run has taken (yet)
+        self.spent = 0
+        self._jobs: Dict[str, Tuple[Future, threading.Event]] = {}
+        self._signature: Optional[Hashable] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-card-creator-speculative")
+        return self._executor
+
+    def update(self, words: List[str], signature: Hashable, use_cache: bool = True):
+        """
+        Make the speculative requests match the words currently typed. signature
+        identifies the settings the results depend on (model, prompt, note
+        type, ...); when it changes, everything generated so far is dropped.
+        """
+        with self._lock:
+            if signature != self._signature:
+                self._cancel_jobs(list(self._jobs))
+                self._jobs.clear()
+                self._signature = signature
+
+            wanted = set(words)
+            self._cancel_jobs([word for word, (future, _) in self._jobs.items()
+                               if word not in wanted and not future.done()])
+
+            for word in words:
+                if word in self._jobs or (use_cache and self.client.is_cached(word)):
+                    continue
+                if self.spent >= self.max_words:
+                    logger.debug(f"Speculative generation paused: {self.spent} words generated ahead "
+                                f"were not used (limit {self.max_words})")
+                    break
+                cancel_event = threading.Event()
+                future = self.executor.submit(self.client.generate_word, word, use_cache, cancel_event)
+                self._jobs[word] = (future, cancel_event)
+                self.spent += 1
+                logger.debug(f"Speculatively generating {word}")
+
+    def take(self, words: List[str], signature: Hashable) -> Tuple[Dict[str, Dict[str, Any]],
+                                                                   Dict[str, Tuple[Future, threading.Event]]]:
+        """
+        Hand the given words over to a real run: returns (finished results,
+        still running requests with their cancel events, which the run sets
+        when it is cancelled). Words whose request hadn't started yet are left
+        to the run; speculation on other words is cancelled.
+        """
+        ready: Dict[str, Dict[str, Any]] = {}
+        running: Dict[str, Tuple[Future, threading.Event]] = {}
+        with self._lock:
+            if signature == self._signature:
+                for word in words:
+                    job = self._jobs.pop(word, None)
+                    if job is None:
+                        continue
+                    future, cancel_event = job
+                    self.spent = max(0, self.spent - 1)
+                    if future.cancel():
+                        continue
+                    if not future.done():
+                        running[word] = (future, cancel_event)
+                    elif future.exception() is None and future.result():
+                        ready[word] = future.result()
+            self._cancel_jobs([word for word, (future, _) in self._jobs.items() if not future.done()])
+        if ready or running:
+            logger.info(f"Speculation: {len(ready)} words ready, {len(running)} still generating")
+        return ready, running
+
+    def reset(self):
+        """Cancel everything, drop the results and restore the spend limit"""
+        with self._lock:
+            self._cancel_jobs(list(self._jobs))
+            self._jobs.clear()
+            self.spent = 0
+
+    def close(self):
+        self.reset()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _cancel_jobs(self, words: List[str]):
+        for word in words:
+            future, cancel_event = self._jobs.pop(word)
+            cancel_event.set()
+            if future.cancel():
+                # Never started, so it cost nothing
+                self.spent = max(0, self.spent - 1)
@@ -0,0 +1,112 @@
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+def iter_sse_data(response) -> Iterator[str]:
+    """
+    Yield the data payload of each server-sent event in a streaming response.
+    Comment lines (": OPENROUTER PROCESSING") and other SSE fields are skipped,
+    multi-line data fields are joined with newlines.
+    Lines are decoded as UTF-8 (the SSE encoding) regardless of the Content-Type
+    charset, which requests would otherwise default to ISO-8859-1 for text/*.
+    """
+    data_lines: List[str] = []
+    for raw_line in response.iter_lines():
+        if raw_line is None:
+            continue
+        if isinstance(raw_line, bytes):
+            raw_line = raw_line.decode("utf-8", errors="replace")
+        line = raw_line.rstrip("\r")
+
+        if not line:
+            # Blank line terminates the event
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+            continue
+
+        if line.startswith(":"):
+            continue
+
+        if line.startswith("data:"):
+            value = line[5:]
+            if value.startswith(" "):
+                value = value[1:]
+            data_lines.append(value)
+
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+class IncrementalJSONParser:
+    """
+    Incrementally parse a streamed JSON object.
+
+    Text chunks are fed as they arrive; every top-level member whose value is
+    complete is returned from feed() right away, so callers can use the first
+    fields of a card before the model has finished writing the rest.
+    Anything before the opening brace (e.g. a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add a chunk of text and return the (key, value) pairs completed by it"""
+        self.buffer += chunk
+        completed: List[Tuple[str, Any]] = []
+        buffer = self.buffer
+
+        while self._pos < len(buffer) and not self.complete:
+            c = buffer[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    if c != "{":
+                        # Top-level array - not something we can stream field by field
+                        self._depth = 0
+                    else:
+                        self._member_start = self._pos + 1
+            elif c in "}]":
+                if self._depth == 1:
+                    completed.extend(self._close_member(self._pos))
+                    self.complete = True
+                self._depth = max(0, self._depth - 1)
+            elif c == "," and self._depth == 1:
+                completed.extend(self._close_member(self._pos))
+                self._member_start = self._pos + 1
+
+            self._pos += 1
+
+        return completed
+
+    def _close_member(self, end: int) -> List[Tuple[str, Any]]:
+        if self._member_start is None:
+            return []
+        member = self.buffer[self._member_start:end].strip()
+        if not member:
+            return []
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return []
+        self.fields.update(parsed)
+        return list(parsed.items())
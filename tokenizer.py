@@ -0,0 +1,90 @@
+import re
+from typing import Iterable, Iterator, List, Set, Union
+
+# Characters that always end a word, besides line breaks: ASCII and full-width
+# commas, the ideographic comma, the katakana middle dot (full and half width)
+# and semicolons
+DELIMITERS = ",，、､・･;；"
+LINE_BREAKS = "\n\r\u2028\u2029"
+
+# The one pattern applied to the input: hard delimiters split it into
+# segments, whitespace inside a segment (including the ideographic space
+# U+3000) is handled by str.split()
+SPLIT_PATTERN = re.compile(f"[{re.escape(DELIMITERS + LINE_BREAKS)}]")
+_BREAK_CHARS = frozenset(DELIMITERS + LINE_BREAKS)
+# Large strings are tokenized in windows of this many characters
+WINDOW_CHARS = 1 << 16
+
+
+def iter_words(source: Union[str, Iterable[str]]) -> Iterator[str]:
+    """
+    Yield the words in source once each, in input order.
+
+    source is a string or an iterable of text chunks (e.g. lines of a file);
+    a word may span chunk boundaries. Words are separated by line breaks and
+    DELIMITERS. Whitespace separates words too, except between ASCII runs, so
+    "猫 犬" gives two words while "take off" and "猫 take off" keep the English
+    phrase together.
+    """
+    seen: Set[str] = set()
+    for text in _complete_segments(source):
+        for segment in SPLIT_PATTERN.split(text):
+            tokens = segment.split()
+            if len(tokens) == 1:
+                # Most segments hold exactly one word
+                word = tokens[0]
+                if word not in seen:
+                    seen.add(word)
+                    yield word
+                continue
+            if not tokens:
+                continue
+            words = (" ".join(tokens),) if segment.isascii() else _group_ascii_runs(tokens)
+            for word in words:
+                if word not in seen:
+                    seen.add(word)
+                    yield word
+
+
+def _group_ascii_runs(tokens: List[str]) -> List[str]:
+    """Keep consecutive ASCII tokens together as one phrase, everything else on its own"""
+    words = []
+    phrase = []
+    for token in tokens:
+        if token.isascii():
+            phrase.append(token)
+            continue
+        if phrase:
+            words.append(" ".join(phrase))
+            phrase = []
+        words.append(token)
+    if phrase:
+        words.append(" ".join(phrase))
+    return words
+
+
+def _complete_segments(source: Union[str, Iterable[str]]) -> Iterator[str]:
+    """Regroup chunks so no piece ends in the middle of a word or phrase"""
+    if isinstance(source, str):
+        if len(source) <= WINDOW_CHARS:
+            yield source
+            return
+        # Split huge pastes into windows so the segment lists stay small
+        whole = source
+        source = (whole[i:i + WINDOW_CHARS] for i in range(0, len(whole), WINDOW_CHARS))
+    carry = ""
+    for chunk in source:
+        text = carry + chunk if carry else chunk
+        if text and text[-1] in _BREAK_CHARS:
+            # Lines of a file end with a line break - nothing to carry over
+            yield text
+            carry = ""
+            continue
+        end = max(text.rfind(c) for c in _BREAK_CHARS) + 1
+        if not end:
+            carry = text
+            continue
+        yield text[:end]
+        carry = text[end:]
+    if carry:
+        yield carry
@@ -1,17 +1,33 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
 from aqt import mw
 from aqt.qt import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QGroupBox, 
                      QTextEdit, QLineEdit, QComboBox, QPushButton, QTimer,
-                     Qt)
-from aqt.utils import showInfo, tooltip
-from .ai_client import AIClient
-from .card_creator import CardCreator
+                     QCheckBox, QProgressBar, QFileDialog, QInputDialog, Qt)
+from aqt.operations import CollectionOp
+from aqt.utils import askUser, showInfo, tooltip
+from .ai_client import AIClient, CANCELLED_MESSAGE
+from .card_creator import CardCreator, DUPLICATE_MESSAGE
+from .response_cache import open_response_cache
+from .kanji_memo import open_kanji_memo
+from .dictionary import open_dictionary
+from .job_journal import JobJournal
+from .instrumentation import logger
+from .speculation import SpeculativeGenerator, DEFAULT_SPECULATIVE_DELAY_MS, DEFAULT_SPECULATIVE_MAX_WORDS
+from .word_import import (FILE_FILTER, FORMAT_CSV, FORMAT_TSV, FORMAT_KINDLE, DEFAULT_IMPORT_CHUNK_SIZE,
+                          detect_format, read_table_header, kindle_languages, iter_file_words, iter_chunks)
 
 class AICardCreatorWindow(QDialog):
     def __init__(self, parent, config):
         super().__init__(parent)
         self.config = config
-        self.ai_client = AIClient(config)
+        cache = open_response_cache(config, config.addon_path)
+        self.ai_client = AIClient(config, cache=cache, kanji_memo=open_kanji_memo(config, config.addon_path, cache))
         self.card_creator = CardCreator(config)
+        self.speculation = SpeculativeGenerator(
+            self.ai_client, int(config.get("speculative_max_words", DEFAULT_SPECULATIVE_MAX_WORDS)))
         
         self.setWindowTitle("AI Card Creator")
         self.setWindowFlags(Qt.WindowType.Window)
@@ -41,8 +57,15 @@ class AICardCreatorWindow(QDialog):
         self.word_input = QTextEdit()
         self.word_input.setPlaceholderText("단어를 입력하세요...\n\n구분자: 줄바꿈, 쉼표(,), 공백, 가운뎃점(・)\n예: 日本, 勉強する\n    透明・曖昧")
         self.word_input.setMaximumHeight(100)
+        self.word_input.textChanged.connect(self._on_input_changed)
         input_layout.addWidget(self.word_input)
         
+        # Speculative generation starts once typing pauses
+        self.speculation_timer = QTimer(self)
+        self.speculation_timer.setSingleShot(True)
+        self.speculation_timer.setInterval(int(self.config.get("speculative_delay_ms", DEFAULT_SPECULATIVE_DELAY_MS)))
+        self.speculation_timer.timeout.connect(self._speculate)
+        
         # Deck and Note Type selection
         selection_layout = QHBoxLayout()
         
@@ -64,18 +87,71 @@ class AICardCreatorWindow(QDialog):
         
         input_layout.addLayout(selection_layout)
         
-        # Create button
+        # Per-run cache bypass
+        self.bypass_cache_check = QCheckBox("캐시 무시 (모든 단어 새로 생성)")
+        self.bypass_cache_check.setToolTip("체크하면 이전에 생성된 결과를 재사용하지 않고 API를 다시 호출합니다")
+        input_layout.addWidget(self.bypass_cache_check)
+        
+        self.speculative_check = QCheckBox("입력하는 동안 미리 생성")
+        self.speculative_check.setChecked(bool(self.config.get("speculative_generation", False)))
+        self.speculative_check.setToolTip("입력을 멈추면 새 단어의 카드를 미리 생성해 두어 '카드 생성'을 누르면 바로 추가됩니다. "
+                                          f"사용되지 않은 단어는 최대 {self.speculation.max_words}개까지만 미리 생성합니다")
+        self.speculative_check.toggled.connect(self._on_speculative_toggled)
+        input_layout.addWidget(self.speculative_check)
+        
+        # Create and cancel buttons
+        run_layout = QHBoxLayout()
+        
         self.create_button = QPushButton("카드 생성")
         self.create_button.clicked.connect(self.create_cards)
         self.create_button.setStyleSheet("QPushButton { padding: 10px; font-weight: bold; font-size: 14px; background-color: #4CAF50; color: white; }")
-        input_layout.addWidget(self.create_button)
+        run_layout.addWidget(self.create_button, 1)
+        
+        self.import_button = QPushButton("파일에서 가져오기...")
+        self.import_button.clicked.connect(self.import_file)
+        self.import_button.setToolTip("텍스트, CSV/TSV 또는 Kindle 단어장(vocab.db) 파일의 단어를 나누어 처리합니다")
+        self.import_button.setStyleSheet("QPushButton { padding: 10px; }")
+        run_layout.addWidget(self.import_button)
+        
+        self.cancel_button = QPushButton("취소")
+        self.cancel_button.clicked.connect(self.cancel_generation)
+        self.cancel_button.setToolTip("남은 요청을 중단합니다. 이미 생성된 카드는 추가됩니다")
+        self.cancel_button.setStyleSheet("QPushButton { padding: 10px; }")
+        self.cancel_button.setEnabled(False)
+        run_layout.addWidget(self.cancel_button)
+        
+        input_layout.addLayout(run_layout)
+        
+        self.resume_button = QPushButton("중단된 작업 이어하기")
+        self.resume_button.clicked.connect(self.resume_job)
+        self.resume_button.setToolTip("이전에 중단된 작업에서 생성된 카드는 바로 추가하고, 남은 단어만 다시 요청합니다")
+        self.resume_button.setVisible(False)
+        
+        self.discard_job_button = QPushButton("버리기")
+        self.discard_job_button.clicked.connect(self.discard_job)
+        self.discard_job_button.setToolTip("중단된 작업의 기록을 삭제합니다. 아직 추가되지 않은 생성 결과도 함께 삭제됩니다")
+        self.discard_job_button.setVisible(False)
+        
+        resume_layout = QHBoxLayout()
+        resume_layout.addWidget(self.resume_button, 1)
+        resume_layout.addWidget(self.discard_job_button)
+        input_layout.addLayout(resume_layout)
         
         # Progress indicator
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setTextVisible(True)
+        self.progress_bar.setVisible(False)
+        input_layout.addWidget(self.progress_bar)
+        
         self.progress_label = QLabel("")
         self.progress_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.progress_label.setStyleSheet("color: #666; font-style: italic;")
         input_layout.addWidget(self.progress_label)
         
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(500)
+        self.progress_timer.timeout.connect(self._update_progress)
+        
         input_group.setLayout(input_layout)
         layout.addWidget(input_group)
         
@@ -94,10 +170,16 @@ class AICardCreatorWindow(QDialog):
         button_layout = QHBoxLayout()
         
         refresh_button = QPushButton("새로고침")
-        refresh_button.clicked.connect(self.refresh_lists)
+        refresh_button.clicked.connect(self.reload_lists)
         refresh_button.setToolTip("덱과 노트 타입 목록을 새로고침합니다")
         button_layout.addWidget(refresh_button)
         
+        self.retry_failed_button = QPushButton("실패한 단어 재시도")
+        self.retry_failed_button.clicked.connect(self.retry_failed_words)
+        self.retry_failed_button.setToolTip("마지막 실행에서 실패한 단어만 다시 생성합니다")
+        self.retry_failed_button.setEnabled(False)
+        button_layout.addWidget(self.retry_failed_button)
+        
         clear_button = QPushButton("결과 지우기")
         clear_button.clicked.connect(self.clear_results)
         button_layout.addWidget(clear_button)
@@ -113,6 +195,18 @@ class AICardCreatorWindow(QDialog):
         self.setLayout(layout)
         self.resize(600, 700)
         
+        self.failed_words = []
+        self.cancel_event = None
+        self.run_progress = None
+        self.current_journal = None
+        # dictionary_path the open dictionary index was compiled from
+        self.dictionary_source = None
+        # Serializes opening and swapping the dictionary between runs and speculation
+        self.dictionary_lock = threading.Lock()
+        # State of a running file import, processed one chunk of words at a time
+        self.import_run = None
+        self._catalog_version = self.card_creator.catalog.version
+        
     def create_cards(self):
         input_text = self.word_input.toPlainText().strip()
         if not input_text:
@@ -120,45 +214,437 @@ class AICardCreatorWindow(QDialog):
             return
             
         # Parse words
+        self.ai_client.start_run()
         words = self.ai_client.parse_words(input_text)
         if not words:
             tooltip("처리할 단어가 없습니다")
             return
             
         # Update config with current selections
-        self.config.set("default_deck", self.deck_combo.currentText())
-        self.config.set("default_note_type", self.note_type_combo.currentText())
+        self.config.update({
+            "default_deck": self.deck_combo.currentText(),
+            "default_note_type": self.note_type_combo.currentText(),
+        })
+        
+        # Drop words that are already in the collection before spending API calls
+        duplicate_index = self.card_creator.load_duplicate_index(self.note_type_combo.currentText())
+        words_to_generate = [word for word in words if not duplicate_index.contains(word)]
+        
+        # Words generated while typing are inserted right away, running ones are awaited
+        self.speculation_timer.stop()
+        ready, speculative = self.speculation.take(words_to_generate, self._speculation_signature())
+        pregenerated = [(word, fields_data, None) for word, fields_data in ready.items()]
+        words_to_generate = [word for word in words_to_generate if word not in ready]
+        
+        journal = self._create_journal(words_to_generate)
+        self._run_job(words, words_to_generate, journal, pregenerated, speculative)
+        
+    def resume_job(self):
+        """Continue the most recent interrupted job from its journal"""
+        summaries = JobJournal.find_interrupted(self._jobs_dir())
+        journal = JobJournal.load(summaries[0].path) if summaries else None
+        if journal is None:
+            self._refresh_resume_button()
+            return
+        
+        # Restore the job's deck and note type
+        if journal.deck:
+            self.deck_combo.setCurrentText(journal.deck)
+        if journal.note_type:
+            self.note_type_combo.setCurrentText(journal.note_type)
+        self.config.update({
+            "default_deck": self.deck_combo.currentText(),
+            "default_note_type": self.note_type_combo.currentText(),
+        })
+        
+        # Generated-but-not-inserted words go straight to insertion, only the rest is requested
+        pregenerated = journal.pending_insertion()
+        pregenerated_words = {word for word, _, _ in pregenerated}
+        duplicate_index = self.card_creator.load_duplicate_index(self.note_type_combo.currentText())
+        unfinished = journal.unfinished_words()
+        words_to_generate = [word for word in unfinished if not duplicate_index.contains(word)]
+        # Sets, since journal.words can be a whole file import
+        resumed_words = pregenerated_words | set(unfinished)
+        words = [word for word in journal.words if word in resumed_words]
+        
+        logger.info(f"Resuming job {journal.header.get('id')}: "
+                    f"{len(pregenerated)} to insert, {len(words_to_generate)} to generate")
+        self.ai_client.start_run()
+        self._run_job(words, words_to_generate, journal, pregenerated)
+    
+    def discard_job(self):
+        """Delete the most recent interrupted job so it is no longer offered"""
+        summaries = JobJournal.find_interrupted(self._jobs_dir())
+        if summaries and askUser(f"중단된 작업({summaries[0].remaining}개 남음)을 삭제할까요?\n"
+                                 "아직 추가되지 않은 생성 결과도 삭제됩니다.", parent=self):
+            JobJournal.discard(summaries[0].path)
+        self._refresh_resume_button()
+        
+    def import_file(self):
+        """Ask for a word list file and process it chunk by chunk"""
+        path, _ = QFileDialog.getOpenFileName(self, "단어 파일 선택", "", FILE_FILTER)
+        if not path:
+            return
+        try:
+            options = self._ask_import_options(path, detect_format(path))
+        except Exception as e:
+            logger.warning(f"Failed to read import file {path}: {str(e)}")
+            self.results_text.setPlainText(f"❌ 파일을 읽을 수 없습니다: {str(e)}")
+            return
+        if options is None:
+            return
+        
+        self.config.update({
+            "default_deck": self.deck_combo.currentText(),
+            "default_note_type": self.note_type_combo.currentText(),
+        })
+        self.card_creator.load_duplicate_index(self.note_type_combo.currentText())
+        self.ai_client.start_run()
+        
+        chunk_size = max(1, int(self.config.get("import_chunk_size", DEFAULT_IMPORT_CHUNK_SIZE)))
+        self.import_run = {
+            "path": path,
+            "chunks": iter_chunks(iter_file_words(path, **options), chunk_size),
+            "chunk": 0,
+            "total": 0, "success": 0, "duplicate": 0, "fail": 0,
+            "failed_words": [],
+        }
+        logger.info(f"Importing words from {path} in chunks of {chunk_size}")
+        self._run_next_import_chunk()
+    
+    def _ask_import_options(self, path, file_format):
+        """Column for CSV/TSV, language for Kindle vocab.db; None if the user cancelled"""
+        if file_format in (FORMAT_CSV, FORMAT_TSV):
+            first_row, has_header, delimiter = read_table_header(path, file_format)
+            if not first_row:
+                return {"file_format": file_format, "delimiter": delimiter}
+            columns = [f"{index + 1}열: {value[:30]}" for index, value in enumerate(first_row)]
+            choice, ok = QInputDialog.getItem(self, "열 선택", "단어가 들어 있는 열:", columns, 0, False)
+            if not ok:
+                return None
+            # The sniffer's guess is only the default - header rows of plain words look like data
+            skip_header = askUser(f"첫 줄({', '.join(first_row)[:60]})은 제목 행입니까?\n"
+                                  f"제목 행이면 단어로 가져오지 않습니다.", parent=self, defaultno=not has_header)
+            return {"file_format": file_format, "column": columns.index(choice),
+                    "delimiter": delimiter, "skip_header": skip_header}
+        if file_format == FORMAT_KINDLE:
+            languages = kindle_languages(path)
+            if len(languages) <= 1:
+                return {"file_format": file_format}
+            labels = [f"{lang or '?'} ({count}개)" for lang, count in languages]
+            default = next((i for i, (lang, _) in enumerate(languages) if lang == "ja"), 0)
+            choice, ok = QInputDialog.getItem(self, "언어 선택", "가져올 단어장 언어:", labels, default, False)
+            if not ok:
+                return None
+            return {"file_format": file_format, "language": languages[labels.index(choice)][0]}
+        return {"file_format": file_format}
+    
+    def _run_next_import_chunk(self):
+        """Read the next chunk of the import file and run it through generation and insertion"""
+        run = self.import_run
+        if run is None:
+            return
+        try:
+            words = next(run["chunks"], None)
+        except Exception as e:
+            logger.warning(f"Failed to read import file {run['path']}: {str(e)}")
+            self._finish_import(f"파일을 읽는 중 오류가 발생했습니다: {str(e)}")
+            return
+        if not words:
+            self._finish_import()
+            return
+        
+        run["chunk"] += 1
+        duplicate_index = self.card_creator.duplicate_index
+        words_to_generate = [word for word in words if not duplicate_index.contains(word)]
+        journal = self._create_journal(words_to_generate)
+        self._run_job(words, words_to_generate, journal)
+        self.results_text.setPlainText(
+            f"📂 {os.path.basename(run['path'])} - {run['chunk']}번째 묶음 ({len(words)}개 단어)\n"
+            f"누적: {run['total']}개 중 {run['success']}개 추가, 중복 {run['duplicate']}개, 실패 {run['fail']}개\n"
+        )
+    
+    def _on_import_chunk_done(self, total, success, duplicate, fail, results):
+        run = self.import_run
+        run["total"] += total
+        run["success"] += success
+        run["duplicate"] += duplicate
+        run["fail"] += fail
+        run["failed_words"].extend(word for word, is_success, message, _ in results
+                                   if not is_success and DUPLICATE_MESSAGE not in message)
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self._finish_import("사용자가 가져오기를 취소했습니다")
+            return
+        # Continue from the event loop so long runs of duplicate-only chunks don't recurse
+        QTimer.singleShot(0, self._run_next_import_chunk)
+    
+    def _finish_import(self, stopped_reason=None):
+        run = self.import_run
+        self.import_run = None
+        self._stop_progress()
+        self.set_ui_enabled(True)
+        self.progress_label.setText("")
+        
+        result_text = f"📂 {os.path.basename(run['path'])} 가져오기 "
+        result_text += f"중단: {stopped_reason}\n" if stopped_reason else "완료\n"
+        result_text += (f"📊 처리 결과: {run['total']}개 중 {run['success']}개 추가 완료, "
+                        f"중복 {run['duplicate']}개, 실패 {run['fail']}개 ({run['chunk']}개 묶음)\n")
+        metrics = self.ai_client.metrics
+        metrics.finish()
+        summary = metrics.format_summary()
+        logger.info(summary.replace("\n", " | "))
+        result_text += summary + "\n"
+        
+        self.failed_words = run["failed_words"]
+        self.retry_failed_button.setEnabled(bool(self.failed_words))
+        if self.failed_words:
+            result_text += f"\n❌ 실패한 단어 ({len(self.failed_words)}개):\n"
+            result_text += ", ".join(self.failed_words[:200])
+            if len(self.failed_words) > 200:
+                result_text += f" 외 {len(self.failed_words) - 200}개"
+            result_text += "\n"
+        self.results_text.setPlainText(result_text)
+        
+    def _run_job(self, words, words_to_generate, journal, pregenerated=None, speculative=None):
+        """
+        Generate fields for words_to_generate and insert them together with pregenerated results.
+        speculative maps words of words_to_generate to running speculative requests and their
+        cancel events; they are adopted as they finish instead of sending new requests, while
+        the other words are generated alongside.
+        """
+        pregenerated = pregenerated or []
+        speculative = speculative or {}
         
         # Disable UI during processing
         self.set_ui_enabled(False)
-        self.progress_label.setText(f"{len(words)}개 단어 처리 중...")
+        self.progress_label.setText(f"{len(words_to_generate)}개 단어 처리 중...")
         self.results_text.clear()
+        self._start_progress(len(words_to_generate))
         
         # Store words for background processing
-        self.words_to_process = words
+        self.words_to_process = words_to_generate
+        self.current_journal = journal
+        
+        if not words_to_generate:
+            self._on_cards_processing_complete(self._merge_skipped_duplicates(words, pregenerated))
+            return
+        
+        self._refresh_cache()
+        use_cache = not self.bypass_cache_check.isChecked()
+        
+        self.cancel_event = threading.Event()
+        cancel_event = self.cancel_event
+        self.cancel_button.setEnabled(True)
         
         # Use Anki's task manager for background processing
         def task():
-            return self._process_cards_background(words)
+            self._refresh_dictionary()
+            adopted = []
+            collector = threading.Thread(
+                target=lambda: adopted.extend(self._collect_speculative(speculative, cancel_event, journal)),
+                name="ai-card-creator-adopt", daemon=True)
+            collector.start()
+            fresh = [word for word in words_to_generate if word not in speculative]
+            results = self._process_cards_background(fresh, use_cache, cancel_event, journal) if fresh else []
+            collector.join()
+            # Speculative requests that failed or were cancelled are generated normally
+            done = {word for word, _, _ in adopted}
+            fallback = [word for word in speculative if word not in done]
+            if fallback:
+                results += self._process_cards_background(fallback, use_cache, cancel_event, journal)
+            return adopted + results
         
         def on_done(future):
             try:
                 result = future.result()
-                self._on_cards_processing_complete(result)
+                self._on_cards_processing_complete(self._merge_skipped_duplicates(words, pregenerated + result))
             except Exception as e:
                 self._on_creation_failed(str(e))
         
         mw.taskman.run_in_background(task, on_done)
         
-    def _process_cards_background(self, words):
+    def _collect_speculative(self, speculative, cancel_event, journal):
+        """
+        Background thread: adopt the speculative requests a run took over as each
+        one finishes. Returns (word, fields_data, None) for those that produced a
+        card; the rest are generated normally. Cancelling the run cancels them too.
+        """
+        adopted = []
+        words = {future: word for word, (future, _) in speculative.items()}
+        pending = set(words)
+        while pending:
+            if cancel_event.is_set():
+                for _, speculative_cancel in speculative.values():
+                    speculative_cancel.set()
+                break
+            finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future.cancelled() or future.exception() is not None or not future.result():
+                    continue
+                word, fields_data = words[future], future.result()
+                adopted.append((word, fields_data, None))
+                if journal is not None:
+                    try:
+                        journal.record_result(word, fields_data, None)
+                    except OSError as e:
+                        logger.warning(f"Failed to journal '{word}': {str(e)}")
+                mw.taskman.run_on_main(lambda word=word, fields_data=fields_data:
+                                       self._on_word_generated(word, fields_data, None))
+        return adopted
+    
+    def _on_input_changed(self):
+        if self.speculative_check.isChecked() and self.run_progress is None:
+            self.speculation_timer.start()
+    
+    def _on_speculative_toggled(self, checked):
+        self.config.set("speculative_generation", checked)
+        if checked:
+            self.speculation_timer.start()
+        else:
+            self.speculation_timer.stop()
+            self.speculation.reset()
+    
+    def _speculation_signature(self):
+        """Settings a speculative result depends on; a change discards earlier results"""
+        return (self.config.get("model"), self.config.get("prompt_template"),
+                self.note_type_combo.currentText(), not self.bypass_cache_check.isChecked())
+    
+    def _speculate(self):
+        """Typing paused - start generating newly typed words, cancel the deleted ones"""
+        if not self.speculative_check.isChecked() or self.run_progress is not None:
+            return
+        if not self.config.get("api_key"):
+            return
+        if self.dictionary_source != self.config.get("dictionary_path", ""):
+            # Open the dictionary first so speculative cards get the same prefilled fields as a run
+            mw.taskman.run_in_background(self._refresh_dictionary, lambda future: self._speculate())
+            return
+        note_type = self.note_type_combo.currentText()
+        self.config.update({"default_note_type": note_type})
+        duplicate_index = self.card_creator.duplicate_index
+        if duplicate_index is None or duplicate_index.note_type_name != note_type:
+            duplicate_index = self.card_creator.load_duplicate_index(note_type)
+        words = [word for word in self.ai_client.parse_words(self.word_input.toPlainText())
+                 if not duplicate_index.contains(word)]
+        self.speculation.update(words, self._speculation_signature(), not self.bypass_cache_check.isChecked())
+    
+    def _jobs_dir(self):
+        return os.path.join(self.config.addon_path, "jobs")
+    
+    def _create_journal(self, words):
+        if not words:
+            return None
+        try:
+            return JobJournal.create(self._jobs_dir(), words, self.deck_combo.currentText(),
+                                     self.note_type_combo.currentText())
+        except OSError as e:
+            logger.warning(f"Failed to create job journal: {str(e)}")
+            return None
+    
+    def _finish_journal(self, insert_outcome):
+        """Record inserted words; delete the journal unless the run was cancelled"""
+        journal = self.current_journal
+        self.current_journal = None
+        if journal is None:
+            return
+        try:
+            # Words whose insertion failed keep their generated fields for a resume
+            journal.record_inserted([word for word, (is_success, message) in insert_outcome.items()
+                                     if is_success or DUPLICATE_MESSAGE in message])
+            cancelled = self.cancel_event is not None and self.cancel_event.is_set()
+            if not cancelled and not journal.pending_insertion():
+                journal.finish()
+        except OSError as e:
+            logger.warning(f"Failed to update job journal: {str(e)}")
+    
+    def _refresh_resume_button(self):
+        summaries = JobJournal.find_interrupted(self._jobs_dir())
+        if summaries:
+            self.resume_button.setText(f"중단된 작업 이어하기 ({summaries[0].remaining}개 남음)")
+        self.resume_button.setVisible(bool(summaries))
+        self.discard_job_button.setVisible(bool(summaries))
+        
+    def _merge_skipped_duplicates(self, words, results):
+        """Put words skipped by the duplicate index back into the results, in input order"""
+        generated = {word: (word, fields_data, error) for word, fields_data, error in results}
+        return [generated.get(word, (word, None, DUPLICATE_MESSAGE)) for word in words]
+    
+    def _refresh_cache(self):
+        """Apply the current cache and kanji memo settings before a run"""
+        # Unset before closing: speculative requests may still be running, and the
+        # stores turn into no-ops once closed instead of failing them
+        kanji_memo = self.ai_client.kanji_memo
+        if not self.config.get("kanji_memo_enabled", True):
+            self.ai_client.kanji_memo = None
+            if kanji_memo:
+                kanji_memo.close()
+        elif kanji_memo is None:
+            self.ai_client.kanji_memo = open_kanji_memo(self.config, self.config.addon_path, self.ai_client.cache)
+        
+        cache = self.ai_client.cache
+        if not self.config.get("cache_enabled", True):
+            self.ai_client.cache = None
+            if cache:
+                cache.close()
+            return
+        if cache is None:
+            self.ai_client.cache = open_response_cache(self.config, self.config.addon_path)
+        else:
+            cache.max_entries = int(self.config.get("cache_max_entries", 5000))
+            cache.max_age_days = float(self.config.get("cache_max_age_days", 30))
+        cache = self.ai_client.cache
+        if cache:
+            cache.reset_counters()
+    
+    def _refresh_dictionary(self):
+        """
+        Background thread: open the configured dictionary, compiling its index on
+        first use. A replaced index is closed before the file is recompiled;
+        close() waits for lookups other threads (e.g. speculation) are still doing on it.
+        """
+        with self.dictionary_lock:
+            source = self.config.get("dictionary_path", "")
+            dictionary = self.ai_client.dictionary
+            if dictionary is not None:
+                if source == self.dictionary_source and os.path.exists(source) and dictionary.is_current(source):
+                    return
+                self.ai_client.dictionary = None
+                dictionary.close()
+            self.dictionary_source = source
+            self.ai_client.dictionary = open_dictionary(self.config, self.config.addon_path)
+    
+    def _process_cards_background(self, words, use_cache=True, cancel_event=None, journal=None):
         """Process cards in background - only API calls, no UI operations"""
         try:
-            print(f"AI Card Creator: Starting background processing for {len(words)} words")
+            logger.info(f"Starting background processing for {len(words)} words")
+            
+            def on_result(index, word, fields_data, error):
+                # Called from the background thread - journal first so a crash keeps the response
+                if journal is not None and error != CANCELLED_MESSAGE:
+                    try:
+                        journal.record_result(word, fields_data, error)
+                    except OSError as e:
+                        logger.warning(f"Failed to journal '{word}': {str(e)}")
+                # Hand UI updates to the main thread
+                mw.taskman.run_on_main(lambda: self._on_word_generated(word, fields_data, error))
+            
+            def on_field(index, word, key, value):
+                # Streaming mode: preview the first fields while the rest is still generating
+                if key not in ("요미가나", "의미"):
+                    return
+                if isinstance(value, list):
+                    preview = ", ".join(str(item) for item in value)
+                else:
+                    preview = str(value)
+                preview = preview.replace("\n", " ")[:60]
+                if self.run_progress is not None:
+                    self.run_progress["preview"] = f"{word} - {key}: {preview}"
             
             # Generate fields for all words
-            results = self.ai_client.generate_cards_for_words(words)
+            results = self.ai_client.generate_cards_for_words(words, on_result=on_result, on_field=on_field,
+                                                              use_cache=use_cache, cancel_event=cancel_event)
             
-            print(f"AI Card Creator: Generated fields for {len(results)} words")
+            logger.debug(f"Generated fields for {len(results)} words")
             
             # Collect results without creating cards (card creation must happen in main thread)
             detailed_results = []
@@ -172,60 +658,196 @@ class AICardCreatorWindow(QDialog):
             return detailed_results
                 
         except Exception as e:
-            print(f"AI Card Creator: Background processing error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Background processing error: {str(e)}")
             raise e
     
+    def _start_progress(self, total):
+        self.run_progress = {"total": total, "done": 0, "failed": 0,
+                             "started": time.monotonic(), "preview": ""}
+        self.progress_bar.setRange(0, max(1, total))
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.progress_timer.start()
+    
+    def _stop_progress(self):
+        self.progress_timer.stop()
+        self.progress_bar.setVisible(False)
+        self.cancel_button.setEnabled(False)
+        self.cancel_event = None
+        self.run_progress = None
+        self.current_journal = None
+        self._refresh_resume_button()
+    
+    def _on_word_generated(self, word, fields_data, error):
+        """A single word finished generating - count it and show its line right away"""
+        progress = self.run_progress
+        if progress is None:
+            return
+        if error:
+            progress["failed"] += 1
+            line = f"❌ {word} - {error}"
+        else:
+            progress["done"] += 1
+            line = f"📝 {word}"
+            if isinstance(fields_data, dict) and "요미가나" in fields_data:
+                line += f" ({fields_data['요미가나']})"
+            line += " - 생성 완료"
+        self.results_text.append(line)
+        self._update_progress()
+    
+    def _update_progress(self):
+        """Refresh the progress bar, counts, throughput and ETA"""
+        progress = self.run_progress
+        if progress is None:
+            return
+        total = progress["total"]
+        finished = progress["done"] + progress["failed"]
+        elapsed = time.monotonic() - progress["started"]
+        rate = finished / elapsed if elapsed > 0 else 0.0
+        
+        self.progress_bar.setValue(finished)
+        self.progress_bar.setFormat(f"{finished}/{total}")
+        
+        in_flight = str(self.ai_client.in_flight)
+        limit = self.ai_client.metrics.concurrency_limit
+        if limit is not None:
+            in_flight += f" (한도 {limit})"
+        text = (f"완료 {progress['done']} · 실패 {progress['failed']} · "
+                f"진행 중 {in_flight} · {rate:.2f} 단어/초")
+        if rate > 0 and finished < total:
+            text += f" · 남은 시간 약 {self._format_duration((total - finished) / rate)}"
+        run = self.import_run
+        if run is not None:
+            text = f"{run['chunk']}번째 묶음 · 누적 추가 {run['success']}개 · " + text
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            text = "취소 중... " + text
+        elif progress["preview"]:
+            text += f"\n{progress['preview']}"
+        self.progress_label.setText(text)
+    
+    @staticmethod
+    def _format_duration(seconds):
+        seconds = int(seconds + 0.5)
+        if seconds < 60:
+            return f"{seconds}초"
+        minutes, seconds = divmod(seconds, 60)
+        if minutes < 60:
+            return f"{minutes}분 {seconds}초"
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}시간 {minutes}분"
+    
+    def cancel_generation(self):
+        """Stop outstanding requests; words generated so far are still added"""
+        if self.cancel_event is None:
+            return
+        self.cancel_event.set()
+        self.cancel_button.setEnabled(False)
+        self._update_progress()
+    
     def _on_cards_processing_complete(self, results):
-        """Called when background processing is complete - create cards in main thread"""
+        """Called when background processing is complete - insert all notes in one collection op"""
         try:
-            print(f"AI Card Creator: Processing complete, creating cards for {len(results)} words")
+            logger.debug(f"Processing complete, creating cards for {len(results)} words")
             
-            # Process each result and create cards
-            success_count = 0
-            duplicate_count = 0
-            fail_count = 0
-            detailed_results = []
+            self.progress_timer.stop()
+            self.cancel_button.setEnabled(False)
             
-            for word, fields_data, error in results:
-                if error:
-                    fail_count += 1
-                    detailed_results.append((word, False, error, None))
-                elif fields_data:
-                    # Try to create the card in main thread
-                    success, message = self.card_creator.create_card(fields_data, word)
-                    if success:
-                        success_count += 1
-                        detailed_results.append((word, True, message, fields_data))
-                    elif "이미 존재" in message:
-                        duplicate_count += 1
-                        detailed_results.append((word, False, message, None))
-                    else:
-                        fail_count += 1
-                        detailed_results.append((word, False, message, None))
-                else:
-                    fail_count += 1
-                    detailed_results.append((word, False, "AI가 올바른 형식의 응답을 생성하지 못했습니다", None))
+            items = [(word, fields_data) for word, fields_data, error in results if not error and fields_data]
+            if not items:
+                self._finish_journal({})
+                self._summarize_results(results, {})
+                return
+            
+            self.progress_label.setText(f"{len(items)}개 카드 추가 중...")
+            insert_outcome = {}
+            
+            metrics = self.ai_client.metrics
+            
+            def op(col):
+                changes, outcome = self.card_creator.add_notes_bulk(col, items, metrics)
+                insert_outcome.update(outcome)
+                return changes
+            
+            def on_failure(exc):
+                logger.error(f"Bulk insert failed: {str(exc)}")
+                self._on_creation_failed(str(exc))
+            
+            # Runs in the background; Anki refreshes the main window once when it finishes
+            def on_success(changes):
+                self._finish_journal(insert_outcome)
+                self._summarize_results(results, insert_outcome)
             
-            # Update UI
-            self._on_cards_created(len(results), success_count, duplicate_count, fail_count, detailed_results)
+            CollectionOp(parent=self, op=op).success(on_success).failure(on_failure).run_in_background()
             
         except Exception as e:
-            print(f"AI Card Creator: Error in main thread processing: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error in main thread processing: {str(e)}")
             self._on_creation_failed(str(e))
+    
+    def _summarize_results(self, results, insert_outcome):
+        """Count generation and insertion outcomes in input order and show them"""
+        success_count = 0
+        duplicate_count = 0
+        fail_count = 0
+        detailed_results = []
+        
+        for word, fields_data, error in results:
+            if error == DUPLICATE_MESSAGE:
+                duplicate_count += 1
+                detailed_results.append((word, False, error, None))
+            elif error:
+                fail_count += 1
+                detailed_results.append((word, False, error, None))
+            elif fields_data:
+                success, message = insert_outcome.get(word, (False, "카드가 추가되지 않았습니다"))
+                if success:
+                    success_count += 1
+                    detailed_results.append((word, True, message, fields_data))
+                elif DUPLICATE_MESSAGE in message:
+                    duplicate_count += 1
+                    detailed_results.append((word, False, message, None))
+                else:
+                    fail_count += 1
+                    detailed_results.append((word, False, message, None))
+            else:
+                fail_count += 1
+                detailed_results.append((word, False, "AI가 올바른 형식의 응답을 생성하지 못했습니다", None))
+        
+        # Update UI
+        if self.import_run is not None:
+            self._on_import_chunk_done(len(results), success_count, duplicate_count, fail_count, detailed_results)
+            return
+        self._on_cards_created(len(results), success_count, duplicate_count, fail_count, detailed_results)
             
     def _on_cards_created(self, total, success, duplicate, fail, results):
+        self._stop_progress()
         self.set_ui_enabled(True)
         self.progress_label.setText("")
         
         # Build results text
-        result_text = f"📊 처리 결과: {total}개 중 {success}개 추가 완료\n\n"
+        result_text = f"📊 처리 결과: {total}개 중 {success}개 추가 완료\n"
+        cancelled = sum(1 for _, _, message, _ in results if message == CANCELLED_MESSAGE)
+        if cancelled:
+            result_text += f"⏹ 취소: {cancelled}개 단어는 생성되지 않았습니다\n"
+        cache = self.ai_client.cache
+        if cache and (cache.hits or cache.misses):
+            result_text += f"💾 캐시: {cache.hits}개 재사용, {cache.misses}개 새로 생성\n"
+        connections = self.ai_client.connection_stats.snapshot()
+        if connections["requests"]:
+            result_text += (f"🔌 연결: 요청 {connections['requests']}회, 새 연결 {connections['connections']}개 "
+                            f"(연결 {connections['connect_time'] * 1000:.0f} ms, TLS {connections['tls_time'] * 1000:.0f} ms)\n")
+        metrics = self.ai_client.metrics
+        metrics.finish()
+        summary = metrics.format_summary()
+        logger.info(summary.replace("\n", " | "))
+        result_text += summary + "\n"
+        result_text += "\n"
         
         # Summary by status
+        self.failed_words = []
         for word, is_success, message, fields_data in results:
+            attempts = self.ai_client.attempt_counts.get(word, 0)
+            if attempts > 1:
+                message = f"{message} (시도 {attempts}회)"
             if is_success:
                 result_text += f"✅ {word}"
                 if fields_data and "요미가나" in fields_data:
@@ -233,10 +855,12 @@ class AICardCreatorWindow(QDialog):
                 result_text += f" - {message}\n"
                 if fields_data and "의미" in fields_data:
                     result_text += f"   → {fields_data['의미']}\n"
-            elif "이미 존재" in message:
+            elif DUPLICATE_MESSAGE in message:
                 result_text += f"⚠️ {word} - {message}\n"
             else:
+                self.failed_words.append(word)
                 result_text += f"❌ {word} - {message}\n"
+        self.retry_failed_button.setEnabled(bool(self.failed_words))
         
         # Add detailed content for successfully added cards
         if success > 0:
@@ -265,14 +889,27 @@ class AICardCreatorWindow(QDialog):
             self.word_input.clear()
             self.word_input.setFocus()
             
+    def retry_failed_words(self):
+        """Run the generation again for the words that failed in the last run only"""
+        if not self.failed_words:
+            return
+        self.word_input.setPlainText("\n".join(self.failed_words))
+        self.create_cards()
+        
     def _on_creation_failed(self, error):
+        self.import_run = None
+        self._stop_progress()
         self.set_ui_enabled(True)
         self.progress_label.setText("")
         self.results_text.setPlainText(f"❌ 오류 발생: {error}")
         
     def set_ui_enabled(self, enabled):
         self.word_input.setEnabled(enabled)
+        self.bypass_cache_check.setEnabled(enabled)
         self.create_button.setEnabled(enabled)
+        self.import_button.setEnabled(enabled)
+        self.retry_failed_button.setEnabled(enabled and bool(self.failed_words))
+        self.resume_button.setEnabled(enabled)
         self.deck_combo.setEnabled(enabled)
         self.note_type_combo.setEnabled(enabled)
         
@@ -296,12 +933,19 @@ class AICardCreatorWindow(QDialog):
             
     def refresh_lists(self):
         """Refresh deck and note type lists"""
+        self.card_creator.clear_mapping_plans()
         self.refresh_decks()
         self.refresh_note_types()
+        self._catalog_version = self.card_creator.catalog.version
         # Show tooltip only if called manually (not during showEvent)
         if self.sender() and hasattr(self.sender(), 'text'):
             tooltip("목록이 새로고침되었습니다")
         
+    def reload_lists(self):
+        """Re-read decks and note types from the collection, then refresh the lists"""
+        self.card_creator.catalog.invalidate()
+        self.refresh_lists()
+        
     def clear_results(self):
         self.results_text.clear()
         
@@ -312,11 +956,19 @@ class AICardCreatorWindow(QDialog):
     def showEvent(self, event):
         """Refresh lists when window is shown"""
         super().showEvent(event)
-        # Refresh deck and note type lists in case they changed
-        self.refresh_lists()
+        # Refresh deck and note type lists only if Anki reported a change since the last refresh
+        if self._catalog_version != self.card_creator.catalog.version:
+            self.refresh_lists()
+        # Offer to resume a job that was interrupted by a crash or a cancel
+        if self.current_journal is None:
+            self._refresh_resume_button()
+        # Open the API connection now so the first request skips connect/TLS setup
+        mw.taskman.run_in_background(self.ai_client.warm_up)
         
     def closeEvent(self, event):
         # Save window position
         pos = self.pos()
         self.config.set("window_position", {"x": pos.x(), "y": pos.y()})
+        self.speculation_timer.stop()
+        self.speculation.reset()
         event.accept()
\ No newline at end of file
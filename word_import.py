@@ -0,0 +1,132 @@
+import csv
+import os
+import pathlib
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .tokenizer import iter_words
+
+FORMAT_TEXT = "text"
+FORMAT_CSV = "csv"
+FORMAT_TSV = "tsv"
+FORMAT_KINDLE = "kindle"
+
+DEFAULT_IMPORT_CHUNK_SIZE = 200
+
+# Filter string for the file dialog
+FILE_FILTER = "단어 목록 (*.txt *.csv *.tsv *.db *.sqlite);;텍스트 (*.txt);;CSV/TSV (*.csv *.tsv);;Kindle 단어장 (*.db *.sqlite)"
+
+_EXTENSIONS = {
+    ".txt": FORMAT_TEXT,
+    ".csv": FORMAT_CSV,
+    ".tsv": FORMAT_TSV,
+    ".tab": FORMAT_TSV,
+    ".db": FORMAT_KINDLE,
+    ".sqlite": FORMAT_KINDLE,
+}
+
+
+def detect_format(path: str) -> str:
+    """Guess the import format from the extension; unknown files are read as text"""
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower(), FORMAT_TEXT)
+
+
+def read_table_header(path: str, file_format: str) -> Tuple[List[str], bool, str]:
+    """
+    First row of a CSV/TSV file, whether it looks like a header, and the delimiter.
+    Only the first few kilobytes are read.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        sample = f.read(16384)
+    delimiter = "\t" if file_format == FORMAT_TSV else ","
+    sniffer = csv.Sniffer()
+    try:
+        delimiter = sniffer.sniff(sample, delimiters=",;\t").delimiter
+    except csv.Error:
+        pass
+    try:
+        has_header = sniffer.has_header(sample)
+    except csv.Error:
+        has_header = False
+    first_row = next(csv.reader(sample.splitlines(), delimiter=delimiter), [])
+    return first_row, has_header, delimiter
+
+
+def kindle_languages(path: str) -> List[Tuple[str, int]]:
+    """(language code, word count) pairs in a Kindle vocab.db, most frequent first"""
+    with _open_readonly(path) as db:
+        rows = db.execute("SELECT lang, COUNT(*) FROM WORDS GROUP BY lang ORDER BY COUNT(*) DESC").fetchall()
+    return [(lang or "", count) for lang, count in rows]
+
+
+def iter_text_entries(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8-sig") as f:
+        yield from f
+
+
+def iter_table_entries(path: str, column: int, delimiter: str, skip_header: bool) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        if skip_header:
+            next(reader, None)
+        for row in reader:
+            if column < len(row) and row[column].strip():
+                # One cell may hold several words, keep them apart from the next cell
+                yield row[column] + "\n"
+
+
+def iter_kindle_entries(path: str, language: Optional[str] = None, use_stem: bool = True) -> Iterator[str]:
+    """
+    Looked-up words from a Kindle vocab.db (table WORDS), oldest first.
+    The stem (dictionary form) is used when present, otherwise the word as it appeared.
+    """
+    column = "COALESCE(NULLIF(stem, ''), word)" if use_stem else "word"
+    query = f"SELECT {column} FROM WORDS"
+    params: Tuple = ()
+    if language:
+        query += " WHERE lang = ?"
+        params = (language,)
+    query += " ORDER BY timestamp"
+    with _open_readonly(path) as db:
+        # The cursor fetches rows lazily, so only one chunk of words is in memory at a time
+        for (word,) in db.execute(query, params):
+            if word:
+                yield f"{word}\n"
+
+
+def iter_file_words(path: str, file_format: str, column: int = 0, delimiter: str = ",",
+                    skip_header: bool = False, language: Optional[str] = None) -> Iterator[str]:
+    """
+    Words of an import file, normalized and deduplicated like parse_words input.
+    The file is read lazily; nothing is opened until the first word is requested.
+    """
+    if file_format in (FORMAT_CSV, FORMAT_TSV):
+        entries = iter_table_entries(path, column, delimiter, skip_header)
+    elif file_format == FORMAT_KINDLE:
+        entries = iter_kindle_entries(path, language)
+    else:
+        entries = iter_text_entries(path)
+    return iter_words(entries)
+
+
+def iter_chunks(words: Iterable[str], size: int) -> Iterator[List[str]]:
+    """Group words into lists of at most size words"""
+    chunk: List[str] = []
+    for word in words:
+        chunk.append(word)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@contextmanager
+def _open_readonly(path: str) -> Iterator[sqlite3.Connection]:
+    """Read-only sqlite3 connection that is closed on exit (sqlite3's own context manager only commits)"""
+    db = sqlite3.connect(f"{pathlib.Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        yield db
+    finally:
+        db.close()